@@ -0,0 +1,248 @@
+"""
+Firma DKIM (RFC 6376) en proceso, por dominio del remitente.
+
+- Claves PEM (RSA -> rsa-sha256, Ed25519 -> ed25519-sha256, RFC 8463)
+  cargadas y parseadas una vez al arrancar: DKIM_KEYS = {"dominio":
+  "selector:/ruta/clave.pem"} (sin "selector:" se usa DKIM_SELECTOR).
+- c=relaxed/relaxed. DkimSigner.template() canonicaliza una vez el cuerpo
+  (bh=) y las cabeceras constantes de un mensaje serializado; MessageFactory
+  lo guarda con el prototipo, así que con cuerpos idénticos por mensaje
+  solo se canonicaliza la línea To y se calcula la firma de cabeceras.
+- verify() comprueba firmas contra claves locales (bench/smtp_sink.py --dkim),
+  sin DNS.
+
+Requiere `cryptography` solo si hay DKIM_KEYS (HAVE_CRYPTO).
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import re
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, padding, rsa
+    HAVE_CRYPTO = True
+except ImportError:  # pragma: no cover - depende del entorno
+    HAVE_CRYPTO = False
+
+from . import metrics
+
+RSA_SHA256 = "rsa-sha256"
+ED25519_SHA256 = "ed25519-sha256"
+
+# Firmadas si están presentes, en este orden (To va aparte: es la que cambia por mensaje)
+DEFAULT_HEADERS = ("from", "to", "subject", "reply-to", "date", "message-id", "mime-version",
+                   "content-type", "list-unsubscribe", "list-unsubscribe-post")
+
+signed_total = metrics.registry.counter(
+    "smtp_dkim_signed_total", "Mensajes firmados con DKIM por dominio", ("domain",))
+
+_WSP = re.compile(rb"[ \t]+")
+_TRAILING_WSP = re.compile(rb"[ \t]+\r\n")
+_B_TAG = re.compile(rb"(^|;)(\s*b\s*=)[^;]*")
+
+
+class DkimKey:
+    """Clave privada de un dominio, ya parseada."""
+
+    __slots__ = ("domain", "selector", "private", "algorithm")
+
+    def __init__(self, domain: str, selector: str, private) -> None:
+        self.domain = domain
+        self.selector = selector
+        self.private = private
+        self.algorithm = ED25519_SHA256 if isinstance(private, ed25519.Ed25519PrivateKey) else RSA_SHA256
+
+    @classmethod
+    def load(cls, domain: str, spec: str, default_selector: str = "mail") -> "DkimKey":
+        """spec = "selector:/ruta/clave.pem" o "/ruta/clave.pem"."""
+        if not HAVE_CRYPTO:
+            raise RuntimeError("DKIM requiere cryptography (pip install cryptography)")
+        selector, sep, path = spec.partition(":")
+        if not sep or "/" in selector:
+            selector, path = default_selector, spec
+        data = Path(path).expanduser().read_bytes()
+        private = serialization.load_pem_private_key(data, password=None)
+        if not isinstance(private, (rsa.RSAPrivateKey, ed25519.Ed25519PrivateKey)):
+            raise ValueError(f"DKIM {domain}: solo claves RSA o Ed25519 ({path})")
+        return cls(domain.strip().lower(), selector.strip(), private)
+
+    def sign(self, data: bytes) -> bytes:
+        if self.algorithm == RSA_SHA256:
+            return self.private.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        return self.private.sign(hashlib.sha256(data).digest())
+
+    def txt_record(self) -> str:
+        """Valor del TXT <selector>._domainkey.<dominio> a publicar."""
+        public = self.private.public_key()
+        if self.algorithm == RSA_SHA256:
+            der = public.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+            return f"v=DKIM1; k=rsa; p={base64.b64encode(der).decode('ascii')}"
+        raw = public.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return f"v=DKIM1; k=ed25519; p={base64.b64encode(raw).decode('ascii')}"
+
+
+# --------------------------- Canonicalización relaxed -------------------------
+
+def canon_header(name: bytes, value: bytes) -> bytes:
+    """relaxed (RFC 6376 3.4.2): nombre en minúsculas, sin pliegues, WSP comprimido."""
+    value = _WSP.sub(b" ", value.replace(b"\r\n", b"")).strip(b" ")
+    return name.strip().lower() + b":" + value + b"\r\n"
+
+
+def canon_body(body: bytes) -> bytes:
+    """relaxed (RFC 6376 3.4.4): WSP comprimido, sin WSP al final de línea ni líneas vacías al final."""
+    body = _WSP.sub(b" ", _TRAILING_WSP.sub(b"\r\n", body))
+    body = body.rstrip(b"\r\n")
+    return body + b"\r\n" if body else b""
+
+
+def body_hash(body: bytes) -> str:
+    return base64.b64encode(hashlib.sha256(canon_body(body)).digest()).decode("ascii")
+
+
+def split_message(data: bytes) -> Tuple[List[Tuple[bytes, bytes]], bytes]:
+    """([(nombre, valor con pliegues)], cuerpo) de un mensaje serializado con CRLF."""
+    head, sep, body = data.partition(b"\r\n\r\n")
+    if not sep:
+        head, body = data, b""
+    fields: List[Tuple[bytes, bytes]] = []
+    for line in head.split(b"\r\n"):
+        if line[:1] in (b" ", b"\t") and fields:
+            name, value = fields[-1]
+            fields[-1] = (name, value + b"\r\n" + line)
+        elif line:
+            name, _, value = line.partition(b":")
+            fields.append((name, value))
+    return fields, body
+
+
+def _canon_fields(fields: Iterable[Tuple[bytes, bytes]]) -> Dict[str, bytes]:
+    """{nombre en minúsculas: cabecera canonicalizada}; si se repite, vale la última (RFC 6376 5.4.2)."""
+    return {name.strip().lower().decode("ascii", "replace"): canon_header(name, value) for name, value in fields}
+
+
+def _fold_b64(sig: bytes) -> bytes:
+    b64 = base64.b64encode(sig)
+    return b"\r\n ".join(b64[i:i + 72] for i in range(0, len(b64), 72))
+
+
+class DkimTemplate:
+    """bh= y cabeceras canonicalizadas de un mensaje (sin las de cada destinatario)."""
+
+    __slots__ = ("key", "bh", "headers")
+
+    def __init__(self, key: DkimKey, bh: str, headers: Dict[str, bytes]) -> None:
+        self.key = key
+        self.bh = bh
+        self.headers = headers
+
+
+class DkimSigner:
+    """Claves por dominio (parseadas al crear el firmante) y lista de cabeceras a firmar."""
+
+    def __init__(self, keys: Dict[str, DkimKey], headers: Iterable[str] = DEFAULT_HEADERS) -> None:
+        self.keys = {d.lower(): k for d, k in keys.items()}
+        self.headers = tuple(h.strip().lower() for h in headers if h.strip())
+        if "from" not in self.headers:
+            self.headers = ("from",) + self.headers  # RFC 6376 5.4: From siempre firmada
+
+    def key_for(self, domain: str) -> Optional[DkimKey]:
+        return self.keys.get((domain or "").strip().lower())
+
+    def template(self, domain: str, data: bytes) -> Optional[DkimTemplate]:
+        """Trabajo cacheable de un mensaje serializado; None si el dominio no tiene clave."""
+        key = self.key_for(domain)
+        if key is None:
+            return None
+        fields, body = split_message(data)
+        return DkimTemplate(key, body_hash(body), _canon_fields(fields))
+
+    def signature(self, tpl: DkimTemplate, extra: bytes = b"") -> bytes:
+        """
+        Cabecera DKIM-Signature (con CRLF) para el mensaje de `tpl` con las
+        cabeceras `extra` (p.ej. la línea To) antepuestas.
+        """
+        headers = tpl.headers
+        if extra:
+            headers = {**headers, **_canon_fields(split_message(extra + b"\r\n")[0])}
+        names = [h for h in self.headers if h in headers]
+        key = tpl.key
+        unsigned = (
+            f"DKIM-Signature: v=1; a={key.algorithm}; c=relaxed/relaxed; d={key.domain}; s={key.selector};\r\n"
+            f" t={int(time.time())}; h={':'.join(names)};\r\n bh={tpl.bh};\r\n b="
+        ).encode("ascii")
+        name, _, value = unsigned.partition(b":")
+        signed = b"".join(headers[h] for h in names) + canon_header(name, value)[:-2]
+        signed_total.inc(key.domain)
+        return unsigned + _fold_b64(key.sign(signed)) + b"\r\n"
+
+    def sign(self, domain: str, data: bytes) -> bytes:
+        """Mensaje completo firmado (ruta sin prototipo: EmailMessage)."""
+        tpl = self.template(domain, data)
+        return data if tpl is None else self.signature(tpl) + data
+
+
+def load_signer(keys: Dict[str, str], selector: str = "mail",
+                headers: Iterable[str] = DEFAULT_HEADERS) -> Optional[DkimSigner]:
+    """Firmante de DKIM_KEYS, o None si no hay claves configuradas."""
+    if not keys:
+        return None
+    return DkimSigner({d: DkimKey.load(d, spec, selector) for d, spec in keys.items()}, headers)
+
+
+# --------------------------- Verificación (pruebas) ---------------------------
+
+def _tags(value: bytes) -> Dict[str, str]:
+    out = {}
+    for part in value.decode("ascii", "replace").split(";"):
+        k, sep, v = part.partition("=")
+        if sep:
+            out[k.strip()] = re.sub(r"\s+", "", v)
+    return out
+
+
+def verify(data: bytes, public_keys: Dict[Tuple[str, str], object]) -> Tuple[bool, str]:
+    """
+    Comprueba la primera DKIM-Signature de `data` con {(dominio, selector):
+    clave pública}. (True, "pass") o (False, motivo). Solo relaxed/relaxed.
+    """
+    fields, body = split_message(data)
+    sig = next(((n, v) for n, v in fields if n.strip().lower() == b"dkim-signature"), None)
+    if sig is None:
+        return False, "no_signature"
+    tags = _tags(sig[1])
+    public = public_keys.get((tags.get("d", "").lower(), tags.get("s", "")))
+    if public is None:
+        return False, "no_key"
+    if tags.get("c") != "relaxed/relaxed":
+        return False, "unsupported_canon"
+    if tags.get("bh") != body_hash(body):
+        return False, "body_hash_mismatch"
+
+    # h=: de abajo arriba, cada aparición de un nombre consume una instancia
+    pool: Dict[str, List[bytes]] = {}
+    for name, value in fields:
+        pool.setdefault(name.strip().lower().decode("ascii", "replace"), []).append(canon_header(name, value))
+    signed = b""
+    for h in tags.get("h", "").lower().split(":"):
+        if pool.get(h):
+            signed += pool[h].pop()
+    signed += canon_header(sig[0], _B_TAG.sub(rb"\1\2", sig[1]))[:-2]
+    raw = base64.b64decode(tags.get("b", ""))
+    try:
+        if tags.get("a") == RSA_SHA256:
+            public.verify(raw, signed, padding.PKCS1v15(), hashes.SHA256())
+        elif tags.get("a") == ED25519_SHA256:
+            public.verify(raw, hashlib.sha256(signed).digest())
+        else:
+            return False, "unsupported_algorithm"
+    except InvalidSignature:
+        return False, "bad_signature"
+    return True, "pass"
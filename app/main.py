@@ -1,10 +1,90 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
 from fastapi import FastAPI, HTTPException, Header
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
+from . import metrics
 from .settings import settings, Email
-from .sender import build_message, send_with_retries
+from .sender import SendError, classify, factory, pool, recipient_errors, retry_delay, send_with_retries
+from .outbox import Outbox, OutboxWorkers
+from .ratelimit import DomainLimiter, SharedDomainLimiter, parse_limit, recipient_domain
+from .suppression import MANUAL, REASONS, SuppressionList
+from .templating import DEFAULT_TEMPLATES_DIR, TemplateEngine
+
+templates = TemplateEngine(settings.TEMPLATES_DIR or DEFAULT_TEMPLATES_DIR, settings.TEMPLATES_CHECK_SECS)
+
+_limits = dict(
+    rate=settings.DOMAIN_RATE,
+    max_in_flight=settings.DOMAIN_MAX_IN_FLIGHT,
+    limits={d: parse_limit(v) for d, v in settings.DOMAIN_LIMITS.items()},
+    aliases=settings.DOMAIN_ALIASES,
+    global_limit=(settings.SEND_RATE, settings.SEND_MAX_IN_FLIGHT),
+)
+# Con varios workers (app/run.sh prod) los límites se coordinan en LIMITS_PATH
+domains = SharedDomainLimiter(settings.LIMITS_PATH, **_limits) if settings.LIMITS_PATH else DomainLimiter(**_limits)
+
+QUEUE_MODE = settings.SEND_MODE == "queue"
+
+# SEND_MODE=queue, o sync con RETRY_QUEUE (la cola solo guarda los reintentos programados)
+outbox: Optional[Outbox] = None
+workers: Optional[OutboxWorkers] = None
+suppression: Optional[SuppressionList] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global outbox, workers, suppression
+    await pool.start()
+    if settings.SUPPRESSION_PATH:
+        suppression = SuppressionList(settings.SUPPRESSION_PATH)
+    if QUEUE_MODE or settings.RETRY_QUEUE:
+        outbox = Outbox(settings.QUEUE_PATH, synchronous=settings.QUEUE_SYNCHRONOUS)
+        workers = OutboxWorkers(outbox, _send_queued, settings.QUEUE_WORKERS,
+                                limiter=domains, domains_of=lambda p: [recipient_domain(a) for a in p["to"]],
+                                max_attempts=settings.RETRY_MAX_ATTEMPTS)
+        workers.start()
+    try:
+        yield
+    finally:
+        if workers is not None:
+            await workers.stop()
+        if outbox is not None:
+            outbox.close()
+        if suppression is not None:
+            suppression.close()
+        if isinstance(domains, SharedDomainLimiter):
+            domains.close()
+        await pool.close()
+
 
-app = FastAPI(title="SMTP independiente", version="1.0.0")
+app = FastAPI(title="SMTP independiente", version="1.0.0", lifespan=lifespan)
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# Estado del pool y de la cola: se leen al exportar (nada en el camino caliente)
+for _key, _help in (("open", "Sesiones SMTP abiertas"), ("idle", "Sesiones SMTP ociosas"),
+                    ("in_use", "Sesiones SMTP prestadas"), ("waiting", "Peticiones esperando hueco en el pool")):
+    metrics.registry.gauge(f"smtp_pool_{_key}", _help, lambda k=_key: pool.stats()[k])
+for _key, _help in (("created", "Conexiones SMTP creadas"), ("recycled", "Sesiones recicladas (max mensajes o caídas)"),
+                    ("evicted", "Sesiones cerradas por ociosas"), ("reconnects", "Reintentos por SMTPServerDisconnected"),
+                    ("healthcheck_failures", "NOOP fallidos al reutilizar una sesión")):
+    metrics.registry.counter(f"smtp_pool_{_key}_total", _help, fn=lambda k=_key: pool.stats()[k])
+metrics.registry.gauge("smtp_queue_messages", "Mensajes de la cola por estado (SEND_MODE=queue)",
+                       lambda: outbox.depth() if outbox is not None else {}, labels=("status",))
+metrics.registry.gauge("smtp_queue_busy_workers", "Workers de la cola enviando",
+                       lambda: workers.busy if workers is not None else 0)
+metrics.registry.counter("smtp_domain_waits_total", "Envíos que esperaron hueco en su dominio (modo sync)",
+                         fn=lambda: domains.waits)
+metrics.registry.counter("smtp_queue_retries_total", "Reintentos programados en la cola (transitorios/conexión)",
+                         fn=lambda: workers.retries if workers is not None else 0)
+suppressed_total = metrics.registry.counter(
+    "smtp_suppressed_total", "Destinatarios descartados por la lista de supresión", ("reason",))
+metrics.registry.counter("smtp_queue_deferred_total", "Mensajes de la cola aplazados por límite de dominio",
+                         fn=lambda: workers.deferred if workers is not None else 0)
 
 
 @app.get("/")
@@ -12,31 +92,345 @@ async def health():
     return {"status": "ok", "smtp_host": settings.SMTP_HOST}
 
 
-@app.post("/send")
-async def send_email(payload: Email, authorization: str | None = Header(None)):
+@app.get("/pool")
+async def pool_stats():
+    """Tamaño del pool SMTP, espera y latencia de checkout (para dimensionarlo). Por worker (pid)."""
+    return {"pid": os.getpid(), **pool.stats(), "mime": factory.stats()}
+
+
+@app.get("/limits")
+async def limits_state():
+    """Límites configurados y, con LIMITS_PATH, el estado que comparten todos los workers."""
+    body = {"pid": os.getpid(), "limits": {k: {"rate": r, "max_in_flight": n} for k, (r, n) in domains.limits.items()},
+            "default": {"rate": domains.rate, "max_in_flight": domains.max_in_flight}}
+    if isinstance(domains, SharedDomainLimiter):
+        body["shared"] = {"path": domains.path, "state": domains.shared_state(), "busy": domains.busy}
+    return body
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Métricas en formato de texto de Prometheus."""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _check_auth(authorization: str | None) -> None:
     # (Opcional) Bearer si lo usas
     if settings.API_BEARER_TOKEN.get_secret_value():
         token = (authorization or "").replace("Bearer ", "")
         if token != settings.API_BEARER_TOKEN.get_secret_value():
             raise HTTPException(status_code=401, detail="Unauthorized")
 
+
+def _render(payload: Email) -> tuple[str, str | None, str | None]:
+    """(subject, text, html). Con template_id renderiza desde la plantilla cacheada (LookupError si no existe)."""
+    if payload.template_id:
+        tpl = templates.campaign(payload.template_id)
+        html, text = tpl.render(**(payload.variables or {}))
+        return payload.subject or tpl.subject, text or None, html
+    return payload.subject, payload.body_text, payload.body_html
+
+
+def _check_template(payload: Email) -> None:
+    if payload.template_id:
+        try:
+            templates.campaign(payload.template_id)
+        except LookupError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _send(payload: Email):
+    subject, text, html = _render(payload)
+    msg = factory.build(
+        to=payload.to,
+        subject=subject,
+        text=text,
+        html=html,
+        headers=payload.headers,
+        from_domain=payload.from_domain,
+        undisclosed=payload.undisclosed_recipients,
+    )
+    return await send_with_retries(msg, recipients=payload.to if payload.undisclosed_recipients else None)
+
+
+async def _send_queued(p: dict):
+    """Entrega desde la cola; con varios 'to' el resultado guarda el estado de cada uno."""
+    payload = Email(**p)
+    resp = await _send(payload)
+    if len(payload.to) > 1:
+        return {"result": resp, "recipients": _recipients(payload, resp)}
+    return resp
+
+
+async def _deliver(payload: Email):
+    """_send respetando los límites por dominio (espera su turno sin bloquear otros dominios)."""
+    if not domains.enabled:
+        return await _send(payload)
+    keys = await domains.acquire(recipient_domain(a) for a in payload.to)
+    try:
+        return await _send(payload)
+    finally:
+        if keys:
+            domains.release(keys)
+
+
+@app.post("/send")
+async def send_email(payload: Email, authorization: str | None = Header(None)):
+    _check_auth(authorization)
+
     if len(payload.to) > settings.MAX_RCPTS:
         raise HTTPException(
             status_code=400,
             detail=f"Demasiados destinatarios (>{settings.MAX_RCPTS})"
         )
+    _check_template(payload)
+
+    to = payload.to
+    payload, blocked = _split_suppressed(payload)
+    if payload is None:
+        detail = {"error": "Destinatario en la lista de supresión", "error_class": "permanent", "suppressed": blocked}
+        if len(to) > 1:
+            detail["recipients"] = _with_suppressed(to, blocked, [])
+        raise HTTPException(status_code=409, detail=detail)
+
+    if QUEUE_MODE:
+        msg_id = await outbox.put(outbox.enqueue, payload.model_dump(mode="json"))
+        body = {"status": "queued", "id": msg_id}
+        if blocked:
+            body["recipients"] = _with_suppressed(to, blocked, [{"to": a, "status": "queued"} for a in payload.to])
+        return JSONResponse(body, status_code=202)
 
     try:
-        # ⚠️ Aquí el fix: usar 'to=' (o posicional) en vez de 'recipients='
-        msg = build_message(
-            to=payload.to,
-            subject=payload.subject,
-            body_text=payload.body_text,
-            body_html=payload.body_html,
-            headers=payload.headers,
-            from_domain=payload.from_domain,
-        )
-        resp = await send_with_retries(msg)
-        return JSONResponse({"status": "sent", "result": resp})
+        resp = await _deliver(payload)
     except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Error SMTP: {e}")
+        err = classify(e)
+        recipients = _recipients(payload, err=err)
+        extra = {"recipients": _with_suppressed(to, blocked, recipients)} if len(to) > 1 else {}
+        deferred = next((r for r in recipients if r["status"] == "deferred"), None)
+        if deferred:
+            return JSONResponse({"status": "deferred", "id": deferred["id"], "retry_in": deferred["retry_in"],
+                                 **err.as_dict(), **extra}, status_code=202)
+        raise HTTPException(status_code=502, detail={**err.as_dict(), "error": f"Error SMTP: {err}", **extra})
+    body = {"status": "sent", "result": resp}
+    if len(to) > 1:
+        body["recipients"] = _with_suppressed(to, blocked, _recipients(payload, resp))
+    return JSONResponse(body)
+
+
+def _split_suppressed(payload: Email) -> tuple[Optional[Email], dict[str, str]]:
+    """(payload sin los destinatarios suprimidos, o None si no queda ninguno; {dirección: motivo})."""
+    if suppression is None:
+        return payload, {}
+    blocked = suppression.reasons(payload.to)
+    if not blocked:
+        return payload, {}
+    for reason in blocked.values():
+        suppressed_total.inc(reason)
+    rest = [a for a in payload.to if a not in blocked]
+    return (payload.model_copy(update={"to": rest}) if rest else None), blocked
+
+
+def _with_suppressed(to: list[str], blocked: dict[str, str], recipients: list[dict]) -> list[dict]:
+    """'recipients' en el orden del 'to' original, con los suprimidos como skipped."""
+    rest = iter(recipients)
+    return [{"to": a, "status": "skipped", "error": f"suppressed_{blocked[a]}", "error_class": "permanent"}
+            if a in blocked else next(rest) for a in to]
+
+
+def _schedule_retry(payload: Email, err: SendError) -> tuple[str, float]:
+    """Fallo reintentable en modo sync -> a la cola con su primer reintento programado ("" si no aplica)."""
+    if outbox is None or not err.retryable or settings.RETRY_MAX_ATTEMPTS < 2:
+        return "", 0.0
+    delay = retry_delay(1, err.retry_after)
+    return outbox.enqueue_retry(payload.model_dump(mode="json"), delay, str(err), err.error_class), delay
+
+
+def _recipients(payload: Email, result=None, err: SendError | None = None) -> list[dict]:
+    """
+    Estado de cada destinatario (en el orden de 'to'). Los rechazos
+    reintentables (4xx en su RCPT, o el envío entero si falló así) quedan
+    "deferred" con un único reintento programado solo para ellos.
+    """
+    errors = recipient_errors(payload.to, result, err)
+    out = [{"to": addr, "status": "sent"} if e is None else {"to": addr, "status": "failed", **e.as_dict()}
+           for addr, e in zip(payload.to, errors)]
+    retry = [i for i, e in enumerate(errors) if e is not None and e.retryable]
+    if retry:
+        worst = max((errors[i] for i in retry), key=lambda e: e.retry_after or 0)
+        msg_id, retry_in = _schedule_retry(payload.model_copy(update={"to": [payload.to[i] for i in retry]}), worst)
+        if msg_id:
+            for i in retry:
+                out[i].update(status="deferred", id=msg_id, retry_in=round(retry_in, 1))
+    return out
+
+
+async def _deliver_item(index: int, payload: Email) -> dict:
+    """Envía un elemento del lote; nunca lanza (el error va en el resultado)."""
+    t0 = time.perf_counter()
+    if len(payload.to) > settings.MAX_RCPTS:
+        return {
+            "index": index,
+            "status": "failed",
+            "error": f"Demasiados destinatarios (>{settings.MAX_RCPTS})",
+            "error_class": "permanent",
+            "latency_ms": 0.0,
+            "result": None,
+        }
+    to = payload.to
+    payload, blocked = _split_suppressed(payload)
+    if payload is None:
+        return {
+            "index": index,
+            "status": "skipped",
+            "error": f"suppressed_{next(iter(blocked.values()))}",
+            "error_class": "permanent",
+            "latency_ms": 0.0,
+            "result": None,
+            **({"recipients": _with_suppressed(to, blocked, [])} if len(to) > 1 else {}),
+        }
+    extra = {}
+    try:
+        resp = await _deliver(payload)
+        status, error, error_class = "sent", "", ""
+        if len(to) > 1:
+            extra = {"recipients": _with_suppressed(to, blocked, _recipients(payload, resp))}
+    except LookupError as e:
+        resp, status, error, error_class = None, "failed", str(e), "permanent"
+    except Exception as e:
+        err = classify(e)
+        resp, error, error_class = None, f"Error SMTP: {err}", err.error_class
+        recipients = _recipients(payload, err=err)
+        deferred = next((r for r in recipients if r["status"] == "deferred"), None)
+        status = "deferred" if deferred else "failed"
+        if deferred:
+            extra = {"id": deferred["id"], "retry_in": deferred["retry_in"]}
+        if len(to) > 1:
+            extra["recipients"] = _with_suppressed(to, blocked, recipients)
+    return {
+        "index": index,
+        "status": status,
+        "error": error,
+        "error_class": error_class,
+        "latency_ms": round((time.perf_counter() - t0) * 1000, 3),
+        "result": resp,
+        **extra,
+    }
+
+
+@app.post("/send/batch")
+async def send_batch(payloads: List[Email], authorization: str | None = Header(None)):
+    """
+    Lote de envíos: cada elemento se manda en paralelo sobre el pool SMTP y
+    recibe su propio resultado (sent/failed + error + latencia). Un fallo no
+    tumba el lote.
+    """
+    _check_auth(authorization)
+
+    if not payloads:
+        raise HTTPException(status_code=400, detail="Lote vacío")
+    if len(payloads) > settings.MAX_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Lote demasiado grande (>{settings.MAX_BATCH})"
+        )
+
+    if QUEUE_MODE:
+        too_many = [i for i, p in enumerate(payloads) if len(p.to) > settings.MAX_RCPTS]
+        if too_many:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Demasiados destinatarios (>{settings.MAX_RCPTS}) en elementos {too_many}"
+            )
+        for p in payloads:
+            _check_template(p)
+        split = [_split_suppressed(p) for p in payloads]
+        queued = iter(await outbox.put(outbox.enqueue_many,
+                                       [p.model_dump(mode="json") for p, _ in split if p is not None]))
+        ids = [next(queued) if p is not None else None for p, _ in split]
+        body = {"status": "queued", "ids": ids}
+        if any(blocked for _, blocked in split):
+            # Con suprimidos, el detalle por elemento (como en modo sync)
+            body["results"] = [_queued_item(i, orig.to, p, blocked, msg_id)
+                               for i, (orig, (p, blocked), msg_id) in enumerate(zip(payloads, split, ids))]
+        return JSONResponse(body, status_code=202)
+
+    results = await asyncio.gather(*(_deliver_item(i, p) for i, p in enumerate(payloads)))
+    sent = sum(1 for r in results if r["status"] == "sent")
+    deferred = sum(1 for r in results if r["status"] == "deferred")
+    skipped = sum(1 for r in results if r["status"] == "skipped")
+    return JSONResponse({
+        "sent": sent,
+        "failed": len(results) - sent - deferred - skipped,
+        "deferred": deferred,
+        "skipped": skipped,
+        "results": results,
+    })
+
+
+def _queued_item(index: int, to: list[str], payload: Optional[Email], blocked: dict[str, str],
+                 msg_id: Optional[str]) -> dict:
+    item = {"index": index, "status": "queued" if payload is not None else "skipped", "id": msg_id}
+    if payload is None:
+        item.update(error=f"suppressed_{next(iter(blocked.values()))}", error_class="permanent")
+    if len(to) > 1 and blocked:
+        queued = [{"to": a, "status": "queued"} for a in payload.to] if payload is not None else []
+        item["recipients"] = _with_suppressed(to, blocked, queued)
+    return item
+
+
+def _require_outbox() -> Outbox:
+    if outbox is None:
+        raise HTTPException(status_code=404, detail="Cola desactivada (SEND_MODE != queue y RETRY_QUEUE=false)")
+    return outbox
+
+
+@app.get("/status/{msg_id}")
+async def message_status(msg_id: str, authorization: str | None = Header(None)):
+    _check_auth(authorization)
+    row = _require_outbox().get(msg_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Mensaje no encontrado")
+    return row
+
+
+@app.get("/queue")
+async def queue_depth(authorization: str | None = Header(None)):
+    _check_auth(authorization)
+    box = _require_outbox()
+    return {
+        "depth": box.depth(),
+        "workers": workers.workers if workers else 0,
+        "busy": workers.busy if workers else 0,
+    }
+
+
+@app.get("/suppression/{address}")
+async def suppression_get(address: str, authorization: str | None = Header(None)):
+    _check_auth(authorization)
+    entry = _require_suppression().get(address)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No está en la lista de supresión")
+    return entry
+
+
+@app.post("/suppression")
+async def suppression_add(body: dict, authorization: str | None = Header(None)):
+    """Alta manual o desde un webhook de bajas: {"email": ..., "reason": "unsubscribe", "detail": ...}."""
+    _check_auth(authorization)
+    address, reason = str(body.get("email") or ""), str(body.get("reason") or MANUAL)
+    if "@" not in address or reason not in REASONS:
+        raise HTTPException(status_code=400, detail=f"email obligatorio; reason en {list(REASONS)}")
+    added = _require_suppression().add(address, reason, "api", str(body.get("detail") or ""))
+    return {"email": address, "reason": reason, "added": added}
+
+
+@app.delete("/suppression/{address}")
+async def suppression_remove(address: str, authorization: str | None = Header(None)):
+    _check_auth(authorization)
+    return {"email": address, "removed": _require_suppression().remove(address)}
+
+
+def _require_suppression() -> SuppressionList:
+    if suppression is None:
+        raise HTTPException(status_code=404, detail="Lista de supresión desactivada (SUPPRESSION_PATH vacío)")
+    return suppression
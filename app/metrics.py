@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+# Buckets (segundos): de sub-milisegundo (MIME/cola) a los timeouts SMTP
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """
+    Contador monótono; las etiquetas van posicionales: c.inc("sent").
+    Con `fn` (sin etiquetas) exporta un contador que ya lleva otro objeto.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 fn: Callable[[], float] | None = None) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+        self.fn = fn
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        if self.fn is not None:
+            return self.header() + [f"{self.name} {_fmt(float(self.fn()))}"]
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}"
+                                for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """
+    Valor instantáneo: inc/dec, o `fn` que se evalúa al exportar. Con una
+    etiqueta, `fn` devuelve {valor_etiqueta: número}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Any] | None = None,
+                 labels: Iterable[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.value = 0.0
+        self.fn = fn
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def render(self) -> List[str]:
+        if self.labelnames:
+            return self.header() + [f"{self.name}{_labels(self.labelnames, (k,))} {_fmt(float(v))}"
+                                    for k, v in self.fn().items()]
+        return self.header() + [f"{self.name} {_fmt(float(self.fn() if self.fn else self.value))}"]
+
+
+class Histogram(_Metric):
+    """
+    Histograma con buckets fijos. observe() es un bisect + dos sumas (sin
+    acumulados ni locks: todo corre en el event loop); los acumulados se
+    calculan al exportar.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}  # labels -> [counts por bucket (+Inf al final), sum]
+
+    def observe(self, value: float, *labels) -> None:
+        s = self._series.get(labels)
+        if s is None:
+            s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        s[0][bisect_left(self.buckets, value)] += 1
+        s[1] += value
+
+    def count(self, *labels) -> int:
+        s = self._series.get(labels)
+        return sum(s[0]) if s else 0
+
+    def render(self) -> List[str]:
+        out = self.header()
+        for key, (counts, total) in self._series.items():
+            acc = 0
+            for le, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                le_label = 'le="%s"' % _fmt(le)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le_label)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {acc}")
+        return out
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = (),
+                fn: Callable[[], float] | None = None) -> Counter:
+        return self.register(Counter(name, help, labels, fn))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], Any] | None = None,
+              labels: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, fn, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Formato de texto de Prometheus (text/plain; version=0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+# --------------------------- Métricas de la API ------------------------------
+
+http_requests = registry.histogram(
+    "smtp_api_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", ("method", "route", "status"))
+smtp_send = registry.histogram(
+    "smtp_send_duration_seconds", "Latencia de una transmisión SMTP (DATA incluido) por resultado", ("result",))
+pool_wait = registry.histogram(
+    "smtp_pool_wait_seconds", "Espera por un hueco libre del pool SMTP")
+pool_checkout = registry.histogram(
+    "smtp_pool_checkout_seconds", "Checkout completo del pool (espera + NOOP/conexión)")
+sends_in_flight = registry.gauge(
+    "smtp_sends_in_flight", "Envíos en curso (send_with_retries)")
+send_retries = registry.counter(
+    "smtp_send_retries_total", "Reintentos de send_with_retries")
+send_errors = registry.counter(
+    "smtp_send_errors_total", "Intentos fallidos por tipo de excepción", ("exception",))
+messages = registry.counter(
+    "smtp_messages_total", "Mensajes por resultado final (sent/failed)", ("status",))
+send_failures = registry.counter(
+    "smtp_send_failures_total", "Envíos fallidos por clase (permanent/transient/connection)", ("error_class",))
+
+
+class MetricsMiddleware:
+    """
+    ASGI puro (sin BaseHTTPMiddleware: no envuelve el body ni crea tareas).
+    Etiqueta por plantilla de ruta ("/status/{msg_id}"), no por URL, para no
+    disparar la cardinalidad.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_requests.observe(time.perf_counter() - t0, scope["method"], path, str(status[0]))
@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .ratelimit import pid_alive, sqlite_busy
+from .sender import classify, retry_delay
+
+if TYPE_CHECKING:
+    from .ratelimit import DomainLimiter
+
+# Estados de un mensaje en la cola
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id              TEXT PRIMARY KEY,
+    payload         TEXT NOT NULL,
+    status          TEXT NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    error           TEXT NOT NULL DEFAULT '',
+    error_class     TEXT NOT NULL DEFAULT '',
+    result          TEXT,
+    owner           INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (status, next_attempt_at);
+"""
+
+
+class Outbox:
+    """
+    Cola durable de envíos en SQLite (WAL).
+
+    Cada proceso la usa desde su event loop; cada operación es una
+    transacción corta, así que no hace falta moverla a un thread pool. Con
+    varios workers (uvicorn --workers) comparten el fichero: claim() es
+    atómico y cada mensaje en 'sending' lleva el pid que lo reclamó.
+
+    Como en SharedDomainLimiter, en marcha nunca se espera el lock de otro
+    worker más de `busy_timeout`: claim() lo toma como "nada listo todavía",
+    un cambio de estado (defer, mark_*, reintentos) que no lo consigue queda
+    anotado y se aplica en la siguiente transacción, y los enqueue de la API
+    se reintentan con put() cada `poll` seg sin parar el event loop.
+    """
+
+    poll = 0.05
+    busy_timeout = 0.05
+    put_timeout = 10.0
+
+    def __init__(self, path: str, synchronous: str = "NORMAL") -> None:
+        Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None, timeout=10.0)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous}")
+        self._db.executescript(_SCHEMA)
+        cols = {r["name"] for r in self._db.execute("PRAGMA table_info(outbox)")}
+        if "error_class" not in cols:  # colas creadas antes de clasificar errores
+            self._db.execute("ALTER TABLE outbox ADD COLUMN error_class TEXT NOT NULL DEFAULT ''")
+        if "owner" not in cols:  # colas de antes del modo multiproceso
+            self._db.execute("ALTER TABLE outbox ADD COLUMN owner INTEGER NOT NULL DEFAULT 0")
+        self.pid = os.getpid()
+        self.ready = asyncio.Event()
+        self._unwritten: List[Tuple[str, tuple]] = []  # cambios de estado que no consiguieron el lock
+        self.busy = 0
+        self.recover()
+        # Al arrancar se puede esperar; en marcha (event loop) solo unos ms
+        self._db.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+
+    def close(self) -> None:
+        if self._unwritten:  # al apagar ya se puede esperar el lock
+            self._db.execute("PRAGMA busy_timeout=10000")
+            self._locked(lambda: None)
+        self._db.close()
+
+    def _locked(self, fn, *args):
+        """fn(*args) en una transacción BEGIN IMMEDIATE que antes aplica los cambios pendientes."""
+        pending = len(self._unwritten)
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            for sql, params in self._unwritten[:pending]:
+                self._db.execute(sql, params)
+            out = fn(*args)
+        del self._unwritten[:pending]  # solo si la transacción se confirmó
+        return out
+
+    def _write(self, sql: str, params: tuple) -> None:
+        """Cambio de estado de un mensaje; con el lock ocupado, lo aplica la próxima transacción."""
+        self._unwritten.append((sql, params))
+        try:
+            self._locked(lambda: None)
+        except sqlite3.OperationalError as e:
+            if not sqlite_busy(e):
+                raise
+            self.busy += 1
+            self.ready.set()  # que un worker vuelva pronto a claim() y lo escriba
+
+    async def put(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """fn(*args) (enqueue desde la API) reintentando cada `poll` seg mientras otro worker tenga el lock."""
+        deadline = time.monotonic() + self.put_timeout
+        while True:
+            try:
+                return fn(*args)
+            except sqlite3.OperationalError as e:
+                if not sqlite_busy(e) or time.monotonic() > deadline:
+                    raise
+                self.busy += 1
+            await asyncio.sleep(self.poll)
+
+    def recover(self) -> int:
+        """
+        Tras un reinicio (lo hace __init__): lo que quedó en 'sending' vuelve
+        a la cola, salvo lo que está enviando otro worker vivo.
+        """
+        now = time.time()
+        recovered = 0
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            owners = [o for (o,) in self._db.execute("SELECT DISTINCT owner FROM outbox WHERE status=?", (SENDING,))]
+            for owner in owners:
+                if owner == self.pid or not pid_alive(owner):
+                    recovered += self._db.execute(
+                        "UPDATE outbox SET status=?, updated_at=? WHERE status=? AND owner=?",
+                        (QUEUED, now, SENDING, owner),
+                    ).rowcount
+        if recovered:
+            self.ready.set()
+        return recovered
+
+    def enqueue_many(self, payloads: Iterable[Dict[str, Any]]) -> List[str]:
+        now = time.time()
+        rows = [(uuid.uuid4().hex, json.dumps(p), QUEUED, now, now, now) for p in payloads]
+        self._locked(
+            self._db.executemany,
+            "INSERT INTO outbox (id, payload, status, created_at, updated_at, next_attempt_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self.ready.set()
+        return [r[0] for r in rows]
+
+    def enqueue(self, payload: Dict[str, Any]) -> str:
+        return self.enqueue_many([payload])[0]
+
+    def enqueue_retry(self, payload: Dict[str, Any], delay: float, error: str, error_class: str) -> str:
+        """Mensaje que ya falló una vez fuera de la cola (modo sync): entra con su reintento programado."""
+        now = time.time()
+        msg_id = uuid.uuid4().hex
+        self._write(
+            "INSERT INTO outbox (id, payload, status, attempts, created_at, updated_at, next_attempt_at, error, error_class) "
+            "VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)",
+            (msg_id, json.dumps(payload), QUEUED, now, now, now + delay, error[:1000], error_class),
+        )
+        self.ready.set()
+        return msg_id
+
+    def claim(self) -> Optional[Tuple[str, Dict[str, Any], int]]:
+        """Toma el siguiente mensaje listo -> (id, payload, attempts) o None (también si otro worker tiene el lock)."""
+        try:
+            row = self._locked(self._claim)
+        except sqlite3.OperationalError as e:
+            if not sqlite_busy(e):
+                raise
+            self.busy += 1
+            return None
+        if row is None:
+            return None
+        return row["id"], json.loads(row["payload"]), row["attempts"] + 1
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """claim() dentro de la transacción de _locked()."""
+        now = time.time()
+        row = self._db.execute(
+            "SELECT id, payload, attempts FROM outbox "
+            "WHERE status=? AND next_attempt_at<=? ORDER BY next_attempt_at LIMIT 1",
+            (QUEUED, now),
+        ).fetchone()
+        if row is not None:
+            self._db.execute(
+                "UPDATE outbox SET status=?, attempts=attempts+1, updated_at=?, owner=? WHERE id=?",
+                (SENDING, now, self.pid, row["id"]),
+            )
+        return row
+
+    def defer(self, msg_id: str, delay: float) -> None:
+        """Devuelve un mensaje reclamado a la cola sin gastar intento (p.ej. su dominio va al límite)."""
+        now = time.time()
+        self._write(
+            "UPDATE outbox SET status=?, attempts=attempts-1, updated_at=?, next_attempt_at=? WHERE id=?",
+            (QUEUED, now, now + delay, msg_id),
+        )
+
+    def next_due(self) -> Optional[float]:
+        """next_attempt_at más próximo entre los encolados (None si no hay)."""
+        row = self._db.execute(
+            "SELECT MIN(next_attempt_at) FROM outbox WHERE status=?", (QUEUED,)
+        ).fetchone()
+        return row[0]
+
+    def mark_sent(self, msg_id: str, result: Any = None) -> None:
+        self._write(
+            "UPDATE outbox SET status=?, error='', error_class='', result=?, updated_at=? WHERE id=?",
+            (SENT, json.dumps(result, default=str), time.time(), msg_id),
+        )
+
+    def mark_failed(self, msg_id: str, error: str, error_class: str = "") -> None:
+        self._write(
+            "UPDATE outbox SET status=?, error=?, error_class=?, updated_at=? WHERE id=?",
+            (FAILED, error[:1000], error_class, time.time(), msg_id),
+        )
+
+    def schedule_retry(self, msg_id: str, delay: float, error: str, error_class: str) -> None:
+        """Fallo reintentable: vuelve a la cola para dentro de `delay` seg (el intento sí cuenta)."""
+        now = time.time()
+        self._write(
+            "UPDATE outbox SET status=?, error=?, error_class=?, updated_at=?, next_attempt_at=? WHERE id=?",
+            (QUEUED, error[:1000], error_class, now, now + delay, msg_id),
+        )
+
+    def get(self, msg_id: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute(
+            "SELECT id, status, attempts, created_at, updated_at, next_attempt_at, error, error_class, result "
+            "FROM outbox WHERE id=?",
+            (msg_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        out = dict(row)
+        out["result"] = json.loads(out["result"]) if out["result"] else None
+        return out
+
+    def depth(self) -> Dict[str, int]:
+        counts = {QUEUED: 0, SENDING: 0, SENT: 0, FAILED: 0}
+        for status, n in self._db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status"):
+            counts[status] = n
+        return counts
+
+
+class OutboxWorkers:
+    """
+    N tareas asyncio que drenan la cola con `deliver(payload)`.
+
+    Un fallo se clasifica (sender.classify): los permanentes quedan en
+    'failed' al momento; transitorios y de conexión se reprograman con
+    retry_delay (backoff con jitter, respetando la pista del servidor) hasta
+    `max_attempts` intentos.
+
+    Con `limiter` (DomainLimiter) y `domains_of(payload)`, un mensaje cuyo
+    dominio no tiene hueco vuelve a la cola aplazado en vez de bloquear al
+    worker, que sigue con mensajes de otros dominios.
+    """
+
+    def __init__(self, outbox: Outbox, deliver: Callable[[Dict[str, Any]], Awaitable[Any]], workers: int,
+                 limiter: "DomainLimiter | None" = None,
+                 domains_of: Optional[Callable[[Dict[str, Any]], List[str]]] = None,
+                 max_attempts: int = 8) -> None:
+        self.outbox = outbox
+        self.deliver = deliver
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.limiter = limiter if limiter is not None and limiter.enabled else None
+        self.domains_of = domains_of
+        self._tasks: List[asyncio.Task] = []
+        self.busy = 0
+        self.deferred = 0
+        self.retries = 0
+
+    async def _idle(self) -> None:
+        due = self.outbox.next_due()
+        timeout = 1.0 if due is None else min(1.0, max(0.005, due - time.time()))
+        try:
+            await asyncio.wait_for(self.outbox.ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            self.outbox.ready.clear()
+            claimed = self.outbox.claim()
+            if claimed is None:
+                await self._idle()
+                continue
+
+            msg_id, payload, attempts = claimed
+            keys: List[str] = []
+            if self.limiter is not None:
+                domains = self.domains_of(payload)
+                keys = self.limiter.keys(domains)
+                if keys and self.limiter.try_acquire(keys) > 0:
+                    self.outbox.defer(msg_id, self.limiter.defer_delay(domains))
+                    self.deferred += 1
+                    continue
+            self.busy += 1
+            try:
+                result = await self.deliver(payload)
+                self.outbox.mark_sent(msg_id, result)
+            except asyncio.CancelledError:
+                # Apagado: se queda en 'sending' y recover() lo reencola al arrancar.
+                raise
+            except Exception as e:
+                err = classify(e)
+                if err.retryable and attempts < self.max_attempts:
+                    self.outbox.schedule_retry(msg_id, retry_delay(attempts, err.retry_after), str(err), err.error_class)
+                    self.retries += 1
+                else:
+                    self.outbox.mark_failed(msg_id, str(err), err.error_class)
+            finally:
+                self.busy -= 1
+                if keys:
+                    self.limiter.release(keys)
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,442 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Dominios que comparten infraestructura (y límites) con otro
+PROVIDER_ALIASES: Dict[str, str] = {
+    "googlemail.com": "gmail.com",
+    "hotmail.com": "outlook.com",
+    "live.com": "outlook.com",
+    "msn.com": "outlook.com",
+    "ymail.com": "yahoo.com",
+}
+
+# Clave del límite global (todos los dominios): cada mensaje ocupa también un hueco aquí
+GLOBAL = "*"
+
+
+class TokenBucket:
+    """
+    Token bucket asíncrono: `rate` tokens/seg con ráfaga máxima de `burst`.
+
+    rate <= 0 desactiva el límite (acquire() vuelve de inmediato).
+    """
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._last = now
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Segundos hasta poder consumir `tokens` (0 = ya), sin consumir."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        return 0.0 if self._tokens >= tokens else (tokens - self._tokens) / self.rate
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Consume si hay saldo y devuelve 0; si no, devuelve los segundos a esperar."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        # El lock hace que los que esperan salgan en orden FIFO.
+        async with self._lock:
+            while True:
+                wait = self.try_acquire(tokens)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+
+def parse_limit(spec: str) -> Tuple[float, int]:
+    """"5" -> (5.0, 0); "5:4" -> 5 msgs/seg y 4 en vuelo; ":4" -> solo en vuelo."""
+    rate, _, in_flight = str(spec).partition(":")
+    return float(rate or 0), int(in_flight or 0)
+
+
+def recipient_domain(addr: str) -> str:
+    return addr.rpartition("@")[2].strip().lower()
+
+
+class DomainLimiter:
+    """
+    Token bucket + máximo de envíos en vuelo por dominio de destino.
+
+    `limits` = {dominio: (msgs/seg, en_vuelo)}; el resto de dominios usa
+    (`rate`, `max_in_flight`). 0 = sin límite. Los alias (googlemail.com ->
+    gmail.com) comparten límites. Un mensaje con varios destinatarios ocupa
+    un hueco en cada dominio distinto, y los toma todos o ninguno.
+    `global_limit` = (msgs/seg, en_vuelo) de todos los envíos juntos (clave GLOBAL).
+    """
+
+    # Espera máxima entre comprobaciones si no llega un release
+    poll = 1.0
+
+    def __init__(self, rate: float = 0.0, max_in_flight: int = 0,
+                 limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 aliases: Optional[Dict[str, str]] = None,
+                 global_limit: Tuple[float, int] = (0.0, 0)) -> None:
+        self.rate = rate
+        self.max_in_flight = max_in_flight
+        self.aliases = {k.lower(): v.lower() for k, v in (PROVIDER_ALIASES if aliases is None else aliases).items()}
+        self.limits = {self.key(d): lim for d, lim in (limits or {}).items()}
+        if any(global_limit):
+            self.limits[GLOBAL] = global_limit
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._cursor: Dict[str, float] = {}
+        # Se activa en cada release (y en put del DomainScheduler): despierta a quien espera hueco
+        self.changed = asyncio.Event()
+        self.waits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rate or self.max_in_flight or self.limits)
+
+    def key(self, domain: str) -> str:
+        domain = domain.lower()
+        return self.aliases.get(domain, domain)
+
+    def _limit(self, key: str) -> Tuple[float, int]:
+        return self.limits.get(key, (self.rate, self.max_in_flight))
+
+    def keys(self, domains: Iterable[str]) -> List[str]:
+        """Claves con límite para esos dominios (ordenadas, sin repetir; GLOBAL si lo hay)."""
+        out = set()
+        for d in domains:
+            k = self.key(d)
+            if any(self._limit(k)):
+                out.add(k)
+        if GLOBAL in self.limits:
+            out.add(GLOBAL)
+        return sorted(out)
+
+    def _bucket(self, key: str) -> TokenBucket:
+        b = self._buckets.get(key)
+        if b is None:
+            rate = self._limit(key)[0]
+            b = self._buckets[key] = TokenBucket(rate, burst=max(1.0, rate))
+        return b
+
+    def try_acquire(self, keys: List[str]) -> float:
+        """Toma un hueco en todas las claves y devuelve 0, o los segundos a esperar (inf = hasta un release)."""
+        wait = 0.0
+        for k in keys:
+            cap = self._limit(k)[1]
+            if cap and self._in_flight.get(k, 0) >= cap:
+                return float("inf")
+            wait = max(wait, self._bucket(k).wait_time())
+        if wait > 0:
+            return wait
+        for k in keys:
+            self._bucket(k).try_acquire()
+            self._in_flight[k] = self._in_flight.get(k, 0) + 1
+        return 0.0
+
+    def release(self, keys: List[str]) -> None:
+        for k in keys:
+            n = self._in_flight.get(k, 0) - 1
+            if n > 0:
+                self._in_flight[k] = n
+            else:
+                self._in_flight.pop(k, None)
+        self.changed.set()
+
+    async def wait_changed(self, timeout: float) -> None:
+        self.changed.clear()
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout=min(timeout, self.poll))
+        except asyncio.TimeoutError:
+            pass
+
+    async def acquire(self, domains: Iterable[str]) -> List[str]:
+        """Espera hueco en los dominios de `domains`; devuelve las claves para release()."""
+        keys = self.keys(domains)
+        if not keys:
+            return keys
+        first = True
+        while (wait := self.try_acquire(keys)) > 0:
+            if first:
+                self.waits += 1
+                first = False
+            await self.wait_changed(wait)
+        return keys
+
+    def defer_delay(self, domains: Iterable[str]) -> float:
+        """
+        Para quien no puede esperar en memoria (workers de la cola): cuándo
+        volver a intentarlo. Los aplazados de un mismo dominio se reparten
+        a su ritmo (1/rate) en vez de volver todos a la vez.
+        """
+        now = time.monotonic()
+        delay = 0.0
+        for k in self.keys(domains):
+            rate = self._limit(k)[0]
+            step = 1.0 / rate if rate > 0 else 0.05
+            at = self._cursor[k] = max(now, self._cursor.get(k, 0.0)) + step
+            delay = max(delay, at - now)
+        return delay
+
+
+_SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key    TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    last   REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    n   INTEGER NOT NULL,
+    PRIMARY KEY (key, pid)
+) WITHOUT ROWID;
+"""
+
+
+def pid_alive(pid: int) -> bool:
+    """¿Existe el proceso `pid` en esta máquina? (0 = sin dueño conocido -> no)."""
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sqlite_busy(e: sqlite3.OperationalError) -> bool:
+    """¿El error es "database is locked/busy" (otro proceso tiene el lock)?"""
+    return "locked" in str(e) or "busy" in str(e)
+
+
+class SharedDomainLimiter(DomainLimiter):
+    """
+    DomainLimiter coordinado entre procesos de la misma máquina (uvicorn
+    --workers N) a través de SQLite: los tokens de cada clave y los envíos
+    en vuelo (por pid) viven en `path`, así que N workers se reparten los
+    msgs/seg y los huecos en vez de multiplicarlos.
+
+    Cada try_acquire() es una transacción corta (BEGIN IMMEDIATE, sin fsync)
+    que corre en el event loop, así que nunca espera el lock más de
+    `busy_timeout`: si otro proceso lo tiene, cuenta como "sin hueco, vuelve
+    en `poll` seg", y un release() que no lo consigue queda anotado y se
+    aplica en la siguiente transacción. Un release de otro proceso no
+    despierta a este: quien espera hueco vuelve a mirar cada `poll` segundos.
+    Los huecos de un proceso muerto se liberan al arrancar otro y, como
+    mucho cada `reap_every` seg, cuando un try_acquire() choca con un tope.
+    """
+
+    poll = 0.05
+    busy_timeout = 0.05
+    reap_every = 1.0
+
+    def __init__(self, path: str, rate: float = 0.0, max_in_flight: int = 0,
+                 limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 aliases: Optional[Dict[str, str]] = None,
+                 global_limit: Tuple[float, int] = (0.0, 0)) -> None:
+        super().__init__(rate, max_in_flight, limits, aliases, global_limit)
+        Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.pid = os.getpid()
+        self._db = sqlite3.connect(path, isolation_level=None, timeout=10.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")  # estado efímero: no hace falta sobrevivir a un apagón
+        self._db.executescript(_SHARED_SCHEMA)
+        self._unreleased: List[str] = []  # release() que no consiguió el lock
+        self._last_reap = 0.0
+        self.reap(own=True)
+        # Al arrancar se puede esperar; en marcha (event loop) solo unos ms
+        self._db.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        self.busy = 0
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _reap(self, own: bool = False) -> int:
+        """(Dentro de una transacción) borra los huecos de pids muertos (y, con `own`, los de este pid)."""
+        self._last_reap = time.monotonic()
+        dead = [pid for (pid,) in self._db.execute("SELECT DISTINCT pid FROM leases")
+                if (own and pid == self.pid) or (pid != self.pid and not pid_alive(pid))]
+        for pid in dead:
+            self._db.execute("DELETE FROM leases WHERE pid=?", (pid,))
+        return len(dead)
+
+    def reap(self, own: bool = False) -> int:
+        """
+        Libera los huecos de procesos que ya no existen; con `own`, también
+        los de este pid (al arrancar: un pid reutilizado no hereda nada).
+        """
+        return self._locked(self._reap, own)
+
+    def _locked(self, fn, *args):
+        """fn(*args) en una transacción BEGIN IMMEDIATE que antes aplica los release() pendientes."""
+        pending = len(self._unreleased)
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            if pending:
+                self._db.executemany("UPDATE leases SET n = MAX(0, n - 1) WHERE key=? AND pid=?",
+                                     [(k, self.pid) for k in self._unreleased[:pending]])
+            out = fn(*args)
+        del self._unreleased[:pending]  # solo si la transacción se confirmó
+        return out
+
+    def _in_flight_shared(self, key: str) -> int:
+        (n,) = self._db.execute("SELECT COALESCE(SUM(n), 0) FROM leases WHERE key=?", (key,)).fetchone()
+        return n
+
+    def try_acquire(self, keys: List[str]) -> float:
+        if not keys:
+            return 0.0
+        try:
+            wait = self._locked(self._try_acquire, keys)
+        except sqlite3.OperationalError as e:
+            if not sqlite_busy(e):
+                raise
+            self.busy += 1
+            return self.poll  # lock de otro worker: como si no hubiera hueco todavía
+        if wait == 0:
+            for k in keys:
+                self._in_flight[k] = self._in_flight.get(k, 0) + 1
+        return wait
+
+    def _try_acquire(self, keys: List[str]) -> float:
+        """try_acquire() dentro de la transacción de _locked()."""
+        wait = 0.0
+        tokens: Dict[str, float] = {}
+        now = time.time()  # ya con el lock: otro proceso pudo escribir mientras esperábamos
+        for k in keys:
+            rate, cap = self._limit(k)
+            if cap and self._in_flight_shared(k) >= cap:
+                # ¿Huecos de un worker muerto? Se miran como mucho cada reap_every seg
+                if time.monotonic() - self._last_reap < self.reap_every or not self._reap() \
+                        or self._in_flight_shared(k) >= cap:
+                    return float("inf")
+            if rate > 0:
+                burst = max(1.0, rate)
+                row = self._db.execute("SELECT tokens, last FROM buckets WHERE key=?", (k,)).fetchone()
+                if row is None or row[1] - now > 1.0:
+                    have = burst  # sin estado, o el reloj del sistema saltó hacia atrás
+                else:
+                    have = min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                tokens[k] = have
+                if have < 1.0:
+                    wait = max(wait, (1.0 - have) / rate)
+        if wait > 0:
+            return wait
+        for k in keys:
+            if k in tokens:
+                self._db.execute("INSERT OR REPLACE INTO buckets (key, tokens, last) VALUES (?, ?, ?)",
+                                 (k, tokens[k] - 1.0, now))
+            if self._limit(k)[1]:
+                self._db.execute(
+                    "INSERT INTO leases (key, pid, n) VALUES (?, ?, 1) "
+                    "ON CONFLICT (key, pid) DO UPDATE SET n = n + 1", (k, self.pid))
+        return 0.0
+
+    def release(self, keys: List[str]) -> None:
+        capped = [k for k in keys if self._limit(k)[1]]
+        if capped:
+            self._unreleased.extend(capped)
+            try:
+                self._locked(lambda: None)
+            except sqlite3.OperationalError as e:
+                if not sqlite_busy(e):
+                    raise
+                self.busy += 1  # queda en _unreleased: lo aplica la próxima transacción
+        super().release(keys)
+
+    def shared_state(self) -> Dict[str, Dict[str, float]]:
+        """{clave: {tokens, in_flight}} vistos por todos los procesos (para /limits)."""
+        out: Dict[str, Dict[str, float]] = {}
+        for k, t in self._db.execute("SELECT key, tokens FROM buckets"):
+            out.setdefault(k, {})["tokens"] = round(t, 2)
+        for k, n in self._db.execute("SELECT key, SUM(n) FROM leases GROUP BY key"):
+            out.setdefault(k, {})["in_flight"] = n
+        return out
+
+
+class DomainScheduler:
+    """
+    Cola de trabajos por dominio para N consumidores: get() da el siguiente
+    trabajo de un dominio con hueco en el DomainLimiter, rotando entre
+    dominios, así que un proveedor saturado (gmail) no bloquea a los demás
+    mientras haya trabajo de otros dentro de los `capacity` en espera.
+    """
+
+    def __init__(self, limiter: DomainLimiter, capacity: int) -> None:
+        self.limiter = limiter
+        self.capacity = max(1, capacity)
+        self._queues: Dict[Tuple[str, ...], deque] = {}
+        self._order: deque = deque()  # rotación de claves con trabajo pendiente
+        self._size = 0
+        self._closed = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    async def put(self, domains: Iterable[str], item) -> None:
+        while self._size >= self.capacity:
+            await self.limiter.wait_changed(1.0)
+        keys = tuple(self.limiter.keys(domains))
+        q = self._queues.get(keys)
+        if q is None:
+            q = self._queues[keys] = deque()
+            self._order.append(keys)
+        q.append(item)
+        self._size += 1
+        self.limiter.changed.set()
+
+    def close(self) -> None:
+        """No habrá más put(): get() devuelve None al vaciarse."""
+        self._closed = True
+        self.limiter.changed.set()
+
+    async def get(self):
+        """(claves, trabajo) con el hueco ya tomado (liberar con done(claves)), o None al terminar."""
+        while True:
+            soonest = float("inf")
+            for _ in range(len(self._order)):
+                keys = self._order.popleft()
+                wait = self.limiter.try_acquire(list(keys))
+                if wait == 0:
+                    q = self._queues[keys]
+                    item = q.popleft()
+                    self._size -= 1
+                    if q:
+                        self._order.append(keys)
+                    else:
+                        del self._queues[keys]
+                    self.limiter.changed.set()  # hay sitio para put()
+                    return list(keys), item
+                self._order.append(keys)
+                soonest = min(soonest, wait)
+            if self._closed and not self._size:
+                return None
+            await self.limiter.wait_changed(soonest)
+
+    def done(self, keys: List[str]) -> None:
+        self.limiter.release(keys)
@@ -1,5 +1,21 @@
 #!/usr/bin/env bash
+# uso: app/run.sh          -> desarrollo (un proceso, --reload)
+#      app/run.sh prod     -> producción: WORKERS procesos (por defecto, uno por núcleo)
+#
+# En prod cada worker tiene su propio pool SMTP (SMTP_POOL_MAX por proceso) y
+# los límites globales (SEND_RATE, SEND_MAX_IN_FLIGHT, DOMAIN_*) se reparten
+# entre todos a través de LIMITS_PATH (SQLite). Las métricas de /metrics y
+# /pool son las del worker que responde.
 set -euo pipefail
 export PYTHONUNBUFFERED=1
-uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
-º
\ No newline at end of file
+
+MODE="${1:-dev}"
+HOST="${HOST:-0.0.0.0}"
+PORT="${PORT:-8000}"
+
+if [ "$MODE" = "prod" ]; then
+  export LIMITS_PATH="${LIMITS_PATH:-data/limits.sqlite3}"
+  exec uvicorn app.main:app --host "$HOST" --port "$PORT" \
+    --workers "${WORKERS:-$(nproc)}" --no-access-log --timeout-graceful-shutdown 30
+fi
+uvicorn app.main:app --host "$HOST" --port "$PORT" --reload
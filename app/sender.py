@@ -1,60 +1,287 @@
 from __future__ import annotations
 
 import asyncio
+import binascii
+import email
+import email.policy
+import email.utils
+import random
+import re
+import secrets
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 from email.message import EmailMessage
-from typing import Iterable
+from typing import AsyncIterator, Iterable
 import aiosmtplib
+from aiosmtplib.email import extract_recipients, extract_sender, flatten_message
 
+from . import metrics
+from .dkim import DEFAULT_HEADERS, DkimSigner, DkimTemplate, load_signer
 from .settings import settings
 
 
+class _PooledConnection:
+    """Una sesión SMTP del pool con su contabilidad de uso."""
+
+    __slots__ = ("client", "created_at", "last_used", "messages")
+
+    def __init__(self, client: aiosmtplib.SMTP) -> None:
+        now = time.monotonic()
+        self.client = client
+        self.created_at = now
+        self.last_used = now
+        self.messages = 0
+
+
 class SMTPPool:
-    def __init__(self) -> None:
-        self._lock = asyncio.Lock()
-        self._client: aiosmtplib.SMTP | None = None
+    """
+    Pool acotado de conexiones SMTP.
 
-    async def _ensure_client(self) -> aiosmtplib.SMTP:
-        if self._client is not None and getattr(self._client, "is_connected", False):
-            return self._client
+    - Entre SMTP_POOL_MIN y SMTP_POOL_MAX sesiones abiertas.
+    - NOOP antes de reutilizar una sesión que lleva ociosa más de
+      SMTP_POOL_HEALTHCHECK_SECS (0 = siempre).
+    - Las sesiones ociosas más de SMTP_POOL_IDLE_SECS se cierran (respetando el mínimo).
+    - Cada sesión se recicla tras SMTP_POOL_MAX_MESSAGES mensajes.
+    - Una sesión que el servidor corta (SMTPServerDisconnected) se descarta;
+      el reintento es cosa de send_with_retries (una sola capa de reintentos).
+    - Con `signer` (DKIM) los EmailMessage se firman al enviarlos; un
+      PreparedMessage ya lleva la firma de su MessageFactory.
+    """
 
+    def __init__(
+        self,
+        min_size: int | None = None,
+        max_size: int | None = None,
+        idle_timeout: float | None = None,
+        max_messages: int | None = None,
+        healthcheck_after: float | None = None,
+        signer: DkimSigner | None = None,
+    ) -> None:
+        self.signer = signer
+        self.max_size = max(1, max_size or getattr(settings, "SMTP_POOL_MAX", 8))
+        self.min_size = min(self.max_size, max(0, min_size if min_size is not None else getattr(settings, "SMTP_POOL_MIN", 1)))
+        self.idle_timeout = idle_timeout if idle_timeout is not None else getattr(settings, "SMTP_POOL_IDLE_SECS", 60.0)
+        self.max_messages = max_messages or getattr(settings, "SMTP_POOL_MAX_MESSAGES", 500)
+        self.healthcheck_after = (
+            healthcheck_after if healthcheck_after is not None
+            else getattr(settings, "SMTP_POOL_HEALTHCHECK_SECS", 5.0)
+        )
+
+        self._slots = asyncio.Semaphore(self.max_size)
+        self._idle: deque[_PooledConnection] = deque()
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+
+        # Métricas acumuladas (ver stats())
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._checkout_total = 0.0
+        self._checkout_max = 0.0
+        self._created = 0
+        self._recycled = 0
+        self._evicted = 0
+        self._healthcheck_failures = 0
+        self._reconnects = 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
         timeout = getattr(settings, "SMTP_TIMEOUT", getattr(settings, "TIMEOUT", 60.0))
         use_ssl = bool(getattr(settings, "SMTP_SSL", False))            # ← TLS implícito (465)
         do_starttls = bool(getattr(settings, "SMTP_STARTTLS", False))   # ← STARTTLS (587)
 
         if use_ssl:
             # SMTPS (TLS implícito), típico puerto 465
-            self._client = aiosmtplib.SMTP(
+            client = aiosmtplib.SMTP(
                 hostname=settings.SMTP_HOST,
                 port=settings.SMTP_PORT,
                 use_tls=True,
                 timeout=timeout,
             )
-            await self._client.connect()
+            await client.connect()
         else:
             # Conexión en claro, con opción STARTTLS
-            self._client = aiosmtplib.SMTP(
+            client = aiosmtplib.SMTP(
                 hostname=settings.SMTP_HOST,
                 port=settings.SMTP_PORT,
                 start_tls=False,
                 timeout=timeout,
             )
-            await self._client.connect()
+            await client.connect()
             if do_starttls:
-                await self._client.starttls()
+                await client.starttls()
 
         # Login solo si hay credenciales
         if getattr(settings, "SMTP_USER", ""):
-            await self._client.login(settings.SMTP_USER, getattr(settings, "SMTP_PASS", ""))
+            password = getattr(settings, "SMTP_PASS", "")
+            if hasattr(password, "get_secret_value"):
+                password = password.get_secret_value()
+            await client.login(settings.SMTP_USER, password)
 
-        return self._client
+        self._created += 1
+        return client
 
-    async def send(self, msg: EmailMessage):
-        async with self._lock:
-            client = await self._ensure_client()
-            return await client.send_message(msg)
+    async def _close(self, conn: _PooledConnection) -> None:
+        self._open -= 1
+        try:
+            if conn.client.is_connected:
+                await conn.client.quit()
+        except Exception:
+            conn.client.close()
+
+    def _expired(self, conn: _PooledConnection) -> bool:
+        return conn.messages >= self.max_messages or not conn.client.is_connected
 
+    async def _reap_idle(self) -> None:
+        """Cierra sesiones ociosas de más, conservando min_size abiertas."""
+        now = time.monotonic()
+        while self._idle and self._open > self.min_size:
+            oldest = self._idle[0]
+            if now - oldest.last_used < self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._evicted += 1
+            await self._close(oldest)
 
-pool = SMTPPool()
+    async def _checkout_idle(self) -> _PooledConnection | None:
+        while self._idle:
+            conn = self._idle.pop()  # LIFO: la más caliente primero
+            now = time.monotonic()
+            if self._expired(conn):
+                self._recycled += 1
+                await self._close(conn)
+                continue
+            if now - conn.last_used >= self.healthcheck_after:
+                try:
+                    await conn.client.noop()
+                except Exception:
+                    self._healthcheck_failures += 1
+                    await self._close(conn)
+                    continue
+            return conn
+        return None
+
+    async def acquire(self) -> _PooledConnection:
+        t0 = time.monotonic()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        waited = time.monotonic() - t0
+
+        try:
+            await self._reap_idle()
+            conn = await self._checkout_idle()
+            if conn is None:
+                self._open += 1
+                try:
+                    conn = _PooledConnection(await self._connect())
+                except BaseException:
+                    self._open -= 1
+                    raise
+        except BaseException:
+            self._slots.release()
+            raise
+
+        self._in_use += 1
+        elapsed = time.monotonic() - t0
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._checkout_total += elapsed
+        self._checkout_max = max(self._checkout_max, elapsed)
+        metrics.pool_wait.observe(waited)
+        metrics.pool_checkout.observe(elapsed)
+        return conn
+
+    async def release(self, conn: _PooledConnection, discard: bool = False) -> None:
+        self._in_use -= 1
+        try:
+            conn.last_used = time.monotonic()
+            if discard or self._expired(conn):
+                if not discard:
+                    self._recycled += 1
+                await self._close(conn)
+            else:
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[_PooledConnection]:
+        conn = await self.acquire()
+        discard = False
+        try:
+            yield conn
+        except aiosmtplib.SMTPServerDisconnected:
+            discard = True
+            self._reconnects += 1  # el siguiente acquire abre una sesión nueva
+            raise
+        finally:
+            await self.release(conn, discard=discard or not conn.client.is_connected)
+
+    async def _transmit(self, conn: _PooledConnection, msg: "EmailMessage | PreparedMessage", **kwargs):
+        t0 = time.perf_counter()
+        try:
+            if isinstance(msg, PreparedMessage):
+                result = await msg.send(conn.client, **kwargs)
+            elif self.signer is not None:
+                result = await _send_signed(conn.client, msg, self.signer, **kwargs)
+            else:
+                result = await conn.client.send_message(msg, **kwargs)
+        except BaseException:
+            metrics.smtp_send.observe(time.perf_counter() - t0, "error")
+            raise
+        metrics.smtp_send.observe(time.perf_counter() - t0, "ok")
+        conn.messages += 1
+        return result
+
+    async def send(self, msg: "EmailMessage | PreparedMessage", **kwargs):
+        """Un intento por una sesión del pool (sin reintentos: send_with_retries)."""
+        async with self.connection() as conn:
+            return await self._transmit(conn, msg, **kwargs)
+
+    async def start(self) -> None:
+        """Precalienta min_size conexiones (errores se ignoran: se reintenta al usar)."""
+        while self._open < self.min_size:
+            try:
+                conn = await self.acquire()
+            except Exception:
+                return
+            await self.release(conn)
+
+    async def close(self) -> None:
+        while self._idle:
+            await self._close(self._idle.pop())
+
+    def stats(self) -> dict:
+        checkouts = self._checkouts or 1
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "open": self._open,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "checkouts": self._checkouts,
+            "wait_avg_ms": round(self._wait_total / checkouts * 1000, 3),
+            "wait_max_ms": round(self._wait_max * 1000, 3),
+            "checkout_avg_ms": round(self._checkout_total / checkouts * 1000, 3),
+            "checkout_max_ms": round(self._checkout_max * 1000, 3),
+            "created": self._created,
+            "recycled": self._recycled,
+            "evicted": self._evicted,
+            "healthcheck_failures": self._healthcheck_failures,
+            "reconnects": self._reconnects,
+        }
+
+
+# Claves DKIM cargadas y parseadas una vez, al importar (arranque de la API)
+dkim = load_signer(getattr(settings, "DKIM_KEYS", {}), getattr(settings, "DKIM_SELECTOR", "mail"),
+                   getattr(settings, "DKIM_HEADERS", None) or DEFAULT_HEADERS)
+pool = SMTPPool(signer=dkim)
 
 
 def make_from_header(domain: str | None) -> str:
@@ -65,6 +292,66 @@ def make_from_header(domain: str | None) -> str:
     return f'{display} <{addr}>'
 
 
+# Cabecera To de un envío agrupado: los destinatarios van solo en el sobre (RCPT TO)
+UNDISCLOSED_TO = "undisclosed-recipients:;"
+
+# Bloques de cabeceras constantes ya parseados por la policy, por (subject, from_domain, headers).
+# En campañas/plantillas se repiten para todos los destinatarios. Son objetos header de
+# policy.header_factory: msg[nombre] = header los reutiliza sin volver a parsear (_add_headers).
+_HEADER_BLOCKS: dict[tuple, list] = {}
+_HEADER_BLOCKS_MAX = 1024
+
+
+def _header_block(subject: str, from_domain: str | None, headers: dict[str, str] | None) -> list:
+    key = (subject, from_domain, tuple(headers.items()) if headers else ())
+    block = _HEADER_BLOCKS.get(key)
+    if block is None:
+        proto = EmailMessage()
+        proto["Subject"] = subject
+        proto["From"] = make_from_header(from_domain)
+        if headers:
+            for k, v in headers.items():
+                if k.lower() not in {"from", "to", "subject"}:
+                    proto[k] = v
+        if "List-Unsubscribe" not in proto:
+            proto["List-Unsubscribe"] = "<mailto:unsubscribe@send.horus.com>"
+        block = proto.items()  # [(nombre, header ya parseado)]
+        if len(_HEADER_BLOCKS) >= _HEADER_BLOCKS_MAX:
+            _HEADER_BLOCKS.clear()
+        _HEADER_BLOCKS[key] = block
+    return block
+
+
+def _add_headers(msg: EmailMessage, block: list) -> None:
+    for name, header in block:
+        msg[name] = header  # EmailPolicy.header_store_parse: header ya parseado -> tal cual
+
+
+def _compose(
+    to: str | None,
+    subject: str,
+    text: str | None,
+    html: str | None,
+    headers: dict[str, str] | None,
+    from_domain: str | None,
+) -> EmailMessage:
+    if not text and not html:
+        text = "(sin contenido)"
+
+    msg = EmailMessage()
+    # Subject/From/cabeceras extra/List-Unsubscribe: copia del bloque cacheado
+    _add_headers(msg, _header_block(subject, from_domain, headers))
+    if to is not None:
+        msg["To"] = to
+
+    if text:
+        msg.set_content(text)
+    if html:
+        msg.add_alternative(html, subtype="html")
+
+    return msg
+
+
 def build_message(
     to: Iterable[str],
     subject: str,
@@ -74,6 +361,7 @@ def build_message(
     from_domain: str | None = None,
     body_text: str | None = None,
     body_html: str | None = None,
+    undisclosed: bool = False,
 ) -> EmailMessage:
     # Compat: aceptar body_text/body_html
     if body_text is not None and text is None:
@@ -81,38 +369,401 @@ def build_message(
     if body_html is not None and html is None:
         html = body_html
 
-    if not text and not html:
-        text = "(sin contenido)"
+    return _compose(UNDISCLOSED_TO if undisclosed else ", ".join(to), subject, text, html, headers, from_domain)
 
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = make_from_header(from_domain)
-    msg["To"] = ", ".join(to)
 
-    if headers:
-        for k, v in headers.items():
-            if k.lower() not in {"from", "to", "subject"}:
-                msg[k] = v
+# --------------------------- Fast path MIME ----------------------------------
 
-    if text:
-        msg.set_content(text)
-    if html:
-        msg.add_alternative(html, subtype="html")
+_TEXT_TOKEN = b"@@BODY-TEXT-3f9c@@"
+_HTML_TOKEN = b"@@BODY-HTML-3f9c@@"
 
-    if "List-Unsubscribe" not in msg:
-        msg["List-Unsubscribe"] = "<mailto:unsubscribe@send.horus.com>"
 
-    return msg
+def _encode_body(body: str, cte_type: str) -> tuple[str, bytes]:
+    """
+    (cte, bytes con CRLF) de una parte de texto. Cuerpo tal cual (7bit/8bit)
+    si las líneas caben en el límite de RFC 5322; si no, quoted-printable
+    (binascii, en C) en lugar de la heurística en Python de la policy.
+    """
+    raw = body.encode("utf-8")
+    lines = raw.splitlines()
+    is_ascii = raw.isascii()
+    if max((len(x) for x in lines), default=0) <= 998 and (is_ascii or cte_type == "8bit"):
+        return ("7bit" if is_ascii else "8bit"), b"\r\n".join(lines) + b"\r\n"
+    qp = binascii.b2a_qp(b"\n".join(lines) + b"\n", istext=True)
+    return "quoted-printable", qp.replace(b"\n", b"\r\n")
+
 
+class _Prototype:
+    """
+    Mensaje sin To para unos cuerpos concretos, serializado una vez por
+    cte_type ("8bit"/"7bit"), con su plantilla DKIM (bh= y cabeceras
+    canonicalizadas) si el dominio firma.
+    """
 
-async def send_with_retries(msg: EmailMessage, retries: int | None = None):
+    __slots__ = ("factory", "key", "sender", "_flat", "_dkim")
+
+    def __init__(self, factory: "MessageFactory", key: tuple, sender: str) -> None:
+        self.factory = factory
+        self.key = key
+        self.sender = sender
+        self._flat: dict[str, bytes] = {}
+        self._dkim: dict[str, DkimTemplate | None] = {}
+
+    def flat(self, cte_type: str) -> bytes:
+        data = self._flat.get(cte_type)
+        if data is None:
+            data = self._flat[cte_type] = self.factory._serialize(self.key, cte_type)
+        return data
+
+    def dkim(self, cte_type: str) -> DkimTemplate | None:
+        if cte_type not in self._dkim:
+            self._dkim[cte_type] = self.factory.signer.template(_domain_of(self.sender), self.flat(cte_type))
+        return self._dkim[cte_type]
+
+
+class PreparedMessage:
+    """
+    Mensaje listo para DATA: cabeceras y partes MIME vienen del prototipo
+    cacheado; por destinatario solo se antepone la línea To.
+    """
+
+    __slots__ = ("sender", "recipients", "to_line", "proto")
+
+    def __init__(self, proto: _Prototype, recipients: list[str], to_line: bytes) -> None:
+        self.sender = proto.sender
+        self.recipients = recipients
+        self.to_line = to_line
+        self.proto = proto
+
+    def data(self, cte_type: str = "8bit") -> bytes:
+        signer = self.proto.factory.signer
+        if signer is not None:
+            tpl = self.proto.dkim(cte_type)
+            if tpl is not None:
+                # Cuerpo y cabeceras constantes ya canonicalizados: solo To + firma
+                return signer.signature(tpl, self.to_line) + self.to_line + self.proto.flat(cte_type)
+        return self.to_line + self.proto.flat(cte_type)
+
+    def as_message(self) -> EmailMessage:
+        """EmailMessage equivalente (para inspección; el envío usa data())."""
+        return email.message_from_bytes(self.data(), _class=EmailMessage, policy=email.policy.default)
+
+    async def send(self, client: aiosmtplib.SMTP, **kwargs):
+        # Mismo criterio que SMTP.send_message: 8BITMIME si el servidor lo anuncia.
+        if client.is_ehlo_or_helo_needed:
+            try:
+                await client.ehlo()
+            except aiosmtplib.SMTPHeloError:
+                await client.helo()
+        if client.supports_extension("8BITMIME"):
+            mail_options, cte_type = ["BODY=8BITMIME"], "8bit"
+        else:
+            mail_options, cte_type = [], "7bit"
+        return await client.sendmail(
+            self.sender, kwargs.pop("recipients", self.recipients), self.data(cte_type),
+            mail_options=mail_options, **kwargs,
+        )
+
+
+class MessageFactory:
+    """
+    build() equivalente a build_message sin pasar por la policy de email en
+    cada mensaje:
+
+    - Esqueleto: cabeceras + estructura MIME (boundary y cabeceras de cada
+      parte) serializados una vez por (subject, from_domain, headers, CTEs).
+      Por mensaje solo se codifican los cuerpos y se concatenan bytes.
+    - Mensajes completos (LRU) por cuerpos idénticos: solo cambia el To.
+
+    Direcciones no ASCII (SMTPUTF8) van por la ruta normal de EmailMessage.
+    Con `signer` (DKIM) el hash del cuerpo se calcula una vez por prototipo.
+    """
+
+    def __init__(self, max_size: int | None = None, signer: DkimSigner | None = None) -> None:
+        self.max_size = max(1, max_size or getattr(settings, "MIME_CACHE_SIZE", 256))
+        self.signer = signer
+        self._protos: OrderedDict[tuple, _Prototype] = OrderedDict()
+        self._skeletons: dict[tuple, tuple[bytes, ...]] = {}
+        self._senders: dict[str | None, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _skeleton(self, subject, from_domain, headers, text_cte, html_cte) -> tuple[bytes, ...]:
+        key = (subject, from_domain, headers, text_cte, html_cte)
+        skel = self._skeletons.get(key)
+        if skel is not None:
+            return skel
+
+        msg = EmailMessage()
+        _add_headers(msg, _header_block(subject, from_domain, dict(headers) if headers else None))
+        if text_cte:
+            msg.set_content(_TEXT_TOKEN.decode("ascii"), cte=text_cte)
+        if html_cte:
+            msg.add_alternative(_HTML_TOKEN.decode("ascii"), subtype="html", cte=html_cte)
+        if msg.is_multipart():
+            msg.set_boundary("=_" + secrets.token_hex(16))
+        flat = flatten_message(msg, cte_type="8bit")
+
+        # Trozos constantes alrededor de cada cuerpo
+        pieces: list[bytes] = []
+        rest = flat
+        for token, cte in ((_TEXT_TOKEN, text_cte), (_HTML_TOKEN, html_cte)):
+            if cte:
+                head, rest = rest.split(token + b"\r\n", 1)
+                pieces.append(head)
+        pieces.append(rest)
+        skel = (msg.get_boundary() or "").encode("ascii"), *pieces
+        if len(self._skeletons) >= _HEADER_BLOCKS_MAX:
+            self._skeletons.clear()
+        self._skeletons[key] = skel
+        return skel
+
+    def _serialize(self, key: tuple, cte_type: str) -> bytes:
+        subject, from_domain, headers, text, html = key
+        text_cte = html_cte = None
+        bodies: list[bytes] = []
+        if text:
+            text_cte, data = _encode_body(text, cte_type)
+            bodies.append(data)
+        if html:
+            html_cte, data = _encode_body(html, cte_type)
+            bodies.append(data)
+        boundary, *pieces = self._skeleton(subject, from_domain, headers, text_cte, html_cte)
+        if boundary and any(boundary in b for b in bodies):
+            # Colisión (improbable) con el boundary: ruta normal
+            return flatten_message(_compose(None, subject, text, html, dict(headers) if headers else None, from_domain),
+                                   cte_type=cte_type)
+        out = [pieces[0]]
+        for body, piece in zip(bodies, pieces[1:]):
+            out.append(body)
+            out.append(piece)
+        return b"".join(out)
+
+    def _sender(self, from_domain: str | None) -> str:
+        sender = self._senders.get(from_domain)
+        if sender is None:
+            sender = self._senders[from_domain] = email.utils.parseaddr(make_from_header(from_domain))[1]
+        return sender
+
+    def _prototype(self, subject, text, html, headers, from_domain) -> _Prototype:
+        if not text and not html:
+            text = "(sin contenido)"
+        key = (subject, from_domain, tuple(headers.items()) if headers else (), text, html)
+        proto = self._protos.get(key)
+        if proto is not None:
+            self.hits += 1
+            self._protos.move_to_end(key)
+            return proto
+        self.misses += 1
+        proto = _Prototype(self, key, self._sender(from_domain))
+        self._protos[key] = proto
+        if len(self._protos) > self.max_size:
+            self._protos.popitem(last=False)
+        return proto
+
+    def build(
+        self,
+        to: Iterable[str],
+        subject: str,
+        text: str | None = None,
+        html: str | None = None,
+        headers: dict[str, str] | None = None,
+        from_domain: str | None = None,
+        undisclosed: bool = False,
+    ) -> "PreparedMessage | EmailMessage":
+        """
+        Con `undisclosed` el To es "undisclosed-recipients:;" y los
+        destinatarios solo van en el sobre: un DATA para N RCPT TO sin que
+        se vean entre ellos.
+        """
+        to = list(to)
+        value = UNDISCLOSED_TO if undisclosed else ", ".join(to)
+        if not "".join(to).isascii():
+            return build_message(to, subject, text=text, html=html, headers=headers, from_domain=from_domain,
+                                 undisclosed=undisclosed)
+
+        proto = self._prototype(subject, text, html, headers, from_domain)
+        if len(value) < 900:
+            to_line = b"To: " + value.encode("ascii") + b"\r\n"
+        else:
+            to_line = email.policy.SMTP.fold_binary("To", value)
+        return PreparedMessage(proto, to, to_line)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._protos),
+            "max_size": self.max_size,
+            "skeletons": len(self._skeletons),
+            "hits": self.hits,
+            "misses": self.misses,
+            "dkim_domains": sorted(self.signer.keys) if self.signer is not None else [],
+        }
+
+
+factory = MessageFactory(signer=dkim)
+
+
+def _domain_of(addr: str) -> str:
+    return addr.rpartition("@")[2].lower()
+
+
+async def _send_signed(client: aiosmtplib.SMTP, msg: EmailMessage, signer: DkimSigner, **kwargs):
+    """SMTP.send_message con firma DKIM sobre los bytes que salen por DATA (ruta EmailMessage)."""
+    sender = extract_sender(msg)
+    recipients = kwargs.pop("recipients", None) or extract_recipients(msg)
+    if client.is_ehlo_or_helo_needed:
+        try:
+            await client.ehlo()
+        except aiosmtplib.SMTPHeloError:
+            await client.helo()
+    mail_options = []
+    utf8 = not (sender + "".join(recipients)).isascii()
+    if utf8:
+        if not client.supports_extension("smtputf8"):
+            raise aiosmtplib.SMTPNotSupported("Dirección no ASCII y el servidor no anuncia SMTPUTF8")
+        mail_options.append("SMTPUTF8")
+    if client.supports_extension("8BITMIME"):
+        mail_options.append("BODY=8BITMIME")
+        cte_type = "8bit"
+    else:
+        cte_type = "7bit"
+    data = signer.sign(_domain_of(sender or ""), flatten_message(msg, utf8=utf8, cte_type=cte_type))
+    return await client.sendmail(sender, recipients, data, mail_options=mail_options, **kwargs)
+
+
+# --------------------------- Clasificación de errores ------------------------
+
+PERMANENT = "permanent"    # 5xx: buzón inexistente, rechazo de contenido... reintentar no sirve
+TRANSIENT = "transient"    # 4xx: greylisting, cuota, "try again later" -> cola de reintentos
+CONNECTION = "connection"  # red, timeouts, caída de sesión, HELO/AUTH -> reintento rápido y luego cola
+
+_CONNECTION_ERRORS = (
+    aiosmtplib.SMTPConnectError, aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPTimeoutError,
+    aiosmtplib.SMTPHeloError, aiosmtplib.SMTPAuthenticationError, aiosmtplib.SMTPNotSupported,
+    OSError, asyncio.TimeoutError,
+)
+# "try again in 5 minutes", "retry after 120 seconds", "please retry in 1 hour"...
+_RETRY_HINT = re.compile(r"(?:retry|try\s+again)\D{0,20}?(\d+)\s*(s|sec|second|m|min|minute|h|hour|hr)?", re.I)
+_UNIT_SECS = {"s": 1, "sec": 1, "second": 1, "m": 60, "min": 60, "minute": 60, "h": 3600, "hour": 3600, "hr": 3600}
+
+
+class SendError(Exception):
+    """Fallo de envío clasificado (PERMANENT / TRANSIENT / CONNECTION)."""
+
+    def __init__(self, error_class: str, message: str, code: int | None = None,
+                 retry_after: float | None = None, recipients: dict[str, "SendError"] | None = None) -> None:
+        super().__init__(message)
+        self.error_class = error_class
+        self.code = code
+        self.retry_after = retry_after
+        self.recipients = recipients or {}  # RCPT TO rechazados: dirección -> su propio SendError
+
+    @property
+    def retryable(self) -> bool:
+        return self.error_class != PERMANENT
+
+    def as_dict(self) -> dict:
+        return {"error": str(self), "error_class": self.error_class, "code": self.code}
+
+
+def _retry_hint(text: str) -> float | None:
+    m = _RETRY_HINT.search(text or "")
+    if not m:
+        return None
+    return int(m.group(1)) * _UNIT_SECS.get((m.group(2) or "s").lower(), 1)
+
+
+def _refused(recipient: str, code: int, message: str) -> SendError:
+    """Un RCPT TO rechazado (en SMTPRecipientsRefused o en el dict de errores de sendmail)."""
+    cls = PERMANENT if code >= 500 else TRANSIENT
+    return SendError(cls, f"{recipient}: {code} {message}", code, _retry_hint(message))
+
+
+def classify(exc: BaseException) -> SendError:
+    """Excepción de aiosmtplib (o de red) -> SendError con su clase, código SMTP y pista de reintento."""
+    if isinstance(exc, SendError):
+        return exc
+    name = type(exc).__name__
+    if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        codes = [r.code for r in exc.recipients]
+        text = "; ".join(f"{r.recipient}: {r.code} {r.message}" for r in exc.recipients)
+        cls = PERMANENT if codes and all(c >= 500 for c in codes) else TRANSIENT
+        return SendError(cls, f"{name}: {text}", min(codes) if codes else None, _retry_hint(text),
+                         {r.recipient: _refused(r.recipient, r.code, r.message) for r in exc.recipients})
+    if isinstance(exc, _CONNECTION_ERRORS):
+        code = getattr(exc, "code", None)
+        return SendError(CONNECTION, f"{name}: {exc}", code if isinstance(code, int) and code > 0 else None)
+    if isinstance(exc, aiosmtplib.SMTPResponseException):
+        cls = PERMANENT if exc.code >= 500 else TRANSIENT if exc.code >= 400 else CONNECTION
+        return SendError(cls, f"{name}: {exc.code} {exc.message}", exc.code, _retry_hint(exc.message))
+    # Errores nuestros (mensaje inválido, etc.): reintentar daría lo mismo
+    return SendError(PERMANENT, f"{name}: {exc}")
+
+
+def recipient_errors(recipients: list[str], result=None, error: SendError | None = None) -> list[SendError | None]:
+    """
+    Resultado de cada destinatario de un envío con varios RCPT TO, en el
+    orden de `recipients` (None = aceptado). Envío correcto: los que sendmail
+    devolvió como rechazados; envío fallido: el rechazo de su RCPT si lo
+    hubo, si no el error del envío (un 451 en DATA vale para todos).
+    """
+    if error is None:
+        refused = result[0] if result else {}
+        return [None if (resp := refused.get(rcpt)) is None else _refused(rcpt, resp.code, resp.message)
+                for rcpt in recipients]
+    return [error.recipients.get(rcpt, error) for rcpt in recipients]
+
+
+def retry_delay(attempt: int, hint: float | None = None) -> float:
+    """
+    Espera antes del reintento programado nº `attempt` (1, 2, ...):
+    RETRY_BACKOFF_SECS * 2^(attempt-1) hasta RETRY_MAX_DELAY_SECS, con jitter
+    (entre la mitad y el total) para que no vuelvan todos a la vez. Si el
+    servidor pidió un plazo ("try again in 5 minutes") no se vuelve antes.
+    """
+    base = getattr(settings, "RETRY_BACKOFF_SECS", 2.0)
+    cap = getattr(settings, "RETRY_MAX_DELAY_SECS", 1800.0)
+    delay = min(cap, base * 2 ** max(0, attempt - 1))
+    delay = random.uniform(delay / 2, delay)
+    if hint:
+        delay = max(delay, min(hint, cap) * random.uniform(1.0, 1.1))
+    return delay
+
+
+async def send_with_retries(msg: "EmailMessage | PreparedMessage", retries: int | None = None,
+                            recipients: list[str] | None = None):
+    """
+    Envía por el pool. Solo los errores de conexión se reintentan aquí (backoff
+    corto desde 0.5s, hasta RETRIES intentos en total); permanentes y
+    transitorios salen al momento como SendError para que el llamador decida
+    (la cola programa los transitorios sin bloquear la petición). Si el primer
+    intento encuentra la sesión del pool cortada (murió entre el NOOP y el
+    envío), el segundo sale sin esperar por una sesión nueva.
+
+    `recipients` fija el sobre (RCPT TO) cuando no sale de las cabeceras
+    (To "undisclosed-recipients:;").
+    """
     retries = retries or getattr(settings, "RETRIES", 3)
+    kwargs = {"recipients": recipients} if recipients else {}
     delay = 0.5
-    for attempt in range(retries):
-        try:
-            return await pool.send(msg)
-        except Exception:
-            if attempt == retries - 1:
-                raise
-            await asyncio.sleep(delay)
-            delay = min(delay * 2, 8.0)
+    metrics.sends_in_flight.inc()
+    try:
+        for attempt in range(retries):
+            try:
+                result = await pool.send(msg, **kwargs)
+                metrics.messages.inc("sent")
+                return result
+            except Exception as e:
+                err = classify(e)
+                metrics.send_errors.inc(type(e).__name__)
+                if err.error_class != CONNECTION or attempt == retries - 1:
+                    metrics.messages.inc("failed")
+                    metrics.send_failures.inc(err.error_class)
+                    raise err from e
+                stale = attempt == 0 and isinstance(e, aiosmtplib.SMTPServerDisconnected)
+            metrics.send_retries.inc()
+            if not stale:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 8.0)
+    finally:
+        metrics.sends_in_flight.dec()
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from typing import Dict, List, Optional
-from pydantic import BaseModel, EmailStr, Field, HttpUrl, SecretStr, field_validator
+from pydantic import BaseModel, EmailStr, Field, HttpUrl, SecretStr, field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -13,10 +13,41 @@ class Settings(BaseSettings):
     SMTP_STARTTLS: bool = False
     SMTP_TIMEOUT: float = 60.0
 
+    # === Pool SMTP ===
+    SMTP_POOL_MIN: int = 1
+    SMTP_POOL_MAX: int = 8
+    SMTP_POOL_IDLE_SECS: float = 60.0          # cierra sesiones ociosas (respetando el mínimo)
+    SMTP_POOL_MAX_MESSAGES: int = 500          # recicla la sesión tras N mensajes
+    SMTP_POOL_HEALTHCHECK_SECS: float = 5.0    # NOOP si lleva ociosa más de N seg (0 = siempre)
+
     # === Retries / límites ===
     MAX_RCPTS: int = 100
-    RETRIES: int = 3
-    RETRY_BACKOFF_SECS: float = 2.0
+    MAX_BATCH: int = 500            # elementos máximos por POST /send/batch
+    RETRIES: int = 3                # intentos en la petición, solo para errores de conexión
+    RETRY_BACKOFF_SECS: float = 2.0            # base del backoff de la cola de reintentos (x2 por intento)
+    RETRY_MAX_DELAY_SECS: float = 1800.0
+    RETRY_MAX_ATTEMPTS: int = 8                # intentos totales de un mensaje en la cola
+    RETRY_QUEUE: bool = False                  # SEND_MODE=sync: transitorios a la cola (QUEUE_PATH) en vez de fallar
+
+    # === Límites por dominio de destino (0 = sin límite) ===
+    DOMAIN_RATE: float = 0.0                   # msgs/seg por dominio (por defecto)
+    DOMAIN_MAX_IN_FLIGHT: int = 0              # envíos simultáneos por dominio (por defecto)
+    DOMAIN_LIMITS: Dict[str, str] = {}         # {"gmail.com": "5:4"} = 5 msgs/seg y 4 en vuelo
+    DOMAIN_ALIASES: Optional[Dict[str, str]] = None  # None = PROVIDER_ALIASES (googlemail.com -> gmail.com, ...)
+
+    # === Límite global y coordinación entre procesos (app/run.sh prod = uvicorn --workers N) ===
+    SEND_RATE: float = 0.0                     # msgs/seg de todos los envíos juntos (0 = sin límite)
+    SEND_MAX_IN_FLIGHT: int = 0                # envíos simultáneos en total (0 = sin límite)
+    LIMITS_PATH: str = ""                      # SQLite compartido por los workers; vacío = límites por proceso
+
+    # === Cola durable (SEND_MODE=queue: /send responde 202 y workers drenan) ===
+    SEND_MODE: str = "sync"                    # "sync" | "queue"
+    QUEUE_PATH: str = "data/outbox.sqlite3"
+    QUEUE_WORKERS: int = 8
+    QUEUE_SYNCHRONOUS: str = "NORMAL"          # PRAGMA synchronous (FULL = fsync por commit)
+
+    # === Lista de supresión (bajas y rebotes duros; vacío = no consultar) ===
+    SUPPRESSION_PATH: str = ""                 # p.ej. data/suppression.sqlite3 (la de suppress.py)
 
     # === From dinámico ===
     FROM_NAME: str = "Renewal"
@@ -28,6 +59,11 @@ class Settings(BaseSettings):
         "e-filemycorp.com": "Renewal",
     }
 
+    # === DKIM (firma en proceso; vacío = sin firmar, la firma queda en el relay) ===
+    DKIM_KEYS: Dict[str, str] = {}             # {"e-filemycorp.com": "s2025:/etc/dkim/efmc.pem"} (RSA o Ed25519)
+    DKIM_SELECTOR: str = "mail"                # selector si la entrada no lleva "selector:"
+    DKIM_HEADERS: List[str] = []               # cabeceras a firmar; vacío = app.dkim.DEFAULT_HEADERS
+
     # === Cabeceras por defecto ===
     DEFAULT_HEADERS: Dict[str, str] = {
         "List-Unsubscribe": "<mailto:unsubscribe@e-filemycorporation.com>",
@@ -37,11 +73,21 @@ class Settings(BaseSettings):
     CSV_PATH: str = "/home/taylerk/Documentos/smtpppp/datosPrueba.csv"
     CSV_EMAIL_COLUMN: str = "gmail"
 
+    # === MIME ===
+    MIME_CACHE_SIZE: int = 256                 # mensajes serializados cacheados (cuerpos idénticos)
+
+    # === Plantillas (envíos con template_id) ===
+    TEMPLATES_DIR: str = ""                    # vacío = templates/ del repo
+    TEMPLATES_CHECK_SECS: float = 2.0          # cada cuánto mirar si cambió una plantilla (0 = en cada envío)
+
     # === WordPress magic-link ===
     WP_MAGIC_URL: Optional[HttpUrl] = None  # p.ej. https://renewals.../wp-json/comown/v1/magic-link
     WP_API_KEY: SecretStr = SecretStr("")
     WP_PREFER: str = "business_id"
 
+    # === Observabilidad ===
+    METRICS_ENABLED: bool = True               # latencia HTTP por ruta en /metrics (el resto siempre se cuenta)
+
     # === Seguridad de API /send ===
     API_BEARER_TOKEN: SecretStr = SecretStr("")
 
@@ -53,7 +99,13 @@ class Settings(BaseSettings):
         v = (v or "").strip().lower()
         return v if v in {"business_id", "email"} else "business_id"
 
-    @field_validator("DISPLAY_NAMES")
+    @field_validator("SEND_MODE")
+    @classmethod
+    def _validate_send_mode(cls, v: str) -> str:
+        v = (v or "").strip().lower()
+        return v if v in {"sync", "queue"} else "sync"
+
+    @field_validator("DISPLAY_NAMES", "DKIM_KEYS")
     @classmethod
     def _lowercase_domains(cls, v: Dict[str, str]) -> Dict[str, str]:
         return { (k or "").lower(): (val or "") for k, val in (v or {}).items() }
@@ -63,19 +115,31 @@ settings = Settings()
 
 
 class Email(BaseModel):
-    """Payload para /send"""
+    """Payload para /send (cuerpos completos, o template_id + variables)"""
     to: List[EmailStr] = Field(..., min_length=1)
-    subject: str = Field(..., min_length=1, max_length=200)
+    subject: Optional[str] = Field(None, min_length=1, max_length=200)
     body_text: Optional[str] = None
     body_html: Optional[str] = None
+    template_id: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_-]+$", max_length=64)
+    variables: Optional[Dict[str, str]] = None
     headers: Optional[Dict[str, str]] = None
     from_domain: Optional[str] = None
     reply_to: Optional[EmailStr] = None
     list_unsubscribe: Optional[str] = None
     tracking_id: Optional[str] = None
     metadata: Optional[Dict[str, str]] = None
+    # Varios destinatarios independientes con el mismo cuerpo: un DATA, N RCPT TO,
+    # To "undisclosed-recipients:;" y estado por destinatario en la respuesta
+    undisclosed_recipients: bool = False
 
     @field_validator("from_domain")
     @classmethod
     def _normalize_domain(cls, v: Optional[str]) -> Optional[str]:
         return v.lower().strip() if isinstance(v, str) and v.strip() else v
+
+    @model_validator(mode="after")
+    def _subject_or_template(self) -> "Email":
+        # Con plantilla el asunto puede salir de campaign.json
+        if not self.subject and not self.template_id:
+            raise ValueError("subject es obligatorio si no se usa template_id")
+        return self
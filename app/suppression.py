@@ -0,0 +1,185 @@
+"""
+Lista de supresión persistente (SQLite): direcciones a las que no se vuelve
+a escribir. send.py la consulta por fila antes de preparar el envío y
+/send antes de entregar.
+
+Motivos:
+  * unsubscribe : bajas (buzón del List-Unsubscribe, listas exportadas)
+  * bounce      : rebotes duros cosechados de reportes de send.py
+  * complaint / manual
+
+Clave = email normalizado (strip + minúsculas) como PRIMARY KEY de una
+tabla WITHOUT ROWID: la consulta es una búsqueda en el propio índice, sin
+tabla aparte. Las importaciones van en una sola transacción con
+executemany (cientos de miles de filas en segundos).
+"""
+
+from __future__ import annotations
+
+import csv
+import email.utils
+import mailbox
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+UNSUBSCRIBE = "unsubscribe"
+BOUNCE = "bounce"
+COMPLAINT = "complaint"
+MANUAL = "manual"
+REASONS = (UNSUBSCRIBE, BOUNCE, COMPLAINT, MANUAL)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS suppressed (
+    email    TEXT PRIMARY KEY,
+    reason   TEXT NOT NULL,
+    source   TEXT NOT NULL DEFAULT '',
+    detail   TEXT NOT NULL DEFAULT '',
+    added_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# (email, reason, source, detail)
+Entry = Tuple[str, str, str, str]
+
+
+def normalize(addr: str) -> str:
+    return (addr or "").strip().lower()
+
+
+class SuppressionList:
+    """
+    Conjunto email -> motivo en SQLite (WAL). La primera alta gana: volver
+    a importar un reporte no pisa una baja anterior.
+    """
+
+    def __init__(self, path: str) -> None:
+        Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def reason(self, addr: str) -> str:
+        """Motivo de la supresión ("" si la dirección se puede usar)."""
+        row = self._db.execute("SELECT reason FROM suppressed WHERE email=?", (normalize(addr),)).fetchone()
+        return row[0] if row else ""
+
+    def __contains__(self, addr: str) -> bool:
+        return bool(self.reason(addr))
+
+    def reasons(self, addrs: Iterable[str]) -> Dict[str, str]:
+        """{dirección tal cual vino: motivo} de las suprimidas."""
+        by_key: Dict[str, List[str]] = {}
+        for a in addrs:
+            by_key.setdefault(normalize(a), []).append(a)
+        keys = list(by_key)
+        found: Dict[str, str] = {}
+        # Límite de variables de SQLite: por tramos
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for key, reason in self._db.execute(
+                f"SELECT email, reason FROM suppressed WHERE email IN ({marks})", chunk
+            ):
+                for a in by_key[key]:
+                    found[a] = reason
+        return found
+
+    def get(self, addr: str) -> Optional[Dict[str, object]]:
+        row = self._db.execute(
+            "SELECT email, reason, source, detail, added_at FROM suppressed WHERE email=?", (normalize(addr),)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("email", "reason", "source", "detail", "added_at"), row))
+
+    def add(self, addr: str, reason: str = MANUAL, source: str = "", detail: str = "") -> bool:
+        return self.add_many([(addr, reason, source, detail)]) == 1
+
+    def add_many(self, entries: Iterable[Entry], chunk: int = 50_000) -> int:
+        """Alta en bloque (INSERT OR IGNORE); devuelve cuántas direcciones son nuevas."""
+        now = time.time()
+        before = self._db.total_changes
+        rows: List[tuple] = []
+        with self._db:
+            self._db.execute("BEGIN")
+            for addr, reason, source, detail in entries:
+                key = normalize(addr)
+                if key:
+                    rows.append((key, reason, source, detail[:500], now))
+                if len(rows) >= chunk:
+                    self._insert(rows)
+            self._insert(rows)
+        return self._db.total_changes - before
+
+    def _insert(self, rows: List[tuple]) -> None:
+        self._db.executemany(
+            "INSERT OR IGNORE INTO suppressed (email, reason, source, detail, added_at) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        rows.clear()
+
+    def remove(self, addr: str) -> bool:
+        return self._db.execute("DELETE FROM suppressed WHERE email=?", (normalize(addr),)).rowcount > 0
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._db.execute("SELECT reason, COUNT(*) FROM suppressed GROUP BY reason ORDER BY reason"))
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM suppressed").fetchone()[0]
+
+
+def open_if_exists(path: str) -> Optional[SuppressionList]:
+    """La lista de `path`, o None si no hay (send.py no crea una vacía)."""
+    return SuppressionList(path) if path and Path(path).expanduser().exists() else None
+
+
+# --------------------------- Fuentes de altas --------------------------------
+
+# Rebote duro = buzón/dirección inexistente: 550/551/553 o estado 5.1.x. Los
+# rechazos por política o contenido (554, 5.7.x) no dicen nada de la dirección.
+_HARD_BOUNCE = re.compile(r"\b(?:55[013][ ,-]|5\.1\.\d+\b)")
+_EMAIL_IN_TEXT = re.compile(r"[^@\s,;:\"'<>()\[\]]+@[^@\s,;:\"'<>()\[\]]+\.[A-Za-z]{2,}")
+
+
+def is_hard_bounce(status: str, error: str, error_class: str = "") -> bool:
+    return status == "failed" and error_class in ("", "permanent") and bool(_HARD_BOUNCE.search(error or ""))
+
+
+def bounces_from_report(path) -> Iterator[Entry]:
+    """Rebotes duros de un reporte de send.py (ts,row,email,status,error[,error_class])."""
+    source = Path(path).name
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            if is_hard_bounce(row.get("status") or "", row.get("error") or "", row.get("error_class") or ""):
+                yield row.get("email") or "", BOUNCE, source, row.get("error") or ""
+
+
+def unsubscribes_from_mailbox(path) -> Iterator[Entry]:
+    """Remitentes del buzón del List-Unsubscribe (directorio Maildir o fichero mbox)."""
+    p = Path(path).expanduser()
+    box = mailbox.Maildir(str(p), create=False) if p.is_dir() else mailbox.mbox(str(p), create=False)
+    try:
+        for msg in box:
+            addr = email.utils.parseaddr(msg.get("From") or "")[1]
+            if "@" in addr:
+                yield addr, UNSUBSCRIBE, p.name, (msg.get("Subject") or "")[:200]
+    finally:
+        box.close()
+
+
+def emails_from_list(path, reason: str = UNSUBSCRIBE) -> Iterator[Entry]:
+    """Cualquier texto/CSV: la primera dirección de cada línea (exports de bajas, listas negras)."""
+    source = Path(path).name
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            m = _EMAIL_IN_TEXT.search(line)
+            if m:
+                yield m.group(0), reason, source, ""
+
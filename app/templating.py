@@ -0,0 +1,152 @@
+"""
+Plantillas de campaña (Jinja2) compiladas una vez y cacheadas por nombre + mtime
+(comprobado como mucho cada `check_every` seg).
+
+Cada campaña es un directorio bajo la raíz de plantillas:
+
+    templates/<campaña>/campaign.json   variables de campaña (subject, state, year, ...)
+    templates/<campaña>/body.html       cuerpo HTML (autoescape)
+    templates/<campaña>/body.txt        cuerpo de texto
+
+Las plantillas se renderizan en dos fases:
+  1. {{ ... }} / {% ... %}  -> variables de campaña, UNA vez por campaña.
+  2. [[ ... ]] / [% ... %]  -> variables del destinatario (name, link, ...),
+     sobre una plantilla ya compilada donde todo lo estático es una constante.
+
+Solo el fuente de la plantilla lleva código de la fase 2: un "[[", "[%" o
+"[#" dentro de un valor de la fase 1 (asunto, URL...) sale literal.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import jinja2
+from markupsafe import Markup, escape
+
+_FILES = ("campaign.json", "body.html", "body.txt")
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+# "[" que abriría una etiqueta de la fase 2 ([[, [%, [#)
+_PHASE2_OPEN = re.compile(r"\[(?=[\[%#])")
+
+
+@jinja2.pass_eval_context
+def _literal_phase2(eval_ctx, value: Any) -> Any:
+    """
+    finalize de la fase 1: cada "[" que abriría una etiqueta de la fase 2 se
+    emite como [[ "[" ]], así el valor de una variable de campaña nunca se
+    ejecuta como plantilla del destinatario.
+    """
+    text = escape(value) if eval_ctx.autoescape else str(value)
+    if "[" not in text:
+        return text
+    out = _PHASE2_OPEN.sub('[[ "[" ]]', str(text))
+    return Markup(out) if eval_ctx.autoescape else out
+
+
+def _recipient_env(autoescape: bool) -> jinja2.Environment:
+    return jinja2.Environment(
+        variable_start_string="[[",
+        variable_end_string="]]",
+        block_start_string="[%",
+        block_end_string="%]",
+        comment_start_string="[#",
+        comment_end_string="#]",
+        autoescape=autoescape,
+        undefined=jinja2.ChainableUndefined,
+        finalize=lambda v: "" if v is None else v,
+    )
+
+
+class CampaignTemplate:
+    """Una campaña ya pasada por la fase 1 y compilada para la fase 2."""
+
+    def __init__(self, name: str, context: Dict[str, Any], html_src: str, text_src: str,
+                 html_env: jinja2.Environment, text_env: jinja2.Environment) -> None:
+        self.name = name
+        self.context = context
+        self.subject = str(context.get("subject") or "")
+        self.html_source = html_src
+        self.text_source = text_src
+        self.html = html_env.from_string(html_src)
+        self.text = text_env.from_string(text_src)
+        # Cambia si cambia cualquier byte de la campaña ya resuelta
+        self.version = hashlib.sha1(
+            json.dumps(context, sort_keys=True, default=str).encode("utf-8")
+            + b"\0" + html_src.encode("utf-8") + b"\0" + text_src.encode("utf-8")
+        ).hexdigest()[:12]
+
+    def render(self, **recipient: Any) -> Tuple[str, str]:
+        """(html, text) para un destinatario."""
+        return self.html.render(recipient), self.text.render(recipient)
+
+
+class TemplateEngine:
+    """
+    Carga campañas de `root`, las compila una vez y las recompila si cambia
+    un fichero. Los mtimes se miran como mucho cada `check_every` seg por
+    campaña (0 = en cada llamada): /send no hace stat() por mensaje.
+    """
+
+    def __init__(self, root: str | Path, check_every: float = 2.0) -> None:
+        self.root = Path(root).expanduser()
+        self.check_every = check_every
+        self._campaign_env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(str(self.root)),
+            autoescape=jinja2.select_autoescape(enabled_extensions=("html",), default_for_string=False),
+            undefined=jinja2.StrictUndefined,
+            auto_reload=False,
+            finalize=_literal_phase2,
+        )
+        self._html_env = _recipient_env(autoescape=True)
+        self._text_env = _recipient_env(autoescape=False)
+        self._cache: Dict[Tuple[str, str], Tuple[Tuple[float, ...], CampaignTemplate]] = {}
+        self._checked: Dict[Tuple[str, str], float] = {}  # última comprobación de mtimes (monotonic)
+        self._lock = threading.Lock()
+
+    def _mtimes(self, name: str) -> Tuple[float, ...]:
+        d = self.root / name
+        if not _NAME_RE.match(name) or not d.is_dir():
+            raise LookupError(f"Plantilla no encontrada: {name}")
+        return tuple((d / f).stat().st_mtime if (d / f).exists() else 0.0 for f in _FILES)
+
+    def _compile(self, name: str, overrides: Dict[str, Any]) -> CampaignTemplate:
+        d = self.root / name
+        context: Dict[str, Any] = {}
+        if (d / "campaign.json").exists():
+            context.update(json.loads((d / "campaign.json").read_text(encoding="utf-8")))
+        context.update({k: v for k, v in overrides.items() if v not in (None, "")})
+
+        # FileSystemLoader cachea por mtime; aquí ya sabemos que hay que releer.
+        self._campaign_env.cache.clear()
+        html_src = self._campaign_env.get_template(f"{name}/body.html").render(context)
+        text_src = self._campaign_env.get_template(f"{name}/body.txt").render(context) if (d / "body.txt").exists() else ""
+        return CampaignTemplate(name, context, html_src, text_src, self._html_env, self._text_env)
+
+    def campaign(self, name: str, **overrides: Any) -> CampaignTemplate:
+        """Campaña compilada (cacheada mientras no cambie ningún fichero)."""
+        key = (name, json.dumps(overrides, sort_keys=True, default=str))
+        hit = self._cache.get(key)
+        now = time.monotonic()
+        if hit is not None and now - self._checked.get(key, 0.0) < self.check_every:
+            return hit[1]
+        mtimes = self._mtimes(name)
+        self._checked[key] = now
+        if hit is not None and hit[0] == mtimes:
+            return hit[1]
+        with self._lock:
+            tpl = self._compile(name, overrides)
+            self._cache[key] = (mtimes, tpl)
+        return tpl
+
+    def names(self) -> list:
+        return sorted(p.name for p in self.root.iterdir() if (p / "body.html").exists())
+
+
+DEFAULT_TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
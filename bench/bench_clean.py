@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_clean.py — Limpieza del CSV de actividad: notebook (.apply por fila) vs clean_contacts
+
+  * notebook : pasos de EDA.ipynb (read_csv sin dtype, .apply(validar_email),
+               limpiar_texto, formatear_ubi, parsear_fecha con strptime)
+  * vectorized: clean_contacts.clean_contacts (una lectura dtype=str, .str)
+
+Genera un CSV sintético con la forma de actividad.csv (~50% filas vacías,
+BusinessID "123.0", emails con basura/mayúsculas, duplicados) y comprueba
+que ambos dejan las mismas filas y conteos.
+
+  python bench/bench_clean.py --rows 1000000
+"""
+
+import argparse
+import csv
+import json
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from clean_contacts import build_report, clean_contacts, read_contacts  # noqa: E402
+
+HEADER = ["BusinessID", "Business Name", "Responsible Person", "Email", "Address", "UBI Number", "NextARDueDate"]
+
+
+def make_csv(path: Path, rows: int) -> None:
+    rnd = random.Random(11)
+    dates = ["2025-09-30T00:00:00", "2025-10-31", "12/31/2025", "", "31-12-2025"]
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(HEADER)
+        for i in range(rows):
+            if rnd.random() < 0.5:
+                w.writerow([""] * len(HEADER))
+                continue
+            bid = rnd.randrange(rows // 2)  # ~duplicados
+            email = rnd.choice([
+                f"OWNER{bid}@GMAIL.COM", f" owner.{bid}@yahoo.com ", f"o'{bid}@mail.com",
+                f"bad{bid}", "", f"x {bid}@site.org",
+            ])
+            ubi = f"6{bid:08d}"
+            w.writerow([
+                f"{bid}.0", f"  company  {bid} llc ", f"person {bid % 9000}", email,
+                f"{bid} main st, seattle, wa", f"{ubi[:3]} {ubi[3:6]} {ubi[6:]}",
+                rnd.choice(dates),
+            ])
+
+
+# --- Pasos del notebook (celda de limpieza), por fila ---
+
+def validar_email(email):
+    if pd.isna(email):
+        return np.nan
+    email = str(email).strip().lower().strip()
+    if re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email):
+        return email
+    return np.nan
+
+
+def limpiar_texto(texto):
+    if pd.isna(texto):
+        return np.nan
+    texto = ' '.join(word.capitalize() for word in str(texto).strip().split())
+    return re.sub(r'\s+', ' ', texto)
+
+
+def formatear_ubi(ubi):
+    if pd.isna(ubi):
+        return np.nan
+    ubi = re.sub(r'[^A-Z0-9-]', '', str(ubi).strip().upper())
+    return ubi if ubi else np.nan
+
+
+def parsear_fecha(fecha_str):
+    if pd.isna(fecha_str):
+        return np.nan
+    for formato in ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d', '%d-%m-%Y', '%m-%d-%Y', '%Y%m%d']:
+        try:
+            return datetime.strptime(str(fecha_str).strip(), formato).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return np.nan
+
+
+def notebook(path: Path) -> pd.DataFrame:
+    df = pd.read_csv(path, low_memory=False)
+    df_clean = df.dropna(how='all').dropna(subset=['BusinessID', 'Business Name', 'UBI Number'])
+    df_clean['Email'] = df_clean['Email'].apply(validar_email)
+    for columna in ['Business Name', 'Responsible Person', 'Address']:
+        df_clean[columna] = df_clean[columna].apply(limpiar_texto)
+    df_clean['UBI Number'] = df_clean['UBI Number'].apply(formatear_ubi)
+    df_clean['NextARDueDate'] = df_clean['NextARDueDate'].apply(parsear_fecha)
+    df_final = df_clean.drop_duplicates(subset=['BusinessID'], keep='first')
+    df_final = df_final.drop_duplicates(subset=['UBI Number'], keep='first')
+    cols = ['BusinessID', 'UBI Number', 'Business Name', 'Responsible Person', 'Email', 'Address', 'NextARDueDate']
+    return df_final[cols].reset_index(drop=True)
+
+
+def vectorized(path: Path) -> pd.DataFrame:
+    return clean_contacts(read_contacts(str(path)))[0]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Microbenchmark de la limpieza de contactos")
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "actividad.csv"
+        make_csv(src, args.rows)
+
+        results = {"rows": args.rows}
+        frames = {}
+        for name, fn in (("notebook", notebook), ("vectorized", vectorized)):
+            t0 = time.perf_counter()
+            frames[name] = fn(src)
+            secs = time.perf_counter() - t0
+            results[name] = {"secs": round(secs, 2), "rows_per_sec": round(args.rows / secs)}
+
+    a, b = frames["notebook"], frames["vectorized"]
+    rep_a = build_report(args.rows, a, [])["estadisticas_completitud"]
+    rep_b = build_report(args.rows, b, [])["estadisticas_completitud"]
+    results["same_rows"] = len(a) == len(b)
+    results["same_stats"] = rep_a == rep_b
+    results["speedup"] = round(results["notebook"]["secs"] / results["vectorized"]["secs"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_clean_memory.py — Pico de RSS de clean_contacts según tamaño de entrada
+
+Para cada tamaño genera un CSV sintético (bench_clean.make_csv) y lanza
+clean_file en un proceso aparte, todo en memoria y por tramos, midiendo
+el pico de RSS (ru_maxrss) y el tiempo.
+
+  python bench/bench_clean_memory.py --rows 250000 500000 1000000 --chunk-rows 100000
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bench"))
+from bench_clean import make_csv  # noqa: E402
+
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+from clean_contacts import clean_file
+t0 = time.perf_counter()
+rep = clean_file({src!r}, {out!r}, chunk_rows={chunk})
+print(json.dumps({{
+    "secs": round(time.perf_counter() - t0, 2),
+    "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    "final_rows": rep["registros_finales"],
+}}))
+"""
+
+
+def run(src: Path, out: Path, chunk: int) -> dict:
+    code = CHILD.format(root=str(ROOT), src=str(src), out=str(out), chunk=chunk)
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pico de memoria de la limpieza (en memoria vs por tramos)")
+    ap.add_argument("--rows", type=int, nargs="+", default=[250_000, 500_000, 1_000_000])
+    ap.add_argument("--chunk-rows", type=int, default=100_000)
+    args = ap.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            src = Path(tmp) / f"actividad_{rows}.csv"
+            make_csv(src, rows)
+            row = {"rows": rows, "csv_mb": round(src.stat().st_size / 2**20, 1)}
+            row["in_memory"] = run(src, Path(tmp) / "out_mem.csv", 0)
+            row["chunked"] = run(src, Path(tmp) / "out_chunk.csv", args.chunk_rows)
+            results.append(row)
+            src.unlink()
+    print(json.dumps({"chunk_rows": args.chunk_rows, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
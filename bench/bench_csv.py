@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_csv.py — Lectura del CSV de clientes: DictReader + safe_get vs ContactsCsv
+
+  * dictreader : lo que hacía send.py (dict por fila con safe_get + la fila original)
+  * contacts   : contacts_csv.ContactsCsv (columnas resueltas una vez, Contact)
+  * contacts_gz: igual sobre el mismo CSV en .csv.gz
+
+Mide filas/seg recorriendo el fichero y la memoria de tener todas las filas
+en una lista (tracemalloc), sobre un CSV sintético del tamaño de actividad.csv.
+
+  python bench/bench_csv.py --rows 192000
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from contacts_csv import ContactsCsv, norm_business_id  # noqa: E402
+
+HEADER = ["BusinessID", "UBI Number", "Business Name", "Responsible Person", "Email",
+          "Address", "NextARDueDate", "Status", "Principal Office", "Registered Agent"]
+
+
+def make_csv(path: Path, rows: int) -> None:
+    rnd = random.Random(7)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(HEADER)
+        for i in range(rows):
+            w.writerow([
+                f"{1000000 + i}.0", f"60{rnd.randrange(10**7):07d}", f"Company {i} LLC",
+                f"Person {i}", f"owner{i}@example{i % 97}.com", f"{i} Main St, Seattle, WA",
+                "2025-12-31", "Active", f"{i} Office Rd", "Agent Services Inc",
+            ])
+
+
+# --- Implementación anterior de send.py (referencia) ---
+
+def safe_get(row, key):
+    if key in row:
+        return row.get(key) or ""
+    key_l = key.strip().lower()
+    for k in row.keys():
+        if k.strip().lower() == key_l:
+            return row.get(k) or ""
+    return ""
+
+
+def iter_dictreader(path: Path):
+    with path.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield {
+                "business_id": norm_business_id(safe_get(row, "BusinessID")),
+                "ubi_number": safe_get(row, "UBI Number"),
+                "business_name": safe_get(row, "Business Name"),
+                "responsible_person": safe_get(row, "Responsible Person"),
+                "email": (safe_get(row, "Email") or "").strip(),
+                "address": safe_get(row, "Address"),
+                "next_due": safe_get(row, "NextARDueDate"),
+                "row": row,
+            }
+
+
+def iter_contacts(path: Path):
+    with ContactsCsv(path) as src:
+        yield from src
+
+
+def measure(fn, path: Path, rows: int) -> dict:
+    t0 = time.perf_counter()
+    n = sum(1 for _ in fn(path))
+    secs = time.perf_counter() - t0
+    assert n == rows, (n, rows)
+
+    tracemalloc.start()
+    kept = list(fn(path))
+    mem, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return {
+        "rows_per_sec": round(rows / secs),
+        "us_per_row": round(secs / rows * 1e6, 2),
+        "bytes_per_row_kept": round(mem / rows),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Microbenchmark de lectura del CSV de clientes")
+    ap.add_argument("--rows", type=int, default=192000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = Path(tmp) / "clients.csv"
+        make_csv(plain, args.rows)
+        gz = Path(tmp) / "clients.csv.gz"
+        with plain.open("rb") as fi, gzip.open(gz, "wb", compresslevel=6) as fo:
+            fo.write(fi.read())
+
+        results = {
+            "rows": args.rows,
+            "dictreader": measure(iter_dictreader, plain, args.rows),
+            "contacts": measure(iter_contacts, plain, args.rows),
+            "contacts_gz": measure(iter_contacts, gz, args.rows),
+        }
+    results["speedup"] = round(results["contacts"]["rows_per_sec"] / results["dictreader"]["rows_per_sec"], 2)
+    results["memory_ratio"] = round(results["dictreader"]["bytes_per_row_kept"] / results["contacts"]["bytes_per_row_kept"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
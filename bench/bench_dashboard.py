@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_dashboard.py — Agregados del dashboard: recálculo completo vs incremental
+
+Genera un reporte sintético (bench_report_io.make_report), lo va creciendo
+por días con --append filas (la última a medias, como un send.py en marcha)
+y compara, tras cada tramo:
+
+  * full        : reportDashboard.aggregate sin estado (lee todo el fichero)
+  * incremental : aggregate con el JSON de estado (solo las filas nuevas)
+
+Comprueba que ambos dan los mismos agregados.
+
+  python bench/bench_dashboard.py --rows 300000 --append 5000 --steps 5
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bench"))
+sys.path.insert(0, str(ROOT / "reports"))
+from bench_report_io import make_report  # noqa: E402
+import reportDashboard as dash  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Dashboard: recálculo completo vs incremental")
+    ap.add_argument("--rows", type=int, default=300_000)
+    ap.add_argument("--append", type=int, default=5_000)
+    ap.add_argument("--steps", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        total = args.rows + args.append * args.steps
+        full_src = Path(tmp) / "all.csv"
+        make_report(full_src, total)
+        lines = full_src.read_bytes().splitlines(keepends=True)
+
+        rep = Path(tmp) / "report.csv"
+        rep.write_bytes(b"".join(lines[:args.rows + 1]))
+        state_path = Path(tmp) / "state.json"
+        state = dash.load_state(state_path)
+
+        t0 = time.perf_counter()
+        dash.aggregate(rep, state)
+        dash.save_state(state, state_path)
+        res = {"rows": args.rows, "append": args.append, "initial_state_secs": round(time.perf_counter() - t0, 3),
+               "state_kb": round(state_path.stat().st_size / 1024, 1), "steps": []}
+
+        pos = args.rows + 1
+        for _ in range(args.steps):
+            chunk = b"".join(lines[pos:pos + args.append])
+            pos += args.append
+            cut = len(chunk) - 20  # última fila a medias
+            with rep.open("ab") as f:
+                f.write(chunk[:cut])
+
+            t0 = time.perf_counter()
+            full = dash.aggregate(rep)
+            t_full = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            state = dash.load_state(state_path)
+            inc = dash.aggregate(rep, state)
+            dash.save_state(state, state_path)
+            t_inc = time.perf_counter() - t0
+
+            with rep.open("ab") as f:
+                f.write(chunk[cut:])
+            res["steps"].append({"rows": full.rows, "full_secs": round(t_full, 3),
+                                 "incremental_secs": round(t_inc, 3), "same": full.to_json() == inc.to_json()})
+        res["speedup"] = round(sum(s["full_secs"] for s in res["steps"]) /
+                               sum(s["incremental_secs"] for s in res["steps"]), 1)
+    print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()
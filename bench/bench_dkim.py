@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_dkim.py — Coste de la firma DKIM por mensaje (app/dkim.py)
+
+Construir + serializar con MessageFactory (lo que sale por DATA), sin firma
+y firmando con RSA-2048 / Ed25519:
+
+  * same_body : mismo cuerpo para todos (bh= cacheado en el prototipo: solo
+                To + firma de cabeceras por mensaje)
+  * per_rcpt  : cuerpo distinto por destinatario (bh= por mensaje)
+
+Cada escenario verifica una muestra de mensajes firmados (dkim.verify).
+
+  python bench/bench_dkim.py --n 3000
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa  # noqa: E402
+
+from app.dkim import DkimKey, DkimSigner, verify  # noqa: E402
+from app.sender import MessageFactory  # noqa: E402
+from app.templating import DEFAULT_TEMPLATES_DIR, TemplateEngine  # noqa: E402
+
+SUBJECT = "Washington Annual Report | 2025 Filing Reminder"
+HEADERS = {"List-Unsubscribe": "<mailto:unsubscribe@e-filemycorporation.com>"}
+DOMAIN = "e-filemycorporation.com"
+
+
+def _bodies(n: int, same: bool):
+    tpl = TemplateEngine(DEFAULT_TEMPLATES_DIR).campaign("wa")
+    if same:
+        html, text = tpl.render(name="Customer", link="https://renewals.example.com/renewal-form/")
+        return [(f"c{i}@example.com", html, text) for i in range(n)]
+    out = []
+    for i in range(n):
+        html, text = tpl.render(name=f"Customer {i}", link=f"https://renewals.example.com/renewal-form/?t={i}")
+        out.append((f"c{i}@example.com", html, text))
+    return out
+
+
+def _key(tmp: str, name: str, private) -> DkimKey:
+    path = Path(tmp) / f"{name}.pem"
+    path.write_bytes(private.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return DkimKey.load(DOMAIN, f"{name}:{path}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Microbenchmark de firma DKIM")
+    ap.add_argument("--n", type=int, default=3000)
+    ap.add_argument("--verify", type=int, default=50, help="Mensajes firmados verificados por escenario")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        keys = {
+            "rsa2048": _key(tmp, "rsa2048", rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+            "ed25519": _key(tmp, "ed25519", ed25519.Ed25519PrivateKey.generate()),
+        }
+        load_ms = round((time.perf_counter() - t0) * 1e3, 1)
+    public = {(k.domain, k.selector): k.private.public_key() for k in keys.values()}
+
+    results = {"n": args.n, "keygen_and_load_ms": load_ms}
+    for scenario, same in (("same_body", True), ("per_rcpt", False)):
+        items = _bodies(args.n, same)
+        row = {}
+        for name, key in (("unsigned", None), *keys.items()):
+            factory = MessageFactory(max_size=256, signer=DkimSigner({DOMAIN: key}) if key else None)
+            out = []
+            t0 = time.perf_counter()
+            for to, html, text in items:
+                out.append(factory.build([to], SUBJECT, text=text, html=html, headers=HEADERS,
+                                         from_domain=DOMAIN).data())
+            secs = time.perf_counter() - t0
+            row[name] = {"msgs_per_sec": round(args.n / secs, 1), "us_per_msg": round(secs / args.n * 1e6, 2)}
+            if key:
+                row[name]["overhead_us"] = round(row[name]["us_per_msg"] - row["unsigned"]["us_per_msg"], 2)
+                sample = out[:: max(1, len(out) // args.verify)][:args.verify]
+                row[name]["verified"] = f"{sum(verify(m, public)[0] for m in sample)}/{len(sample)}"
+        results[scenario] = row
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
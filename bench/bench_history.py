@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_history.py — Historial de envíos: importación de reportes y consultas
+
+  * sync        : --reports reportes de send.py con --rows filas en total
+  * resync      : sync de los mismos reportes sin cambios (solo offsets)
+  * record      : registro en vivo como send.py (email + BusinessID)
+  * lookup      : "¿contactado en los últimos N días?" por email (mitad nuevos)
+  * lookup_bid  : lo mismo por email + BusinessID
+
+  python bench/bench_history.py --rows 2000000 --lookups 200000
+"""
+
+import argparse
+import csv
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from send_history import SendHistory  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Historial de envíos: sync y lookups")
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    ap.add_argument("--reports", type=int, default=4)
+    ap.add_argument("--record", type=int, default=100_000)
+    ap.add_argument("--lookups", type=int, default=200_000)
+    args = ap.parse_args()
+
+    rnd = random.Random(7)
+    now = time.time()
+    per = args.rows // args.reports
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for r in range(args.reports):
+            ts = datetime.fromtimestamp(now - (args.reports - r) * 7 * 86400, timezone.utc).isoformat()
+            path = Path(tmp) / f"wa_{r}.csv"
+            with path.open("w", newline="") as f:
+                w = csv.writer(f)
+                w.writerow(["ts", "row", "email", "status", "error", "error_class"])
+                for i in range(per):
+                    n = r * per + i
+                    w.writerow([ts, i + 1, f"user{n}@example{n % 97}.com", "sent" if i % 20 else "failed", "", ""])
+            paths.append(path)
+
+        history = SendHistory(str(Path(tmp) / "history.sqlite3"), flush_rows=500)
+        res = {"rows": per * args.reports}
+
+        t0 = time.perf_counter()
+        n = sum(history.sync(p) for p in paths)
+        res["sync"] = {"contacts": n, "secs": round(time.perf_counter() - t0, 3)}
+
+        t0 = time.perf_counter()
+        n = sum(history.sync(p) for p in paths)
+        res["resync"] = {"contacts": n, "ms": round((time.perf_counter() - t0) * 1e3, 2)}
+
+        t0 = time.perf_counter()
+        for i in range(args.record):
+            history.record(f"live{i}@example.org", f"{600000000 + i}", "wa_live")
+        history.flush()
+        secs = time.perf_counter() - t0
+        res["record"] = {"n": args.record, "us_per_record": round(secs / args.record * 1e6, 2)}
+
+        picks = [rnd.randrange(per * args.reports) for _ in range(args.lookups)]
+        probes = [f"user{j}@example{j % 97}.com" if i % 2 else f"fresh{i}@example.org" for i, j in enumerate(picks)]
+        t0 = time.perf_counter()
+        hits = sum(1 for p in probes if history.contacted_within(14, p, now=now))
+        secs = time.perf_counter() - t0
+        res["lookup"] = {"n": args.lookups, "hits": hits, "us_per_lookup": round(secs / args.lookups * 1e6, 2)}
+
+        bids = [f"{600000000 + rnd.randrange(args.record * 2)}" for _ in range(args.lookups)]
+        t0 = time.perf_counter()
+        hits = sum(1 for p, b in zip(probes, bids) if history.contacted_within(14, p, b, now=now))
+        secs = time.perf_counter() - t0
+        res["lookup_bid"] = {"n": args.lookups, "hits": hits, "us_per_lookup": round(secs / args.lookups * 1e6, 2)}
+        history.close()
+        res["db_mb"] = round((Path(tmp) / "history.sqlite3").stat().st_size / 2**20, 1)
+    print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()
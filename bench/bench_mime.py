@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_mime.py — build_message vs MessageFactory (mensajes/seg)
+
+Mide construir + serializar (lo que hace SMTP.send_message antes de DATA):
+  * build_message : EmailMessage nuevo + flatten_message por mensaje
+  * factory       : MessageFactory.build + PreparedMessage.data()
+
+Escenarios:
+  * same_body : mismo cuerpo para todos (solo cambia To)
+  * per_rcpt  : cuerpo distinto por destinatario (plantilla con nombre/link)
+
+  python bench/bench_mime.py --n 5000
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from aiosmtplib.email import flatten_message  # noqa: E402
+
+from app.sender import MessageFactory, build_message  # noqa: E402
+from app.templating import DEFAULT_TEMPLATES_DIR, TemplateEngine  # noqa: E402
+
+SUBJECT = "Washington Annual Report | 2025 Filing Reminder"
+HEADERS = {"List-Unsubscribe": "<mailto:unsubscribe@e-filemycorporation.com>"}
+
+
+def _bodies(n: int, same: bool):
+    tpl = TemplateEngine(DEFAULT_TEMPLATES_DIR).campaign("wa")
+    if same:
+        html, text = tpl.render(name="Customer", link="https://renewals.example.com/renewal-form/")
+        return [(f"c{i}@example.com", html, text) for i in range(n)]
+    out = []
+    for i in range(n):
+        html, text = tpl.render(name=f"Customer {i}", link=f"https://renewals.example.com/renewal-form/?t={i}")
+        out.append((f"c{i}@example.com", html, text))
+    return out
+
+
+def run(fn, items) -> float:
+    t0 = time.perf_counter()
+    for to, html, text in items:
+        fn(to, html, text)
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Microbenchmark de construcción MIME")
+    ap.add_argument("--n", type=int, default=5000)
+    args = ap.parse_args()
+
+    def legacy(to, html, text):
+        flatten_message(build_message([to], SUBJECT, text=text, html=html, headers=HEADERS))
+
+    results = {}
+    for scenario, same in (("same_body", True), ("per_rcpt", False)):
+        items = _bodies(args.n, same)
+        factory = MessageFactory(max_size=256)
+
+        def fast(to, html, text):
+            factory.build([to], SUBJECT, text=text, html=html, headers=HEADERS).data()
+
+        row = {}
+        for name, fn in (("build_message", legacy), ("factory", fast)):
+            secs = run(fn, items)
+            row[name] = {"msgs_per_sec": round(args.n / secs, 1), "us_per_msg": round(secs / args.n * 1e6, 2)}
+        row["speedup"] = round(row["factory"]["msgs_per_sec"] / row["build_message"]["msgs_per_sec"], 2)
+        row["factory_cache"] = factory.stats()
+        results[scenario] = row
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
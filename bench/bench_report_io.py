@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_report_io.py — Cargar un reporte de envío: CSV vs instantánea Parquet/Arrow
+
+  * resume : send.load_resume_state (csv.DictReader / pyarrow CSV / instantánea)
+  * frame  : DataFrame para el dashboard (pd.read_csv vs instantánea .to_pandas())
+
+  python bench/bench_report_io.py --rows 200000
+"""
+
+import argparse
+import csv
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import columnar  # noqa: E402
+import send  # noqa: E402
+
+
+def make_report(path: Path, rows: int) -> None:
+    rnd = random.Random(5)
+    t0 = datetime(2025, 9, 28, tzinfo=timezone.utc)
+    errors = ["HTTP 500: smtp down", "magic_no_url", "timeout", "invalid_email"]
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["ts", "row", "email", "status", "error"])
+        for i in range(1, rows + 1):
+            r = rnd.random()
+            status, error = ("sent", "") if r < 0.9 else ("failed", rnd.choice(errors)) if r < 0.98 else ("skipped", "invalid_email")
+            w.writerow([(t0 + timedelta(seconds=i)).isoformat(), i, f"c{i}@example{i % 50}.com", status, error])
+
+
+def timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return round(time.perf_counter() - t0, 3)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga de reportes CSV vs Parquet/Arrow")
+    ap.add_argument("--rows", type=int, default=200_000)
+    args = ap.parse_args()
+    columnar.require_arrow()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rep = Path(tmp) / "report.csv"
+        make_report(rep, args.rows)
+        snaps = {fmt: Path(tmp) / f"report.{fmt}" for fmt in ("parquet", "arrow")}
+        for snap in snaps.values():
+            columnar.snapshot_report(rep, snap)
+
+        res = {"rows": args.rows, "size_mb": {"csv": round(rep.stat().st_size / 2**20, 2)}}
+        res["size_mb"].update({fmt: round(p.stat().st_size / 2**20, 2) for fmt, p in snaps.items()})
+
+        send.columnar.HAVE_ARROW = False
+        res["resume"] = {"csv_dictreader": timed(lambda: send.load_resume_state(str(rep)))}
+        send.columnar.HAVE_ARROW = True
+        res["resume"]["arrow_csv"] = timed(lambda: send.load_resume_state(str(rep)))
+        for fmt, snap in snaps.items():
+            res["resume"][f"snapshot_{fmt}"] = timed(lambda: send.load_resume_state(str(rep), str(snap)))
+
+        res["frame"] = {"pd_read_csv": timed(lambda: pd.read_csv(rep))}
+        for fmt, snap in snaps.items():
+            res["frame"][f"snapshot_{fmt}"] = timed(lambda: columnar.read_report(rep, snap).to_pandas())
+    print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_report_writer.py — Reporte en vivo: fsync por fila vs group commit
+
+  * legacy  : DictWriter + flush + fsync por fila (lo que hacía send.py)
+  * strict / batched / none : report_writer.ReportWriter
+
+Mide filas/seg y número de fsync; con --kill comprueba además que un
+SIGTERM a mitad de campaña (modo batched) no pierde filas ya reportadas.
+
+  python bench/bench_report_writer.py --rows 20000 --dir /tmp
+"""
+
+import argparse
+import csv
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from report_writer import DURABILITY, ReportWriter  # noqa: E402
+
+
+def legacy(path: Path, rows: int) -> int:
+    with path.open("a", newline="", encoding="utf-8") as fh:
+        w = csv.DictWriter(fh, fieldnames=["ts", "row", "email", "status", "error"])
+        w.writeheader()
+        for i in range(rows):
+            ts = datetime.now(timezone.utc).isoformat()
+            w.writerow({"ts": ts, "row": i, "email": f"c{i}@example.com", "status": "sent", "error": ""})
+            fh.flush()
+            os.fsync(fh.fileno())
+    return rows + 1
+
+
+def grouped(path: Path, rows: int, durability: str, every_rows: int, every_ms: float) -> int:
+    with ReportWriter(str(path), durability, every_rows, every_ms) as w:
+        for i in range(rows):
+            w.write(i, f"c{i}@example.com", "sent")
+    return w.syncs
+
+
+# Hijo para --kill: escribe filas sin parar e imprime cuántas lleva reportadas
+CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+from report_writer import ReportWriter
+w = ReportWriter({path!r}, "batched", 1000000, 60000)
+w.install_signal_handlers()
+i = 0
+while True:
+    w.write(i, "c%d@example.com" % i, "sent")
+    i += 1
+    if i % 1000 == 0:
+        print(i, flush=True)
+"""
+
+
+def kill_test(path: Path) -> dict:
+    code = CHILD.format(root=str(ROOT), path=str(path))
+    p = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True)
+    reported = 0
+    for line in p.stdout:
+        reported = int(line)
+        if reported >= 5000:
+            break
+    p.send_signal(signal.SIGTERM)
+    p.stdout.read()
+    rc = p.wait()
+    with path.open(newline="", encoding="utf-8") as f:
+        on_disk = sum(1 for _ in csv.reader(f)) - 1
+    return {"exit_code": rc, "reported_before_kill": reported, "rows_on_disk": on_disk,
+            "no_loss": on_disk >= reported}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rendimiento del reporte en vivo según durabilidad")
+    ap.add_argument("--rows", type=int, default=20_000)
+    ap.add_argument("--sync-rows", type=int, default=100)
+    ap.add_argument("--sync-ms", type=float, default=200)
+    ap.add_argument("--dir", default=None, help="Directorio de pruebas (el fsync depende del disco)")
+    ap.add_argument("--kill", action="store_true", help="Probar también SIGTERM a mitad de escritura")
+    args = ap.parse_args()
+
+    res = {"rows": args.rows, "sync_rows": args.sync_rows, "sync_ms": args.sync_ms}
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        modes = [("legacy", lambda p: legacy(p, args.rows))]
+        modes += [(d, lambda p, d=d: grouped(p, args.rows, d, args.sync_rows, args.sync_ms)) for d in DURABILITY]
+        for name, fn in modes:
+            path = Path(tmp) / f"{name}.csv"
+            t0 = time.perf_counter()
+            syncs = fn(path)
+            secs = time.perf_counter() - t0
+            res[name] = {"secs": round(secs, 3), "rows_per_sec": round(args.rows / secs), "fsyncs": syncs}
+        res["speedup_batched"] = round(res["legacy"]["secs"] / res["batched"]["secs"], 1)
+        if args.kill:
+            res["sigterm"] = kill_test(Path(tmp) / "killed.csv")
+    print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_suppression.py — Lista de supresión: importación en bloque y consultas
+
+  * import_list   : fichero con --rows direcciones (suppress.py list)
+  * import_report : reporte de send.py con --rows filas, ~10% rebotes duros
+                    (suppress.py reports)
+  * lookup        : consultas por fila como send.py (mitad suprimidas)
+  * reasons       : consultas por lotes de 100 como /send con varios 'to'
+
+  python bench/bench_suppression.py --rows 500000 --lookups 200000
+"""
+
+import argparse
+import csv
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from app.suppression import SuppressionList, bounces_from_report, emails_from_list  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Lista de supresión: import y lookups")
+    ap.add_argument("--rows", type=int, default=500_000)
+    ap.add_argument("--lookups", type=int, default=200_000)
+    args = ap.parse_args()
+
+    rnd = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        lst = Path(tmp) / "bajas.txt"
+        lst.write_text("".join(f"user{i}@example{i % 97}.com\n" for i in range(args.rows)))
+        rep = Path(tmp) / "report.csv"
+        with rep.open("w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["ts", "row", "email", "status", "error", "error_class"])
+            for i in range(args.rows):
+                if i % 10 == 0:
+                    w.writerow(["", i, f"dead{i}@example.net", "failed",
+                                f"dead{i}@example.net: 550 5.1.1 User unknown", "permanent"])
+                else:
+                    w.writerow(["", i, f"ok{i}@example.net", "sent", "", ""])
+
+        store = SuppressionList(str(Path(tmp) / "suppression.sqlite3"))
+        res = {"rows": args.rows}
+
+        t0 = time.perf_counter()
+        added = store.add_many(emails_from_list(lst))
+        res["import_list"] = {"added": added, "secs": round(time.perf_counter() - t0, 3)}
+
+        t0 = time.perf_counter()
+        added = store.add_many(bounces_from_report(rep))
+        res["import_report"] = {"added": added, "secs": round(time.perf_counter() - t0, 3)}
+
+        picks = [rnd.randrange(args.rows) for _ in range(args.lookups)]
+        probes = [f"user{j}@example{j % 97}.com" if i % 2 else f"fresh{i}@example.org"
+                  for i, j in enumerate(picks)]
+        t0 = time.perf_counter()
+        hits = sum(1 for p in probes if store.reason(p))
+        secs = time.perf_counter() - t0
+        res["lookup"] = {"n": args.lookups, "hits": hits, "us_per_lookup": round(secs / args.lookups * 1e6, 2)}
+
+        t0 = time.perf_counter()
+        hits = sum(len(store.reasons(probes[i:i + 100])) for i in range(0, len(probes), 100))
+        secs = time.perf_counter() - t0
+        res["reasons"] = {"n": args.lookups, "hits": hits, "us_per_address": round(secs / args.lookups * 1e6, 2)}
+        res["db_mb"] = round((Path(tmp) / "suppression.sqlite3").stat().st_size / 2**20, 1)
+        store.close()
+    print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()
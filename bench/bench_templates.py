@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_templates.py — Coste de render por mensaje
+
+Mide el coste único por campaña (fase 1 + compilación) y el coste por
+destinatario (fase 2), con y sin campos de negocio (modo clientes / legacy).
+
+  python bench/bench_templates.py --n 20000 --template wa
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.templating import DEFAULT_TEMPLATES_DIR, TemplateEngine  # noqa: E402
+
+
+def _clients(i: int) -> dict:
+    return {
+        "name": f"Customer {i}",
+        "link": f"https://renewals.example.com/renewal-form/?t={i}&src=wa",
+        "business_name": f"Business {i} LLC",
+        "address": f"{i} Main St, Seattle, WA",
+        "due": "2025-12-31",
+    }
+
+
+def _legacy(i: int) -> dict:
+    return {"name": f"Customer {i}", "link": f"https://renewals.example.com/renewal-form/?email=c{i}%40example.com"}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de render de plantillas")
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--template", default="wa")
+    ap.add_argument("--templates-dir", default=str(DEFAULT_TEMPLATES_DIR))
+    args = ap.parse_args()
+
+    engine = TemplateEngine(args.templates_dir)
+    t0 = time.perf_counter()
+    tpl = engine.campaign(args.template)
+    compile_ms = (time.perf_counter() - t0) * 1000
+
+    results = {"template": args.template, "version": tpl.version, "campaign_compile_ms": round(compile_ms, 3)}
+    for mode, make in (("clients", _clients), ("legacy", _legacy)):
+        recipients = [make(i) for i in range(args.n)]
+        t0 = time.perf_counter()
+        for r in recipients:
+            tpl.render(**r)
+        secs = time.perf_counter() - t0
+        results[mode] = {"messages": args.n, "us_per_msg": round(secs / args.n * 1e6, 2),
+                         "msgs_per_sec": round(args.n / secs, 1)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+loadtest.py — Carga sostenida sobre la API (/send, /send/batch) y send.py
+
+Arranca todo en local:
+  * sumidero SMTP en proceso (smtp_sink.py, aiosmtpd) con latencia opcional
+  * stub de magic-links de WordPress (wp_stub.py)
+  * la API (uvicorn app.main:app) en un subproceso apuntando al sumidero
+
+y para cada escenario y concurrencia mide throughput, latencia p50/p95/p99 y
+CPU por mensaje (de la API leída de /proc, y del cliente: este proceso o
+send.py). Escenarios:
+
+  * send    : N POST /send con C peticiones en vuelo (latencia por petición)
+  * batch   : POST /send/batch de --batch-size elementos, C lotes en vuelo
+  * send_py : send.py --concurrency C sobre un CSV de clientes con magic-links
+              del stub (latencia del lado servidor: histograma de /metrics)
+
+El resultado va a un JSON (--out). Con --baseline compara contra otro JSON y
+sale con código 1 si el throughput cae o el p95 sube más de --tolerance.
+
+  python bench/loadtest.py --messages 2000 --concurrency 1 8 32
+  python bench/loadtest.py --scenarios send --concurrency 16 --smtp-latency 0.005 \\
+      --baseline bench/results/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bench"))
+import smtp_sink  # noqa: E402
+import wp_stub  # noqa: E402
+from bench_csv import make_csv  # noqa: E402
+
+SCENARIOS = ("send", "batch", "send_py")
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max en ms (rango más cercano)."""
+    if not values:
+        return {}
+    v = sorted(values)
+    pick = lambda q: v[min(len(v) - 1, max(0, int(round(q * len(v))) - 1))]  # noqa: E731
+    return {"p50": round(pick(0.50) * 1000, 3), "p95": round(pick(0.95) * 1000, 3),
+            "p99": round(pick(0.99) * 1000, 3), "max": round(v[-1] * 1000, 3)}
+
+
+def proc_cpu(pid: int) -> Optional[float]:
+    """utime + stime (seg) de un proceso (Linux); None si no hay /proc."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / _CLK_TCK
+
+
+def self_cpu() -> float:
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+def children_cpu() -> float:
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+# --------------------------- Histograma de /metrics ---------------------------
+
+_BUCKET = re.compile(r'^smtp_api_request_duration_seconds_bucket\{method="POST",route="([^"]+)",'
+                     r'status="200",le="([^"]+)"\} (\d+)$', re.M)
+
+
+def scrape_buckets(api: str, route: str) -> Dict[float, int]:
+    text = urllib.request.urlopen(f"{api}/metrics", timeout=10).read().decode()
+    return {float(le): int(n) for r, le, n in _BUCKET.findall(text) if r == route}
+
+
+def histogram_percentiles(before: Dict[float, int], after: Dict[float, int]) -> Dict[str, float]:
+    """Percentiles (ms) del delta entre dos lecturas, interpolando dentro del bucket."""
+    les = sorted(after)
+    cum = [after[le] - before.get(le, 0) for le in les]
+    total = cum[-1] if cum else 0
+    if not total:
+        return {}
+    out = {}
+    for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        rank = q * total
+        for i, le in enumerate(les):
+            if cum[i] >= rank:
+                lo, below = (les[i - 1], cum[i - 1]) if i else (0.0, 0)
+                hi = le if le != float("inf") else lo
+                frac = (rank - below) / max(1, cum[i] - below)
+                out[name] = round((lo + (hi - lo) * frac) * 1000, 3)
+                break
+    return out
+
+# --------------------------- Entorno ------------------------------------------
+
+class Environment:
+    """Sumidero SMTP + stub WP en este proceso y la API en un subproceso."""
+
+    def __init__(self, smtp_latency: float, wp_latency: float, api_env: Dict[str, str], log_path: Path) -> None:
+        self.sink = smtp_sink.serve(port=free_port(), latency=smtp_latency)
+        self.wp = wp_stub.serve(port=free_port(), latency=wp_latency)
+        self.wp_url = f"http://127.0.0.1:{self.wp.server_address[1]}"
+        port = free_port()
+        self.api = f"http://127.0.0.1:{port}"
+        env = {**os.environ, "SMTP_HOST": "127.0.0.1", "SMTP_PORT": str(self.sink.port),
+               "SMTP_USER": "", "SMTP_STARTTLS": "false", "API_BEARER_TOKEN": "", **api_env}
+        self._log = log_path.open("w")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+        self._wait_ready()
+
+    def _wait_ready(self, timeout: float = 30.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"La API terminó al arrancar (ver {self._log.name})")
+            try:
+                urllib.request.urlopen(self.api + "/", timeout=1)
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError("La API no respondió a tiempo")
+
+    def api_cpu(self) -> Optional[float]:
+        return proc_cpu(self.proc.pid)
+
+    def sink_messages(self) -> int:
+        return self.sink.handler.stats()["messages"]
+
+    def close(self) -> None:
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._log.close()
+        self.sink.stop()
+        self.wp.shutdown()
+
+# --------------------------- Escenarios ---------------------------------------
+
+def _payload(i: int) -> dict:
+    return {"to": [f"load{i}@example.com"], "subject": "Washington Annual Report | 2025 Filing Reminder",
+            "body_text": f"Hola {i}, renueve aquí: https://renewals.example.com/?t={i}",
+            "body_html": f"<p>Hola {i}, <a href='https://renewals.example.com/?t={i}'>renueve aquí</a></p>"}
+
+
+async def _drive(url: str, bodies: List, concurrency: int) -> tuple:
+    """Lanza los cuerpos con `concurrency` peticiones en vuelo; (latencias, errores)."""
+    latencies: List[float] = []
+    errors = 0
+    it = iter(bodies)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        async def worker():
+            nonlocal errors
+            for body in it:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post(url, json=body)
+                    ok = r.status_code == 200 and (not isinstance(body, list) or r.json().get("failed") == 0)
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - t0)
+                errors += not ok
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_http(env: Environment, scenario: str, messages: int, concurrency: int, batch_size: int) -> dict:
+    if scenario == "batch":
+        bodies = [[_payload(i + j) for j in range(min(batch_size, messages - i))] for i in range(0, messages, batch_size)]
+        url = env.api + "/send/batch"
+    else:
+        bodies = [_payload(i) for i in range(messages)]
+        url = env.api + "/send"
+    asyncio.run(_drive(url, bodies[:max(1, len(bodies) // 20)], concurrency))  # calentamiento
+
+    sink0, api0, me0 = env.sink_messages(), env.api_cpu(), self_cpu()
+    t0 = time.perf_counter()
+    latencies, errors = asyncio.run(_drive(url, bodies, concurrency))
+    secs = time.perf_counter() - t0
+    return _result(env, scenario, concurrency, messages, secs, percentiles(latencies), errors,
+                   sink0, api0, {"driver": self_cpu() - me0}, requests=len(bodies))
+
+
+def run_send_py(env: Environment, messages: int, concurrency: int, workdir: Path) -> dict:
+    src = workdir / f"clients_{messages}.csv"
+    if not src.exists():
+        make_csv(src, messages)
+    report = workdir / f"report_c{concurrency}.csv"
+    report.unlink(missing_ok=True)
+    cmd = [sys.executable, str(ROOT / "send.py"), "--csv", str(src), "--report", str(report),
+           "--api", env.api + "/send", "--delay", "0", "--concurrency", str(concurrency),
+           "--wp-magic-url", env.wp_url + "/magic-link", "--wp-magic-bulk-url", env.wp_url + "/magic-links"]
+
+    before = scrape_buckets(env.api, "/send")
+    sink0, api0, ch0 = env.sink_messages(), env.api_cpu(), children_cpu()
+    t0 = time.perf_counter()
+    res = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    secs = time.perf_counter() - t0
+    if res.returncode != 0:
+        raise RuntimeError(f"send.py falló:\n{res.stderr[-2000:]}")
+    lat = histogram_percentiles(before, scrape_buckets(env.api, "/send"))
+    with report.open(encoding="utf-8") as f:
+        errors = sum(1 for line in f if ",failed," in line)
+    return _result(env, "send_py", concurrency, messages, secs, lat, errors,
+                   sink0, api0, {"send_py": children_cpu() - ch0}, latency_source="server_histogram")
+
+
+def _result(env, scenario, concurrency, messages, secs, latency, errors, sink0, api0, client_cpu, **extra) -> dict:
+    api1 = env.api_cpu()
+    delivered = env.sink_messages() - sink0
+    cpu = {k: round(v / max(1, messages) * 1000, 4) for k, v in client_cpu.items()}
+    if api0 is not None and api1 is not None:
+        cpu["api"] = round((api1 - api0) / max(1, messages) * 1000, 4)
+    return {"scenario": scenario, "concurrency": concurrency, "messages": messages, "delivered": delivered,
+            "errors": errors, "secs": round(secs, 3), "msgs_per_sec": round(messages / secs, 1),
+            "latency_ms": latency, "cpu_ms_per_msg": cpu, **extra}
+
+# --------------------------- Regresiones --------------------------------------
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> List[str]:
+    base = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    problems = []
+    for r in results:
+        b = base.get((r["scenario"], r["concurrency"]))
+        if b is None:
+            continue
+        tag = f'{r["scenario"]}@c{r["concurrency"]}'
+        if r["msgs_per_sec"] < b["msgs_per_sec"] * (1 - tolerance):
+            problems.append(f'{tag}: msgs/s {b["msgs_per_sec"]} -> {r["msgs_per_sec"]}')
+        p95, bp95 = r["latency_ms"].get("p95"), b.get("latency_ms", {}).get("p95")
+        if p95 and bp95 and p95 > bp95 * (1 + tolerance):
+            problems.append(f"{tag}: p95 {bp95}ms -> {p95}ms")
+    return problems
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Prueba de carga de la API y send.py contra un SMTP local")
+    ap.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--messages", type=int, default=2000, help="Mensajes por escenario y concurrencia")
+    ap.add_argument("--batch-size", type=int, default=100, help="Elementos por POST /send/batch")
+    ap.add_argument("--smtp-latency", type=float, default=0.0, help="Latencia del sumidero en DATA (seg)")
+    ap.add_argument("--wp-latency", type=float, default=0.0, help="Latencia del stub de magic-links (seg)")
+    ap.add_argument("--api-env", nargs="*", default=[], metavar="KEY=VAL",
+                    help="Variables para la API (p.ej. SMTP_POOL_MAX=16 SEND_MODE=queue)")
+    ap.add_argument("--out", default="", help="JSON de resultados (por defecto bench/results/loadtest_<fecha>.json)")
+    ap.add_argument("--baseline", default="", help="JSON previo con el que comparar")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="Empeoramiento tolerado frente a --baseline")
+    args = ap.parse_args()
+
+    api_env = dict(kv.split("=", 1) for kv in args.api_env)
+    out = Path(args.out or ROOT / "bench" / "results" / f"loadtest_{datetime.now():%Y%m%d_%H%M%S}.json")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = Environment(args.smtp_latency, args.wp_latency, api_env, Path(tmp) / "api.log")
+        try:
+            for scenario in args.scenarios:
+                for c in args.concurrency:
+                    if scenario == "send_py":
+                        r = run_send_py(env, args.messages, c, Path(tmp))
+                    else:
+                        r = run_http(env, scenario, args.messages, c, args.batch_size)
+                    print(json.dumps(r), file=sys.stderr)
+                    results.append(r)
+        finally:
+            env.close()
+
+    doc = {
+        "meta": {"ts": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                 "python": platform.python_version(), "cpus": os.cpu_count(),
+                 "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")}},
+        "results": results,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, indent=2), encoding="utf-8")
+    print(f"Resultados: {out}")
+
+    if args.baseline:
+        problems = compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        for p in problems:
+            print(f"REGRESIÓN {p}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
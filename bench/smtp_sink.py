@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+smtp_sink.py — Servidor SMTP local que acepta y descarta todo (pruebas de carga)
+
+Cuenta mensajes, destinatarios y bytes; opcionalmente añade latencia en DATA
+y rechaza un porcentaje de mensajes (4xx) para ejercitar los reintentos.
+Con --dkim verifica la firma DKIM de cada mensaje (app/dkim.py, sin DNS) y
+cuenta el resultado.
+
+Requiere aiosmtpd (solo para bench: pip install aiosmtpd).
+
+  python bench/smtp_sink.py --port 8025 --latency 0.01
+  python bench/smtp_sink.py --dkim e-filemycorporation.com=s2025:/etc/dkim/efmc.pem
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+from pathlib import Path
+
+from aiosmtpd.controller import Controller
+
+
+def dkim_public_keys(specs):
+    """{(dominio, selector): clave pública} de entradas DOMINIO=[SELECTOR:]PEM (PEM privado, como DKIM_KEYS)."""
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from app.dkim import DkimKey
+
+    keys = {}
+    for spec in specs:
+        domain, _, key_spec = spec.partition("=")
+        key = DkimKey.load(domain, key_spec)
+        keys[(key.domain, key.selector)] = key.private.public_key()
+    return keys
+
+
+class SinkHandler:
+    def __init__(self, latency: float = 0.0, fail_rate: float = 0.0, dkim_keys=None) -> None:
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.dkim_keys = dkim_keys
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.rcpts = 0
+        self.bytes = 0
+        self.rejected = 0
+        self.dkim = {}
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            with self.lock:
+                self.rejected += 1
+            return "451 4.3.0 Temporary failure (sink)"
+        result = None
+        if self.dkim_keys is not None:
+            from app.dkim import verify
+            result = verify(envelope.original_content or b"", self.dkim_keys)[1]
+        with self.lock:
+            self.messages += 1
+            self.rcpts += len(envelope.rcpt_tos)
+            self.bytes += len(envelope.original_content or b"")
+            if result is not None:
+                self.dkim[result] = self.dkim.get(result, 0) + 1
+        return "250 OK"
+
+    def stats(self) -> dict:
+        with self.lock:
+            out = {"messages": self.messages, "rcpts": self.rcpts, "bytes": self.bytes, "rejected": self.rejected}
+            if self.dkim_keys is not None:
+                out["dkim"] = dict(self.dkim)
+            return out
+
+
+def serve(host: str = "127.0.0.1", port: int = 8025, latency: float = 0.0, fail_rate: float = 0.0,
+          dkim_keys=None) -> Controller:
+    """Arranca el sink en un hilo (controller.stop() para pararlo; controller.handler.stats())."""
+    controller = Controller(SinkHandler(latency, fail_rate, dkim_keys), hostname=host, port=port,
+                            data_size_limit=0, decode_data=False)
+    controller.start()
+    return controller
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sumidero SMTP local")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8025)
+    ap.add_argument("--latency", type=float, default=0.0, help="Latencia artificial en DATA (seg)")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="Fracción de mensajes rechazados con 451")
+    ap.add_argument("--dkim", action="append", default=[], metavar="DOMINIO=[SELECTOR:]PEM",
+                    help="Verificar DKIM con esta clave (repetible; mismo formato que DKIM_KEYS)")
+    args = ap.parse_args()
+
+    controller = serve(args.host, args.port, args.latency, args.fail_rate,
+                       dkim_public_keys(args.dkim) if args.dkim else None)
+    print(f"SMTP sink en {args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        controller.stop()
+        print(json.dumps(controller.handler.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+wp_stub.py — Servidor WordPress de mentira para magic-links (pruebas locales)
+
+  POST /magic-link   {"business_id": "123"} | {"email": "a@b.com"}  -> {"url": "..."}
+  POST /magic-links  {"business_ids": [...]} | {"emails": [...]}    -> {"urls": {...}}
+  GET  /stats        -> {"single": N, "bulk": N, "ids": N}
+
+IDs que empiezan por "missing" no tienen link (magic_no_url).
+
+  python bench/wp_stub.py --port 8090 --latency 0.05
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.single = 0
+        self.bulk = 0
+        self.ids = 0
+
+
+def make_handler(latency: float, api_key: str, stats: _Stats):
+    def link_for(value: str) -> str:
+        if value.startswith("missing"):
+            return ""
+        return f"https://renewals.example.com/renewal-form/?t={urllib.parse.quote(value)}"
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def log_message(self, *a):
+            pass
+
+        def _reply(self, code: int, body) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                return self._reply(200, {"single": stats.single, "bulk": stats.bulk, "ids": stats.ids})
+            self._reply(404, {"error": "not_found"})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if api_key and self.headers.get("x-comown-key") != api_key:
+                return self._reply(401, {"error": "bad_key"})
+            if latency:
+                time.sleep(latency)
+
+            if self.path == "/magic-link":
+                value = str(body.get("business_id") or body.get("email") or "")
+                with stats.lock:
+                    stats.single += 1
+                    stats.ids += 1
+                url = link_for(value)
+                return self._reply(200, {"url": url} if url else {})
+
+            if self.path == "/magic-links":
+                values = [str(v) for v in (body.get("business_ids") or body.get("emails") or [])]
+                with stats.lock:
+                    stats.bulk += 1
+                    stats.ids += len(values)
+                return self._reply(200, {"urls": {v: link_for(v) for v in values if link_for(v)}})
+
+            self._reply(404, {"error": "not_found"})
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8090, latency: float = 0.0, api_key: str = "") -> ThreadingHTTPServer:
+    """Arranca el stub en un hilo y lo devuelve (server.shutdown() para pararlo)."""
+    stats = _Stats()
+    server = ThreadingHTTPServer((host, port), make_handler(latency, api_key, stats))
+    server.daemon_threads = True
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Stub local de magic-links de WordPress")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8090)
+    ap.add_argument("--latency", type=float, default=0.0, help="Latencia artificial por petición (seg)")
+    ap.add_argument("--api-key", default="", help="x-comown-key exigida (vacío = no se valida)")
+    args = ap.parse_args()
+
+    server = serve(args.host, args.port, args.latency, args.api_key)
+    print(f"WP stub en http://{args.host}:{args.port} (/magic-link, /magic-links, /stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+clean_contacts.py — Limpieza del CSV de actividad (antes en EDA.ipynb)
+
+Una sola lectura del CSV (todo como texto) y operaciones vectorizadas de
+pandas (.str) en lugar de .apply fila a fila:
+
+  1. Quita filas completamente vacías y las que no tienen BusinessID,
+     Business Name o UBI Number.
+  2. Email: strip + minúsculas (+ --repair-emails: quita espacios y
+     caracteres no válidos, como limpiar_correo) y validación por regex;
+     los inválidos quedan vacíos.
+  3. BusinessID normalizado ("12345.0" -> "12345", igual que send.py).
+  4. Business Name / Responsible Person / Address: espacios colapsados y
+     cada palabra capitalizada. UBI Number: mayúsculas, solo [A-Z0-9-].
+  5. NextARDueDate a YYYY-MM-DD (formatos conocidos; el resto vacío).
+  6. Duplicados por BusinessID y luego por UBI Number (gana la primera);
+     con --dedup-email, también por email normalizado.
+
+Con --chunk-rows N lee y escribe por tramos: la dedup entre tramos usa
+huellas de 64 bits (HashSet) y el reporte se acumula (CleaningStats).
+
+Escribe la lista limpia (CSV, o Parquet/Arrow si --out termina en
+.parquet/.arrow) y reporte_limpieza.json con las mismas estadísticas que
+el notebook.
+
+  python clean_contacts.py actividad.csv --out actividad_final.csv \
+      --report reporte_limpieza.json --backup-dir backup/ [--chunk-rows 100000]
+"""
+
+import argparse
+import contextlib
+import json
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from columnar import ContactsWriter, columnar_format, write_contacts
+
+EMAIL_PATTERN = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
+EMAIL_JUNK = r"[^a-zA-Z0-9._%+\-@]"
+
+KEY_COLUMNS = ["BusinessID", "Business Name", "UBI Number"]
+TEXT_COLUMNS = ["Business Name", "Responsible Person", "Address"]
+COLUMN_ORDER = ["BusinessID", "UBI Number", "Business Name", "Responsible Person",
+                "Email", "Address", "NextARDueDate"]
+DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d", "%d-%m-%Y", "%m-%d-%Y", "%Y%m%d"]
+
+# --------------------------- Pasos (vectorizados) -----------------------------
+
+def _blank_to_na(s: pd.Series) -> pd.Series:
+    return s.mask(s == "")
+
+
+def clean_emails(s: pd.Series, repair: bool = False) -> pd.Series:
+    """Emails normalizados; los que no pasan la regex -> NA."""
+    s = s.str.strip().str.lower()
+    if repair:
+        s = s.str.replace(r"\s+", "", regex=True).str.replace(EMAIL_JUNK, "", regex=True)
+    return s.where(s.str.fullmatch(EMAIL_PATTERN, na=False))
+
+
+def norm_business_ids(s: pd.Series) -> pd.Series:
+    """Versión vectorizada de contacts_csv.norm_business_id."""
+    return s.str.strip().str.replace(r"^(\d+)\.0$", r"\1", regex=True)
+
+
+def clean_text(s: pd.Series) -> pd.Series:
+    """Espacios colapsados y str.capitalize por palabra."""
+    s = s.str.strip().str.replace(r"\s+", " ", regex=True)
+    # .str.title() coincide salvo con una letra tras dígito/símbolo dentro de
+    # la palabra ("3rd" -> "3Rd", "o'neil" -> "O'Neil"): solo esas filas por palabra.
+    out = s.str.title()
+    odd = s.str.contains(r"[^A-Za-z\s][A-Za-z]|[^\x00-\x7f]", regex=True, na=False)
+    if odd.any():
+        out[odd] = s[odd].str.replace(r"\S+", lambda m: m.group(0).capitalize(), regex=True)
+    return out
+
+
+def clean_ubi(s: pd.Series) -> pd.Series:
+    return _blank_to_na(s.str.strip().str.upper().str.replace(r"[^A-Z0-9-]", "", regex=True))
+
+
+def parse_dates(s: pd.Series) -> pd.Series:
+    """Primer formato de DATE_FORMATS que encaje -> YYYY-MM-DD; si ninguno, NA."""
+    s = s.str.strip()
+    out = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+    for fmt in DATE_FORMATS:
+        todo = out.isna() & s.notna()
+        if not todo.any():
+            break
+        out[todo] = pd.to_datetime(s[todo], format=fmt, errors="coerce")
+    return out.dt.strftime("%Y-%m-%d").where(out.notna())
+
+
+def normalize_chunk(df: pd.DataFrame, repair_emails: bool = False) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """Pasos 1-5 sobre un DataFrame/tramo leído con dtype=str (sin deduplicar)."""
+    missing = [c for c in KEY_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"faltan columnas requeridas: {missing}")
+    steps: Dict[str, int] = {"originales": len(df)}
+
+    df = df.dropna(how="all")
+    steps["tras_vacias"] = len(df)
+    df = df.dropna(subset=KEY_COLUMNS)
+    steps["tras_claves"] = len(df)
+
+    df = df.assign(BusinessID=norm_business_ids(df["BusinessID"]))
+    if "Email" in df.columns:
+        before = int(df["Email"].notna().sum())
+        df["Email"] = clean_emails(df["Email"], repair=repair_emails)
+        steps["emails_descartados"] = before - int(df["Email"].notna().sum())
+    for col in TEXT_COLUMNS:
+        if col in df.columns:
+            df[col] = clean_text(df[col])
+    if "UBI Number" in df.columns:
+        df["UBI Number"] = clean_ubi(df["UBI Number"])
+    if "NextARDueDate" in df.columns:
+        df["NextARDueDate"] = parse_dates(df["NextARDueDate"])
+    return df, steps
+
+
+def clean_contacts(df: pd.DataFrame, repair_emails: bool = False,
+                   dedup_email: bool = False) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Limpia un DataFrame leído con dtype=str. Devuelve (df_final, conteos por paso).
+    No modifica `df`.
+    """
+    df, steps = normalize_chunk(df, repair_emails)
+    before = len(df)
+    df = Deduper(by_email=dedup_email).filter(df)
+    steps["duplicados"] = before - len(df)
+
+    cols = [c for c in COLUMN_ORDER if c in df.columns]
+    df = df[cols].reset_index(drop=True)
+    steps["finales"] = len(df)
+    return df, steps
+
+# --------------------------- Dedup entre tramos -------------------------------
+
+def hash_values(s: pd.Series) -> np.ndarray:
+    """Huellas uint64 de los valores de una Series (claves de HashSet)."""
+    return pd.util.hash_pandas_object(s, index=False).to_numpy()
+
+
+class HashSet:
+    """
+    Conjunto de huellas de 64 bits en un array ordenado de uint64 (8 bytes
+    por clave, frente a ~100 de un set de str). Colisión: ~n²/2⁶⁵, despreciable.
+    """
+
+    def __init__(self) -> None:
+        self._keys = np.empty(0, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add_new(self, hashes: np.ndarray) -> np.ndarray:
+        """Máscara de las posiciones cuya huella no se había visto (primera aparición); las añade."""
+        uniq, first = np.unique(hashes, return_index=True)
+        pos = np.searchsorted(self._keys, uniq)
+        seen = pos < len(self._keys)
+        seen[seen] = self._keys[pos[seen]] == uniq[seen]
+        mask = np.zeros(len(hashes), dtype=bool)
+        mask[first[~seen]] = True
+        self._keys = np.insert(self._keys, pos[~seen], uniq[~seen])
+        return mask
+
+    def to_bytes(self) -> bytes:
+        return self._keys.astype("<u8").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HashSet":
+        hs = cls()
+        hs._keys = np.frombuffer(data, dtype="<u8").astype(np.uint64)
+        return hs
+
+
+class Deduper:
+    """
+    Duplicados por BusinessID y luego por UBI Number (gana la primera) y,
+    con by_email, por email normalizado. Tramo a tramo da lo mismo que
+    drop_duplicates sobre el fichero entero.
+    """
+
+    def __init__(self, by_email: bool = False) -> None:
+        self.bids = HashSet()
+        self.ubis = HashSet()
+        self.emails = HashSet() if by_email else None
+
+    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df[self.bids.add_new(hash_values(df["BusinessID"]))]
+        if "UBI Number" in df.columns:
+            df = df[self.ubis.add_new(hash_values(df["UBI Number"]))]
+        if self.emails is not None and "Email" in df.columns:
+            # Sin email no es duplicado de nadie
+            has = df["Email"].notna().to_numpy()
+            keep = np.ones(len(df), dtype=bool)
+            keep[has] = self.emails.add_new(hash_values(df["Email"][has]))
+            df = df[keep]
+        return df
+
+# --------------------------- Reporte ------------------------------------------
+
+class CleaningStats:
+    """Completitud y valores únicos por columna, acumulados tramo a tramo."""
+
+    def __init__(self) -> None:
+        self.original = 0
+        self.final = 0
+        self.columns: List[str] = []
+        self.counts: Dict[str, int] = {}
+        self._uniques: Dict[str, HashSet] = {}
+
+    def add(self, n_original: int, df: pd.DataFrame) -> None:
+        self.original += n_original
+        self.final += len(df)
+        for col in df.columns:
+            if col not in self.counts:
+                self.columns.append(col)
+                self.counts[col] = 0
+                self._uniques[col] = HashSet()
+            values = df[col].dropna()
+            self.counts[col] += len(values)
+            self._uniques[col].add_new(hash_values(values))
+
+    def uniques(self, col: str) -> int:
+        return len(self._uniques[col]) if col in self._uniques else 0
+
+    def report(self, files: List[str]) -> Dict:
+        """Mismo esquema que reporte_limpieza.json del notebook."""
+        n, n_original = self.final, self.original
+        pct = (lambda x: float(x / n * 100)) if n else (lambda x: 0.0)
+        count = self.counts.get
+        return {
+            "fecha_procesamiento": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "registros_originales": int(n_original),
+            "registros_finales": int(n),
+            "registros_eliminados": int(n_original - n),
+            "porcentaje_retencion": float(n / n_original * 100) if n_original else 0.0,
+            "columnas_procesadas": list(self.columns),
+            "estadisticas_completitud": {
+                col: {
+                    "valores_no_nulos": count(col, 0),
+                    "porcentaje_completitud": pct(count(col, 0)),
+                    "valores_unicos": self.uniques(col),
+                }
+                for col in self.columns
+            },
+            "archivos_generados": files,
+            "estadisticas_detalladas": {
+                "emails_validos": count("Email", 0),
+                "emails_porcentaje": pct(count("Email", 0)),
+                "fechas_validas": count("NextARDueDate", 0),
+                "fechas_porcentaje": pct(count("NextARDueDate", 0)),
+                "businessid_unicos": self.uniques("BusinessID"),
+                "ubi_unicos": self.uniques("UBI Number"),
+            },
+        }
+
+
+def build_report(n_original: int, df: pd.DataFrame, files: List[str]) -> Dict:
+    """Reporte de un DataFrame ya limpio (todo en memoria)."""
+    stats = CleaningStats()
+    stats.add(n_original, df)
+    return stats.report(files)
+
+# --------------------------- Fichero -> fichero -------------------------------
+
+def read_contacts(path: str, chunk_rows: int = 0):
+    """
+    CSV (o .csv.gz) todo como texto: sin tipos mixtos ni floats en BusinessID.
+    Con chunk_rows > 0 devuelve un iterador de DataFrames de ese tamaño.
+    """
+    if chunk_rows > 0:
+        return pd.read_csv(path, dtype=str, keep_default_na=True, chunksize=chunk_rows)
+    return pd.read_csv(path, dtype=str, keep_default_na=True, low_memory=False)
+
+
+def clean_file(src: str, out: str, report: Optional[str] = None, backup_dir: Optional[str] = None,
+               repair_emails: bool = False, dedup_email: bool = False, chunk_rows: int = 0) -> Dict:
+    """
+    Lee `src` una vez, escribe el CSV limpio (+ backup) y, si se pide, el reporte. Devuelve el reporte.
+
+    Con chunk_rows > 0 trabaja por tramos: memoria acotada por el tramo más
+    las huellas de dedup/únicos (8 bytes por valor), y el CSV de salida se
+    escribe a medida que avanza.
+    """
+    Path(out).expanduser().parent.mkdir(parents=True, exist_ok=True)
+    stats = CleaningStats()
+    columnar = columnar_format(out) is not None
+
+    if chunk_rows > 0:
+        dedup = Deduper(by_email=dedup_email)
+        writer = None
+        with contextlib.ExitStack() as stack:
+            fh = None if columnar else stack.enter_context(open(out, "w", newline="", encoding="utf-8"))
+            for chunk in read_contacts(src, chunk_rows):
+                df, _ = normalize_chunk(chunk, repair_emails)
+                df = dedup.filter(df)
+                df = df[[c for c in COLUMN_ORDER if c in df.columns]]
+                if columnar:
+                    if writer is None:
+                        writer = ContactsWriter(out, list(df.columns))
+                    writer.write(df)
+                else:
+                    df.to_csv(fh, index=False, header=stats.original == 0)
+                stats.add(len(chunk), df)
+            if columnar:
+                if writer is None:
+                    writer = ContactsWriter(out, list(COLUMN_ORDER))
+                writer.close()
+    else:
+        raw = read_contacts(src)
+        df, _ = clean_contacts(raw, repair_emails=repair_emails, dedup_email=dedup_email)
+        if columnar:
+            write_contacts(df, out)
+        else:
+            df.to_csv(out, index=False, encoding="utf-8")
+        stats.add(len(raw), df)
+
+    files = [str(Path(out).resolve())]
+    if backup_dir:
+        Path(backup_dir).mkdir(parents=True, exist_ok=True)
+        backup = Path(backup_dir) / f"{Path(out).stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{Path(out).suffix}"
+        shutil.copyfile(out, backup)
+        files.append(str(backup.resolve()))
+
+    rep = stats.report(files)
+    if report:
+        with open(report, "w", encoding="utf-8") as f:
+            json.dump(rep, f, indent=2, ensure_ascii=False)
+    return rep
+
+# --------------------------- CLI ----------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Limpia el CSV de actividad y genera reporte_limpieza.json")
+    ap.add_argument("csv", help="CSV de entrada (BusinessID, UBI Number, Business Name, ..., Email)")
+    ap.add_argument("--out", required=True, help="Salida limpia: .csv, o .parquet/.arrow (requiere pyarrow)")
+    ap.add_argument("--report", default="reporte_limpieza.json", help="JSON de estadísticas (vacío = no escribir)")
+    ap.add_argument("--backup-dir", default="", help="Copia con timestamp del CSV limpio en este directorio")
+    ap.add_argument("--repair-emails", action="store_true",
+                    help="Quitar espacios/caracteres no válidos del email antes de validarlo")
+    ap.add_argument("--dedup-email", action="store_true", help="Quitar también filas con un email ya visto")
+    ap.add_argument("--chunk-rows", type=int, default=0,
+                    help="Procesar por tramos de N filas (memoria acotada). 0 = todo en memoria")
+    args = ap.parse_args()
+
+    if not Path(args.csv).expanduser().exists():
+        sys.exit(f"CSV no encontrado: {args.csv}")
+
+    t0 = time.monotonic()
+    try:
+        rep = clean_file(args.csv, args.out, args.report or None, args.backup_dir or None,
+                         args.repair_emails, args.dedup_email, args.chunk_rows)
+    except ValueError as e:
+        sys.exit(f"ERROR: {e}")
+    print(f"Registros: {rep['registros_originales']:,} -> {rep['registros_finales']:,} "
+          f"({rep['porcentaje_retencion']:.1f}% retenido) en {time.monotonic() - t0:.2f}s")
+    print(f"Emails válidos: {rep['estadisticas_detalladas']['emails_validos']:,}")
+    for path in rep["archivos_generados"]:
+        print(f"Guardado: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+columnar.py — Parquet / Arrow (opcional) para listas limpias y reportes de envío
+
+  * Formato por extensión: .parquet/.pq -> Parquet (zstd);
+    .arrow/.feather/.ipc -> Arrow IPC (lz4, lectura con mmap).
+  * Reporte de envío (ts,row,email,status,error,error_class) con tipos:
+        ts timestamp UTC, row int64, status/error/error_class diccionario
+        (categorical en pandas). Reportes antiguos sin error_class valen igual.
+    El reporte en vivo sigue siendo CSV (append, report_writer.py); de él se
+    saca una instantánea columnar que se reutiliza mientras el CSV no cambie.
+  * Lista de contactos limpia: texto + NextARDueDate como fecha; se puede
+    escribir de una vez o por tramos (ContactsWriter).
+
+Requiere pyarrow; sin él todo sigue funcionando con CSV (HAVE_ARROW = False).
+"""
+
+import os
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+    HAVE_ARROW = True
+except ImportError:  # pragma: no cover - depende del entorno
+    pa = None
+    HAVE_ARROW = False
+
+_FORMATS = {".parquet": "parquet", ".pq": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+
+REPORT_COLUMNS = ["ts", "row", "email", "status", "error", "error_class"]
+# Metadatos de la instantánea: de qué versión del CSV sale
+_SRC_SIZE = b"source_size"
+_SRC_MTIME = b"source_mtime_ns"
+
+
+def columnar_format(path) -> Optional[str]:
+    """"parquet", "arrow" o None (CSV) según la extensión."""
+    return _FORMATS.get(Path(path).suffix.lower())
+
+
+def require_arrow() -> None:
+    if not HAVE_ARROW:
+        raise RuntimeError("Parquet/Arrow requiere pyarrow (pip install pyarrow)")
+
+# --------------------------- Lectura / escritura ------------------------------
+
+def read_table(path, columns: Optional[List[str]] = None) -> "pa.Table":
+    require_arrow()
+    if columnar_format(path) == "arrow":
+        return feather.read_table(str(path), columns=columns, memory_map=True)
+    return pq.read_table(str(path), columns=columns)
+
+
+def read_schema(path) -> "pa.Schema":
+    require_arrow()
+    if columnar_format(path) == "arrow":
+        return ipc.open_file(pa.memory_map(str(path))).schema
+    return pq.read_schema(str(path))
+
+
+def iter_batches(path, batch_rows: int = 65536, columns: Optional[List[str]] = None) -> Iterable["pa.RecordBatch"]:
+    """RecordBatches en streaming (Parquet por row groups; Arrow IPC con mmap)."""
+    require_arrow()
+    if columnar_format(path) == "arrow":
+        yield from read_table(path, columns).to_batches(max_chunksize=batch_rows)
+    else:
+        yield from pq.ParquetFile(str(path)).iter_batches(batch_size=batch_rows, columns=columns)
+
+
+def text_column(arr) -> List[str]:
+    """Columna Arrow -> lista de str ("" para nulos; fechas en YYYY-MM-DD)."""
+    if not pa.types.is_string(arr.type) and not pa.types.is_large_string(arr.type):
+        arr = arr.cast(pa.string())
+    return arr.fill_null("").to_pylist()
+
+
+def write_table(table: "pa.Table", path) -> None:
+    """Escritura atómica (tmp + rename): un lector nunca ve un fichero a medias."""
+    require_arrow()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")  # único por proceso: varios escritores no se pisan
+    if columnar_format(path) == "arrow":
+        feather.write_feather(table, str(tmp), compression="lz4")
+    else:
+        pq.write_table(table, str(tmp), compression="zstd")
+    os.replace(tmp, path)
+
+# --------------------------- Reportes de envío --------------------------------
+
+def _report_from_csv(csv_path) -> "pa.Table":
+    parse = pa_csv.ParseOptions(invalid_row_handler=lambda row: "skip")  # última línea truncada por un crash
+    types = {"ts": pa.timestamp("us", tz="UTC"), "row": pa.int64(),
+             "email": pa.string(), "status": pa.string(), "error": pa.string(), "error_class": pa.string()}
+    try:
+        table = pa_csv.read_csv(str(csv_path), parse_options=parse, convert_options=pa_csv.ConvertOptions(
+            column_types=types, strings_can_be_null=True))
+    except pa.ArrowInvalid:
+        # ts/row con valores raros (reportes viejos o editados a mano): todo texto
+        table = pa_csv.read_csv(str(csv_path), parse_options=parse, convert_options=pa_csv.ConvertOptions(
+            column_types={c: pa.string() for c in REPORT_COLUMNS}, strings_can_be_null=True))
+    for col in ("status", "error", "error_class"):
+        i = table.schema.get_field_index(col)
+        if i >= 0:
+            table = table.set_column(i, col, table.column(i).dictionary_encode())
+    return table
+
+
+def _source_stamp(csv_path) -> dict:
+    st = os.stat(csv_path)
+    return {_SRC_SIZE: str(st.st_size).encode(), _SRC_MTIME: str(st.st_mtime_ns).encode()}
+
+
+def _snapshot_is_fresh(csv_path, snapshot) -> bool:
+    if not Path(snapshot).exists():
+        return False
+    meta = read_schema(snapshot).metadata or {}
+    stamp = _source_stamp(csv_path)
+    return all(meta.get(k) == v for k, v in stamp.items())
+
+
+def snapshot_report(csv_path, snapshot) -> "pa.Table":
+    """Convierte el reporte CSV a Parquet/Arrow (marcando de qué CSV sale) y devuelve la tabla."""
+    stamp = _source_stamp(csv_path)
+    table = _report_from_csv(csv_path)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **stamp})
+    write_table(table, snapshot)
+    return table
+
+
+def read_report(path, snapshot=None, refresh: bool = True) -> "pa.Table":
+    """
+    Reporte como tabla Arrow. `path` puede ser CSV o columnar. Con `snapshot`
+    (CSV -> .parquet/.arrow) se lee la instantánea si el CSV no cambió desde
+    que se hizo; si no, se reparsea el CSV y se rehace. Con refresh=False la
+    instantánea solo se lee, nunca se escribe (p.ej. los hijos de --shards:
+    la prepara el padre).
+    """
+    require_arrow()
+    if columnar_format(path):
+        return read_table(path)
+    if snapshot:
+        if _snapshot_is_fresh(path, snapshot):
+            return read_table(snapshot)
+        if refresh:
+            return snapshot_report(path, snapshot)
+    return _report_from_csv(path)
+
+# --------------------------- Listas de contactos ------------------------------
+
+def contacts_schema(columns: Iterable[str]) -> "pa.Schema":
+    require_arrow()
+    return pa.schema([(c, pa.date32() if c == "NextARDueDate" else pa.string()) for c in columns])
+
+
+def contacts_table(df, schema: "pa.Schema") -> "pa.Table":
+    """DataFrame limpio (texto, fechas YYYY-MM-DD) -> tabla con el esquema dado."""
+    arrays = []
+    for field in schema:
+        arr = pa.array(df[field.name].to_numpy(dtype=object, na_value=None), type=pa.string())
+        arrays.append(arr.cast(field.type) if field.type != pa.string() else arr)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class ContactsWriter:
+    """Escribe la lista limpia por tramos en Parquet (row groups) o Arrow IPC (batches)."""
+
+    def __init__(self, path, columns: List[str]) -> None:
+        require_arrow()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.schema = contacts_schema(columns)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        if columnar_format(self.path) == "arrow":
+            self._sink = pa.OSFile(str(self._tmp), "wb")
+            self._writer = ipc.new_file(self._sink, self.schema,
+                                        options=ipc.IpcWriteOptions(compression="lz4"))
+        else:
+            self._sink = None
+            self._writer = pq.ParquetWriter(str(self._tmp), self.schema, compression="zstd")
+
+    def write(self, df) -> None:
+        self._writer.write_table(contacts_table(df, self.schema))
+
+    def close(self) -> None:
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        os.replace(self._tmp, self.path)
+
+
+def write_contacts(df, path) -> None:
+    w = ContactsWriter(path, list(df.columns))
+    w.write(df)
+    w.close()
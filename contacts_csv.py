@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+contacts_csv.py — Lectura en streaming del CSV de contactos para send.py
+
+  * El fichero se abre UNA vez: la cabecera decide el formato y las columnas
+    se resuelven a índices antes de leer la primera fila.
+        legacy  : columna 'gmail' (uno o varios emails separados por coma)
+        clientes: BusinessID + Email (+ UBI Number, Business Name, ...)
+  * Cada fila se entrega como Contact (tupla con nombre): sin dict por fila
+    ni copia de la fila original.
+  * .csv o .csv.gz (se detecta por el contenido, no por la extensión), o
+    .parquet/.arrow (ContactsTable, requiere pyarrow).
+  * chunks(n): listas de n contactos, para procesar por tramos.
+"""
+
+import csv
+import gzip
+import io
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+import columnar
+
+LEGACY = "legacy"
+CLIENTS = "clients"
+
+# campo de Contact -> nombres de columna aceptados (comparación sin mayúsculas/espacios)
+CLIENT_COLUMNS = {
+    "email": ("email",),
+    "business_id": ("businessid", "business id"),
+    "ubi_number": ("ubi number",),
+    "business_name": ("business name",),
+    "responsible_person": ("responsible person",),
+    "address": ("address",),
+    "next_due": ("nextarduedate",),
+}
+REQUIRED_CLIENT_FIELDS = ("business_id", "email")
+
+
+class Contact(NamedTuple):
+    email: str
+    business_id: str = ""
+    ubi_number: str = ""
+    business_name: str = ""
+    responsible_person: str = ""
+    address: str = ""
+    next_due: str = ""
+
+    def get(self, key: str, default: str = "") -> str:
+        """Acceso tipo dict (magic_links y código que recibía filas dict)."""
+        return getattr(self, key, default)
+
+
+_new_contact = tuple.__new__
+_EMPTY = ("",) * (len(Contact._fields) - 1)
+
+
+def norm_business_id(v: str) -> str:
+    v = (v or "").strip()
+    # "12345.0" (exportado desde Excel/pandas) -> "12345"
+    if v.endswith(".0") and v[:-2].isdigit():
+        return v[:-2]
+    return v
+
+
+def open_text(path: Path) -> io.TextIOBase:
+    """Abre un CSV en texto (UTF-8, BOM opcional), descomprimiendo si es gzip."""
+    raw = open(path, "rb")
+    if raw.peek(2)[:2] == b"\x1f\x8b":
+        raw = gzip.GzipFile(fileobj=raw)
+    return io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+
+
+class ContactsCsv:
+    """
+    CSV de contactos abierto una vez. `kind` es LEGACY, CLIENTS o None
+    (cabecera no reconocida); iterarlo entrega Contact.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path).expanduser()
+        self._fh = open_text(self.path)
+        self._reader = csv.reader(self._fh)
+        self.fieldnames: List[str] = next(self._reader, [])
+        self.rows = 0  # filas de datos leídas
+        self._resolve(self.fieldnames)
+
+    def _resolve(self, fieldnames: List[str]) -> None:
+        norm = {}
+        for i, name in enumerate(fieldnames):
+            norm.setdefault(name.strip().lower(), i)
+        self._width = len(fieldnames)
+
+        self.kind: Optional[str] = None
+        self._email_col = -1
+        self._getter = None
+        if "gmail" in norm:
+            self.kind = LEGACY
+            self._email_col = norm["gmail"]
+            return
+
+        idx = {}
+        for field, aliases in CLIENT_COLUMNS.items():
+            idx[field] = next((norm[a] for a in aliases if a in norm), None)
+        if all(idx[f] is not None for f in REQUIRED_CLIENT_FIELDS):
+            self.kind = CLIENTS
+            # Columnas opcionales ausentes -> celda vacía añadida al final de la fila
+            cols = [self._width if idx[f] is None else idx[f] for f in Contact._fields]
+            self._getter = itemgetter(*cols)
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def __enter__(self) -> "ContactsCsv":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[Contact]:
+        if self.kind == LEGACY:
+            return self._iter_legacy()
+        if self.kind == CLIENTS:
+            return self._iter_clients()
+        raise ValueError("CSV no reconocido: usa 'gmail' (legacy) o 'BusinessID' + 'Email' (clientes).")
+
+    def _iter_legacy(self) -> Iterator[Contact]:
+        col = self._email_col
+        for row in self._reader:
+            if not row:
+                continue  # línea en blanco (DictReader también las salta)
+            self.rows += 1
+            raw = row[col].strip() if col < len(row) else ""
+            if not raw:
+                continue
+            if "," not in raw:
+                yield _new_contact(Contact, (raw, *_EMPTY))
+                continue
+            for email in raw.split(","):
+                email = email.strip()
+                if email:
+                    yield _new_contact(Contact, (email, *_EMPTY))
+
+    def _iter_clients(self) -> Iterator[Contact]:
+        getter, width = self._getter, self._width
+        pad = [""] * (width + 1)
+        for row in self._reader:
+            if not row:
+                continue
+            self.rows += 1
+            n = len(row)
+            # La posición `width` es la celda vacía de las columnas opcionales ausentes
+            if n <= width:
+                row.extend(pad[n:])
+            else:
+                row[width] = ""
+            email, bid, *rest = getter(row)
+            yield _new_contact(Contact, (email.strip(), norm_business_id(bid), *rest))
+
+    def chunks(self, size: int) -> Iterator[List[Contact]]:
+        return iter_chunks(self, size)
+
+
+class ContactsTable(ContactsCsv):
+    """
+    Lista de contactos en Parquet/Arrow (p.ej. la salida de clean_contacts
+    --out x.parquet). Mismas reglas de columnas que el CSV; se leen solo las
+    columnas usadas, por batches, ya como texto sin nulos.
+    """
+
+    def __init__(self, path: Path, batch_rows: int = 65536) -> None:
+        self.path = Path(path).expanduser()
+        self.fieldnames = list(columnar.read_schema(self.path).names)
+        self.rows = 0
+        self._batch_rows = batch_rows
+        self._resolve(self.fieldnames)
+
+    def _columns(self, names: List[str]) -> Iterator[list]:
+        """Por batch: una lista de str por columna pedida (None -> columna vacía)."""
+        wanted = [n for n in names if n is not None]
+        for batch in columnar.iter_batches(self.path, self._batch_rows, columns=wanted):
+            cols = {n: columnar.text_column(batch.column(n)) for n in wanted}
+            empty = [""] * batch.num_rows
+            self.rows += batch.num_rows
+            yield [cols[n] if n is not None else empty for n in names]
+
+    def _iter_legacy(self) -> Iterator[Contact]:
+        for (emails,) in self._columns([self.fieldnames[self._email_col]]):
+            for raw in emails:
+                for email in raw.split(","):
+                    email = email.strip()
+                    if email:
+                        yield _new_contact(Contact, (email, *_EMPTY))
+
+    def _iter_clients(self) -> Iterator[Contact]:
+        names = [self.fieldnames[i] if i < self._width else None for i in self._getter(range(self._width + 1))]
+        for cols in self._columns(names):
+            for email, bid, *rest in zip(*cols):
+                yield _new_contact(Contact, (email.strip(), norm_business_id(bid), *rest))
+
+    def close(self) -> None:
+        pass
+
+
+def open_contacts(path: Path) -> ContactsCsv:
+    """ContactsTable para .parquet/.arrow; ContactsCsv para .csv/.csv.gz."""
+    if columnar.columnar_format(path):
+        return ContactsTable(path)
+    return ContactsCsv(path)
+
+
+def iter_chunks(items: Iterable, size: int) -> Iterator[list]:
+    """Listas de hasta `size` elementos, en streaming."""
+    it = iter(items)
+    size = max(1, size)
+    while chunk := list(islice(it, size)):
+        yield chunk
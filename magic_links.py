@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+magic_links.py — Magic-links de WordPress para send.py
+
+  * Llamada simple (un business_id/email por POST), síncrona o async.
+  * Variante bulk: un POST resuelve cientos de IDs.
+        request : {"business_ids": [...]}  o  {"emails": [...]}
+        response: {"urls": {"<id>": "<url>", ...}}   (los que falten -> magic_no_url)
+  * Caché persistente con TTL (SQLite) por business_id/email, para que
+    reintentos y re-ejecuciones no vuelvan a pegarle a WordPress.
+"""
+
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+# --------------------------- Llamada simple ----------------------------------
+
+def _magic_headers(api_key: str) -> Dict[str, str]:
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["x-comown-key"] = api_key
+    return headers
+
+
+def magic_key(prefer: str, client_row: Dict[str, str]) -> Tuple[str, str]:
+    """(valor, error) del identificador que se manda a WordPress."""
+    if prefer == "business_id":
+        bid = (client_row.get("business_id") or "").strip()
+        return (bid, "") if bid else ("", "no_business_id")
+    em = (client_row.get("email") or "").strip()
+    return (em, "") if em else ("", "no_email_for_magic")
+
+
+def _magic_response(status_code: int, body) -> Tuple[str, str]:
+    if status_code != 200:
+        return "", f"magic_http_{status_code}"
+    url = (body or {}).get("url")
+    if not url:
+        return "", "magic_no_url"
+    return url, ""
+
+
+def get_magic_link(api_url: str, api_key: str, prefer: str, client_row: Dict[str, str],
+                   session: Optional[requests.Session] = None) -> Tuple[str, str]:
+    """
+    Devuelve (url, error). prefer in {"business_id","email"}.
+    """
+    value, err = magic_key(prefer, client_row)
+    if err:
+        return "", err
+
+    try:
+        r = (session or requests).post(api_url, json={prefer: value}, headers=_magic_headers(api_key), timeout=20)
+        return _magic_response(r.status_code, r.json() if r.status_code == 200 else None)
+    except Exception as e:
+        return "", f"magic_exc:{str(e)[:160]}"
+
+
+async def get_magic_link_async(client, api_url: str, api_key: str, prefer: str, client_row: Dict[str, str]) -> Tuple[str, str]:
+    """Igual que get_magic_link pero sobre un httpx.AsyncClient compartido."""
+    value, err = magic_key(prefer, client_row)
+    if err:
+        return "", err
+
+    try:
+        r = await client.post(api_url, json={prefer: value}, headers=_magic_headers(api_key), timeout=20)
+        return _magic_response(r.status_code, r.json() if r.status_code == 200 else None)
+    except Exception as e:
+        return "", f"magic_exc:{str(e)[:160]}"
+
+
+async def get_magic_links_bulk(client, bulk_url: str, api_key: str, prefer: str, values: List[str]) -> Tuple[Dict[str, str], str]:
+    """({valor: url}, error). Si error != "", la petición entera falló."""
+    field = "business_ids" if prefer == "business_id" else "emails"
+    try:
+        r = await client.post(bulk_url, json={field: values}, headers=_magic_headers(api_key), timeout=20 + len(values) / 10)
+        if r.status_code != 200:
+            return {}, f"magic_http_{r.status_code}"
+        urls = r.json().get("urls") or {}
+        return {str(k): v for k, v in urls.items() if v}, ""
+    except Exception as e:
+        return {}, f"magic_exc:{str(e)[:160]}"
+
+# --------------------------- Caché en disco ----------------------------------
+
+class MagicLinkCache:
+    """Caché clave -> url con caducidad, en SQLite (sobrevive a re-ejecuciones)."""
+
+    def __init__(self, path: str, ttl: float) -> None:
+        Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS magic (key TEXT PRIMARY KEY, url TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        self._db.close()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(keys)
+        found: Dict[str, str] = {}
+        now = time.time()
+        # Límite de variables de SQLite: por tramos
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for k, url in self._db.execute(
+                f"SELECT key, url FROM magic WHERE key IN ({marks}) AND expires_at > ?", (*chunk, now)
+            ):
+                found[k] = url
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> str:
+        return self.get_many([key]).get(key, "")
+
+    def put_many(self, items: Dict[str, str]) -> None:
+        if not items:
+            return
+        expires = time.time() + self.ttl
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO magic (key, url, expires_at) VALUES (?, ?, ?)",
+                [(k, url, expires) for k, url in items.items()],
+            )
+
+    def purge(self) -> int:
+        return self._db.execute("DELETE FROM magic WHERE expires_at <= ?", (time.time(),)).rowcount
+
+# --------------------------- Resolver ----------------------------------------
+
+class MagicLinkResolver:
+    """
+    Caché + (bulk | llamadas simples concurrentes).
+
+    prefetch() resuelve un tramo de filas por adelantado; resolve() entrega
+    el resultado de una fila (memo del prefetch, caché o llamada simple).
+    El memo guarda los últimos `memo_size` identificadores resueltos: otra
+    fila con el mismo business_id no vuelve a pedirlo. Cada identificador
+    cuenta como mucho un miss de caché.
+    """
+
+    def __init__(self, api_url: str, api_key: str, prefer: str, cache: Optional[MagicLinkCache] = None,
+                 bulk_url: str = "", bulk_size: int = 200, concurrency: int = 8, memo_size: int = 0) -> None:
+        self.api_url = api_url
+        self.api_key = api_key
+        self.prefer = prefer
+        self.cache = cache
+        self.bulk_url = bulk_url
+        self.bulk_size = max(1, bulk_size)
+        self.concurrency = max(1, concurrency)
+        # Varios tramos: el siguiente se prefetchea mientras los workers terminan el actual
+        self.memo_size = memo_size or max(4 * self.bulk_size, 1024)
+        # valor -> (url, error); None = ya se miró en la caché sin éxito (falta la llamada simple)
+        self._memo: "OrderedDict[str, Optional[Tuple[str, str]]]" = OrderedDict()
+
+    def _cache_key(self, value: str) -> str:
+        return f"{self.prefer}:{value}"
+
+    def _remember(self, value: str, result: Optional[Tuple[str, str]]) -> None:
+        self._memo[value] = result
+        self._memo.move_to_end(value)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+    def _store(self, resolved: Dict[str, str]) -> None:
+        if self.cache is not None:
+            self.cache.put_many({self._cache_key(v): url for v, url in resolved.items()})
+
+    async def prefetch(self, client, rows: Iterable[Dict[str, str]]) -> None:
+        values = []
+        for row in rows:
+            value, err = magic_key(self.prefer, row)
+            if not err and value not in self._memo:
+                values.append(value)
+        values = list(dict.fromkeys(values))
+        if not values:
+            return
+
+        if self.cache is not None:
+            cached = self.cache.get_many(self._cache_key(v) for v in values)
+            for v in values:
+                url = cached.get(self._cache_key(v))
+                self._remember(v, (url, "") if url else None)
+            values = [v for v in values if self._memo.get(v) is None]
+
+        if self.bulk_url:
+            for i in range(0, len(values), self.bulk_size):
+                chunk = values[i:i + self.bulk_size]
+                urls, err = await get_magic_links_bulk(client, self.bulk_url, self.api_key, self.prefer, chunk)
+                if err:
+                    # El bulk cayó: esas filas se resuelven una a una en resolve()
+                    continue
+                self._store(urls)
+                for v in chunk:
+                    self._remember(v, (urls[v], "") if v in urls else ("", "magic_no_url"))
+            return
+
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(v: str):
+            async with sem:
+                url, err = await get_magic_link_async(client, self.api_url, self.api_key, self.prefer, {self.prefer: v})
+            if url:
+                self._store({v: url})
+            self._remember(v, (url, err))
+
+        await asyncio.gather(*(one(v) for v in values))
+
+    def _lookup(self, value: str) -> Optional[Tuple[str, str]]:
+        """Resultado ya conocido (memo o caché en disco) de un identificador, o None."""
+        if value in self._memo:
+            hit = self._memo[value]
+            if hit is not None:
+                self._memo.move_to_end(value)
+                return hit
+        elif self.cache is not None:
+            url = self.cache.get(self._cache_key(value))
+            if url:
+                self._remember(value, (url, ""))
+                return url, ""
+        return None
+
+    async def resolve(self, client, row: Dict[str, str]) -> Tuple[str, str]:
+        value, err = magic_key(self.prefer, row)
+        if err:
+            return "", err
+        hit = self._lookup(value)
+        if hit is not None:
+            return hit
+        url, err = await get_magic_link_async(client, self.api_url, self.api_key, self.prefer, row)
+        if url:
+            self._store({value: url})
+        self._remember(value, (url, err))
+        return url, err
+
+    def resolve_sync(self, session: requests.Session, row: Dict[str, str]) -> Tuple[str, str]:
+        value, err = magic_key(self.prefer, row)
+        if err:
+            return "", err
+        hit = self._lookup(value)
+        if hit is not None:
+            return hit
+        url, err = get_magic_link(self.api_url, self.api_key, self.prefer, row, session=session)
+        if url:
+            self._store({value: url})
+        self._remember(value, (url, err))
+        return url, err
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+report_writer.py — Reporte en vivo de send.py (ts,row,email,status,error,error_class) con group commit
+
+Durabilidad explícita (--report-durability):
+  * strict  : flush + fsync por fila (lo de siempre: no se pierde nada).
+  * batched : fsync cada N filas o cada T ms, lo que llegue antes (un hilo
+              vigila el plazo aunque no lleguen filas). Ante un corte de luz
+              se pueden perder las filas de la última ventana: --resume
+              volvería a enviarlas.
+  * none    : sin fsync; el SO decide (solo flush al cerrar).
+
+En todos los modos close() hace flush + fsync, y con install_signal_handlers()
+SIGINT/SIGTERM vuelcan lo pendiente antes de cortar el proceso.
+
+Un reporte existente con la cabecera antigua (sin error_class) se sigue
+escribiendo con sus columnas. merge_reports() vuelca en él, ordenados por
+fila, los reportes parciales de send.py --shards (en streaming y sin
+duplicar filas si se corta a medias: recover_merge()).
+"""
+
+import csv
+import heapq
+import json
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+FIELDNAMES = ["ts", "row", "email", "status", "error", "error_class"]
+DURABILITY = ("strict", "batched", "none")
+
+
+class ReportWriter:
+    """CSV de resultados en modo append, seguro para un productor + el hilo de commit."""
+
+    def __init__(self, path: str, durability: str = "batched", every_rows: int = 100, every_ms: float = 200) -> None:
+        if durability not in DURABILITY:
+            raise ValueError(f"durability debe ser uno de {DURABILITY}")
+        self.path = path
+        self.durability = durability
+        self.every_rows = max(1, every_rows)
+        self.every_secs = max(0.001, every_ms / 1000)
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.width = len(FIELDNAMES)
+        if exists:
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                header = next(csv.reader(f), FIELDNAMES)
+            self.width = len(header) if header[:5] == FIELDNAMES[:5] else self.width
+        self._fh = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._fh)
+        # RLock: el handler de señal puede entrar mientras el hilo principal escribe
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._closed = False
+        self._prev_handlers: dict = {}
+        self.rows = 0
+        self.syncs = 0
+
+        if not exists:
+            self._writer.writerow(FIELDNAMES)
+            self._sync()
+
+        self._stop = threading.Event()
+        self._timer = None
+        if durability == "batched":
+            self._timer = threading.Thread(target=self._run_timer, name="report-commit", daemon=True)
+            self._timer.start()
+
+    def _sync(self) -> None:
+        with self._lock:
+            self._fh.flush()
+            self._pending = 0
+            self._last_sync = time.monotonic()
+            if self.durability == "none" and not self._closed:
+                return
+            fd = self._fh.fileno()
+        # fsync fuera del lock: los que escriben no esperan al disco
+        os.fsync(fd)
+        self.syncs += 1
+
+    def _run_timer(self) -> None:
+        while not self._stop.wait(self.every_secs):
+            if self._pending and time.monotonic() - self._last_sync >= self.every_secs:
+                self._sync()
+
+    def write(self, row_idx: int, email: str, status: str, error: str = "", error_class: str = "") -> None:
+        ts = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            self._writer.writerow((ts, row_idx, email, status, error, error_class)[:self.width])
+            self._pending += 1
+            self.rows += 1
+            due = self.durability == "strict" or (
+                self.durability == "batched" and self._pending >= self.every_rows)
+        if due:
+            self._sync()
+
+    def write_record(self, record) -> None:
+        """Fila ya hecha (ts incluido), p.ej. al fusionar reportes de shards."""
+        record = list(record)[:self.width]
+        with self._lock:
+            self._writer.writerow(record + [""] * (self.width - len(record)))
+            self._pending += 1
+            self.rows += 1
+
+    def commit(self) -> None:
+        """Vuelca y sincroniza lo pendiente ya (también en modo none)."""
+        if self._closed:
+            return
+        with self._lock:
+            self._fh.flush()
+            fd = self._fh.fileno()
+            self._pending = 0
+            self._last_sync = time.monotonic()
+        os.fsync(fd)
+        self.syncs += 1
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.commit()
+        with self._lock:
+            self._closed = True
+            self._fh.close()
+        self.restore_signal_handlers()
+
+    # ----------------------- Señales -----------------------
+
+    def _on_signal(self, signum, frame) -> None:
+        self.commit()
+        prev = self._prev_handlers.get(signum)
+        if callable(prev):
+            prev(signum, frame)  # SIGINT: default_int_handler -> KeyboardInterrupt
+        raise SystemExit(128 + signum)
+
+    def install_signal_handlers(self) -> None:
+        """SIGINT/SIGTERM: commit() y luego el comportamiento previo (o salida 128+signo)."""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self._prev_handlers[sig] = signal.signal(sig, self._on_signal)
+
+    def restore_signal_handlers(self) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for sig, prev in self._prev_handlers.items():
+            signal.signal(sig, prev)
+        self._prev_handlers.clear()
+
+    def __enter__(self) -> "ReportWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+MERGE_CHUNK_ROWS = 50_000
+
+
+def _part_records(path: str):
+    """Filas de un reporte parcial con las columnas de FIELDNAMES, sin una última línea truncada por un crash."""
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        reader = csv.reader(line for line in f if line.endswith("\n"))
+        header = next(reader, [])
+        col = {name: i for i, name in enumerate(header)}
+        if "row" not in col or "status" not in col:
+            return
+        order = [col.get(name) for name in FIELDNAMES]
+        for rec in reader:
+            if len(rec) >= len(header):
+                yield [rec[i] if i is not None else "" for i in order]
+
+
+def _merge_key(rec):
+    return int(rec[1]) if rec[1].isdigit() else 0, rec[0]
+
+
+def _sorted_runs(path: str, tmpdir: str, chunk_rows: int):
+    """
+    Tramos ordenados por (fila, ts) de una parte: cada `chunk_rows` filas se
+    ordenan y se vuelcan a un CSV temporal (con --concurrency el orden de
+    escritura no es el de fila); solo el último tramo queda en memoria.
+    """
+    chunk = []
+    for rec in _part_records(path):
+        chunk.append(rec)
+        if len(chunk) >= chunk_rows:
+            chunk.sort(key=_merge_key)
+            fd, spill = tempfile.mkstemp(suffix=".csv", dir=tmpdir)
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(chunk)
+            yield _spilled(spill)
+            chunk = []
+    chunk.sort(key=_merge_key)
+    yield iter(chunk)
+
+
+def _spilled(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.reader(f)
+
+
+def _write_json_atomic(path: str, obj) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def merge_journal(dest: str) -> str:
+    return dest + ".merge"
+
+
+def recover_merge(dest: str) -> None:
+    """
+    Cierra una fusión interrumpida (ver merge_reports). Si siguen todas las
+    partes, `dest` vuelve al tamaño que tenía antes y las partes se fusionarán
+    de nuevo; si ya se borró alguna, la fusión había terminado y solo falta
+    borrar las demás. En ambos casos cada fila queda en un solo sitio.
+    """
+    journal = merge_journal(dest)
+    try:
+        with open(journal, encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return
+    parts = state.get("parts", [])
+    if all(os.path.exists(p) for p in parts):
+        if os.path.exists(dest) and os.path.getsize(dest) > state["size"]:
+            os.truncate(dest, state["size"])
+    else:
+        for path in parts:
+            if os.path.exists(path):
+                os.remove(path)
+    os.remove(journal)
+
+
+def merge_reports(dest: str, parts, remove: bool = True, chunk_rows: int = MERGE_CHUNK_ROWS) -> dict:
+    """
+    Añade a `dest` las filas de los reportes `parts` (uno por shard) en orden
+    de fila (y de ts dentro de la misma fila), con su ts original; después
+    borra las partes. Devuelve {status: filas}.
+
+    Fusión en streaming (heapq.merge de tramos ordenados, ver _sorted_runs).
+    Con `remove`, antes de tocar `dest` se anota en <dest>.merge su tamaño y
+    las partes: si el proceso muere a medias, recover_merge() (al principio
+    de cada fusión y de send.py) deja cada fila en las partes o en `dest`,
+    nunca en los dos, así que repetir la fusión no duplica filas.
+    """
+    recover_merge(dest)
+    parts = [p for p in parts if os.path.exists(p)]
+    counts: dict = {}
+    if not parts:
+        return counts
+    journal = merge_journal(dest)
+    if remove:
+        size = os.path.getsize(dest) if os.path.exists(dest) else 0
+        _write_json_atomic(journal, {"size": size, "parts": [os.path.abspath(p) for p in parts]})
+
+    tmpdir = tempfile.mkdtemp(prefix=".merge-", dir=os.path.dirname(os.path.abspath(dest)))
+    try:
+        runs = [run for path in parts for run in _sorted_runs(path, tmpdir, chunk_rows)]
+        writer = ReportWriter(dest, "none")
+        try:
+            for rec in heapq.merge(*runs, key=_merge_key):
+                writer.write_record(rec)
+                counts[rec[3]] = counts.get(rec[3], 0) + 1
+        finally:
+            writer.close()  # flush + fsync antes de borrar las partes
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    if remove:
+        for path in parts:
+            os.remove(path)
+        os.remove(journal)
+    return counts
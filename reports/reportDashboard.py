@@ -1,146 +1,283 @@
-# Dashboard generator for wa_2025-09-28.csv
-# - Loads the original and the clean file (if present)
+# Dashboard generator for send.py reports (ts,row,email,status,error)
+# - Loads the report and the clean file (if present)
 # - Computes key metrics
 # - Builds charts with matplotlib (no seaborn, no styles, one chart per figure)
 # - Exports a lightweight HTML report with embedded PNGs
 # - Saves summary CSVs
-import pandas as pd
-import matplotlib.pyplot as plt
-from pathlib import Path
-from datetime import datetime
+#
+# Modo incremental (--state): los reportes son append-only, así que se guarda
+# en un JSON pequeño el byte ya consumido de cada fichero y los agregados
+# (por día / status / error, más las huellas de emails únicos); cada ejecución
+# solo lee las filas nuevas. Si el fichero se truncó o se reescribió (cambia
+# su cabecera o el tamaño es menor), ese fichero se recuenta desde cero.
+#
+#   python reports/reportDashboard.py reports/wa_2025-09-28.csv --state reports/wa_state.json
+#
+# Como módulo: build_dashboard(raw_path, clean_path=None, out_dir=None, state_path=None)
+import argparse
 import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import matplotlib.pyplot as plt
+import pandas as pd
 
-base_path = Path("/home/taylerk/Documentos/smtpppp/reports/wa_2025-09-28.csv")
-raw_path = base_path / "wa_2025-09-28.csv"
-clean_path = base_path / "wa_2025-09-28_clean.csv"
-dict_path = base_path / "wa_2025-09-28_data_dictionary.csv"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import columnar  # noqa: E402
+from clean_contacts import HashSet, hash_values  # noqa: E402
 
-# Load
-df_raw = pd.read_csv(raw_path)
-df = pd.read_csv(clean_path) if clean_path.exists() else df_raw.copy()
+REPORT_COLUMNS = ["ts", "row", "email", "status", "error"]
+STATE_VERSION = 1
+_HEAD_BYTES = 4096  # huella del inicio del fichero para detectar que lo reescribieron
+
+
+# Load (CSV o .parquet/.arrow). Con `snapshot` (--snapshot) y pyarrow, el CSV se
+# cachea en un .parquet tipado al lado y las siguientes ejecuciones lo leen
+# mientras el CSV no cambie; por defecto no se escribe nada junto al reporte.
+def load_report(path: Path, snapshot: bool = False) -> pd.DataFrame:
+    if columnar.HAVE_ARROW:
+        cache = path.with_suffix(".parquet") if snapshot and not columnar.columnar_format(path) else None
+        return columnar.read_report(path, cache).to_pandas()
+    return pd.read_csv(path)
 
-# Ensure columns exist
-for col in ["ts", "row", "email", "status", "error"]:
-    if col not in df_raw.columns:
-        df_raw[col] = None
-    if col not in df.columns:
-        df[col] = None
 
 # Parse timestamps if possible
 def parse_ts(s):
     try:
-        return pd.to_datetime(s, errors="coerce")
+        return pd.to_datetime(s, errors="coerce", utc=True)
     except Exception:
-        return pd.NaT
-
-df_raw["ts_dt"] = parse_ts(df_raw["ts"])
-df["ts_dt"] = parse_ts(df["ts"])
-
-# Basic metrics
-total_rows = len(df_raw)
-valid_email_rows = df_raw["email"].astype(str).str.contains("@", na=False).sum()
-unique_emails_raw = df_raw["email"].astype(str).str.strip().str.lower()
-unique_emails_raw = unique_emails_raw[unique_emails_raw.str.contains("@", na=False)].nunique()
-
-unique_emails_clean = df["email"].astype(str).str.strip().str.lower()
-unique_emails_clean = unique_emails_clean[unique_emails_clean.str.contains("@", na=False)].nunique()
-
-null_email = df_raw["email"].isna().sum()
-status_counts = df_raw["status"].fillna("EMPTY").value_counts()
-top_errors = df_raw["error"].dropna().astype(str).value_counts().head(10)
-
-# Time series (by day)
-if df_raw["ts_dt"].notna().any():
-    ts_daily = df_raw.dropna(subset=["ts_dt"]).assign(day=lambda x: x["ts_dt"].dt.date).groupby("day").size()
-else:
-    ts_daily = pd.Series(dtype=int)
-
-# Output dirs / filenames
-ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-out_dir = base_path / f"wa_dashboard_{ts}"
-out_dir.mkdir(parents=True, exist_ok=True)
-
-# Save summary CSVs
-status_counts.to_csv(out_dir / "status_counts.csv", header=["count"])
-top_errors.to_csv(out_dir / "top_errors.csv", header=["count"])
-if len(ts_daily) > 0:
-    ts_daily.to_csv(out_dir / "daily_counts.csv", header=["count"])
-
-# Figures
-fig_paths = []
-
-# 1) Status distribution
-plt.figure()
-status_counts.plot(kind="bar")
-plt.title("Distribución de 'status' (raw)")
-plt.xlabel("status")
-plt.ylabel("conteo")
-p1 = out_dir / "status_distribution.png"
-plt.tight_layout()
-plt.savefig(p1)
-plt.close()
-fig_paths.append(p1)
-
-# 2) Top error messages
-if len(top_errors) > 0:
-    plt.figure()
-    top_errors.plot(kind="barh")
-    plt.title("Top 10 mensajes de error (raw)")
-    plt.xlabel("conteo")
-    plt.ylabel("error")
-    p2 = out_dir / "top_errors.png"
-    plt.tight_layout()
-    plt.savefig(p2)
-    plt.close()
-    fig_paths.append(p2)
+        return pd.Series(pd.NaT, index=s.index)
 
-# 3) Daily volume (if timestamps available)
-if len(ts_daily) > 0:
-    plt.figure()
-    ts_daily.sort_index().plot(kind="line", marker="o")
-    plt.title("Volumen diario (raw)")
-    plt.xlabel("día")
-    plt.ylabel("registros")
-    p3 = out_dir / "daily_volume.png"
-    plt.tight_layout()
-    plt.savefig(p3)
-    plt.close()
-    fig_paths.append(p3)
+# --------------------------- Agregados ---------------------------------------
+
+class ReportStats:
+    """Métricas del dashboard acumulables tramo a tramo (y serializables a JSON)."""
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.valid_email = 0
+        self.null_email = 0
+        self.status: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.daily: Counter = Counter()
+        self.emails = HashSet()
+
+    def add_frame(self, df: pd.DataFrame) -> None:
+        # Ensure columns exist
+        for col in REPORT_COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+        email = df["email"].astype(str)
+        has_at = email.str.contains("@", na=False)
+        self.rows += len(df)
+        self.valid_email += int(has_at.sum())
+        self.null_email += int(df["email"].isna().sum())
+        norm = email.str.strip().str.lower()[has_at]
+        if len(norm):
+            self.emails.add_new(hash_values(norm))
+        self.status.update(df["status"].astype(object).fillna("EMPTY").value_counts().to_dict())
+        self.errors.update(df["error"].dropna().astype(str).value_counts().to_dict())
+        ts = parse_ts(df["ts"]).dropna()
+        if len(ts):
+            self.daily.update({str(d): int(n) for d, n in ts.dt.date.value_counts().items()})
+
+    @property
+    def unique_emails(self) -> int:
+        return len(self.emails)
+
+    def status_counts(self) -> pd.Series:
+        return pd.Series(dict(self.status.most_common()), name="count", dtype=int).rename_axis("status")
+
+    def top_errors(self, n: int = 10) -> pd.Series:
+        return pd.Series(dict(self.errors.most_common(n)), name="count", dtype=int).rename_axis("error")
+
+    def ts_daily(self) -> pd.Series:
+        return pd.Series({d: self.daily[d] for d in sorted(self.daily)}, name="count", dtype=int).rename_axis("day")
+
+    def to_json(self) -> Dict:
+        return {
+            "rows": self.rows, "valid_email": self.valid_email, "null_email": self.null_email,
+            "status": dict(self.status), "errors": dict(self.errors), "daily": dict(self.daily),
+            "emails": base64.b64encode(self.emails.to_bytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_json(cls, d: Dict) -> "ReportStats":
+        st = cls()
+        st.rows, st.valid_email, st.null_email = d["rows"], d["valid_email"], d["null_email"]
+        st.status, st.errors, st.daily = Counter(d["status"]), Counter(d["errors"]), Counter(d["daily"])
+        st.emails = HashSet.from_bytes(base64.b64decode(d["emails"]))
+        return st
+
+# --------------------------- Lectura incremental -----------------------------
+
+def _head_digest(path: Path, n: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(n)).hexdigest()
+
+
+def _read_header(path: Path) -> list:
+    with open(path, "rb") as f:
+        line = f.readline().decode("utf-8-sig")
+    return next(csv.reader([line]), [])
+
+
+def update_file(path: Path, entry: Optional[Dict]) -> Tuple[Dict, ReportStats]:
+    """
+    Añade a los agregados de `entry` las filas completas escritas en `path`
+    desde entry["offset"] (una última línea sin '\\n' se deja para la próxima).
+    Devuelve la entrada nueva (offset, huella del inicio, cabecera, stats) y los stats.
+    """
+    size = path.stat().st_size
+    if entry is not None:
+        head_n = min(entry["offset"], _HEAD_BYTES)
+        if not entry["header"] or size < entry["offset"] or _head_digest(path, head_n) != entry["head"]:
+            entry = None  # truncado o reescrito: recuento desde cero
+    if entry is None:
+        header = _read_header(path) if size else []
+        with open(path, "rb") as f:
+            offset = len(f.readline())
+        entry = {"offset": offset, "header": header, "stats": None}
+    stats = ReportStats.from_json(entry["stats"]) if entry["stats"] else ReportStats()
+
+    offset = entry["offset"]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+    end = data.rfind(b"\n") + 1
+    if end:
+        df = pd.read_csv(io.BytesIO(data[:end]), names=entry["header"], header=None,
+                         dtype=str, encoding="utf-8", on_bad_lines="skip")
+        stats.add_frame(df)
+        offset += end
+
+    entry = {"offset": offset, "head": _head_digest(path, min(offset, _HEAD_BYTES)),
+             "header": entry["header"], "stats": stats.to_json()}
+    return entry, stats
+
+
+def load_state(state_path: Path) -> Dict:
+    if state_path.exists():
+        state = json.loads(state_path.read_text(encoding="utf-8"))
+        if state.get("version") == STATE_VERSION:
+            return state
+    return {"version": STATE_VERSION, "files": {}}
+
+
+def save_state(state: Dict, state_path: Path) -> None:
+    tmp = state_path.with_name(state_path.name + ".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, state_path)
+
+
+def aggregate(path: Path, state: Optional[Dict] = None, snapshot: bool = False) -> ReportStats:
+    """Stats de un reporte: incremental si hay `state` y es CSV; si no, lectura completa."""
+    if state is None or columnar.columnar_format(path):
+        stats = ReportStats()
+        stats.add_frame(load_report(path, snapshot))
+        return stats
+    key = str(path.resolve())
+    state["files"][key], stats = update_file(path, state["files"].get(key))
+    return stats
+
+# --------------------------- Salida ------------------------------------------
 
-# Build HTML report
 def img_to_base64(path: Path) -> str:
     with open(path, "rb") as f:
         return base64.b64encode(f.read()).decode("utf-8")
 
-fig_imgs = "".join(
-    f'<h3>{path.name.replace("_"," ").replace(".png","").title()}</h3>\n'
-    f'<img src="data:image/png;base64,{img_to_base64(path)}" style="max-width:100%;height:auto;"/>\n'
-    for path in fig_paths
-)
-
-metrics_table = pd.DataFrame([
-    {"Métrica": "Filas (raw)", "Valor": total_rows},
-    {"Métrica": "Filas con email válido (raw)", "Valor": int(valid_email_rows)},
-    {"Métrica": "Emails únicos (raw)", "Valor": int(unique_emails_raw)},
-    {"Métrica": "Emails únicos (clean)", "Valor": int(unique_emails_clean)},
-    {"Métrica": "Emails vacíos (raw)", "Valor": int(null_email)},
-])
-
-metrics_csv_path = out_dir / "metrics_summary.csv"
-metrics_table.to_csv(metrics_csv_path, index=False)
-
-# Convert small tables to HTML snippets
-status_html = status_counts.reset_index().rename(columns={"index":"status","status":"count"}).to_html(index=False)
-errors_html = top_errors.reset_index().rename(columns={"index":"error","error":"count"}).to_html(index=False) if len(top_errors) > 0 else "<p>Sin errores.</p>"
-daily_html = ts_daily.reset_index().rename(columns={"index":"day",0:"count"}).to_html(index=False) if len(ts_daily) > 0 else "<p>No hay timestamps válidos para serie diaria.</p>"
-metrics_html = metrics_table.to_html(index=False)
-
-html = f"""<!doctype html>
+
+def render(raw: ReportStats, clean: ReportStats, out_dir: Path, title: str, sources: str) -> Dict:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    status_counts = raw.status_counts()
+    top_errors = raw.top_errors()
+    ts_daily = raw.ts_daily()
+
+    # Save summary CSVs
+    status_counts.to_csv(out_dir / "status_counts.csv", header=["count"])
+    top_errors.to_csv(out_dir / "top_errors.csv", header=["count"])
+    if len(ts_daily) > 0:
+        ts_daily.to_csv(out_dir / "daily_counts.csv", header=["count"])
+
+    # Figures
+    fig_paths = []
+
+    # 1) Status distribution
+    plt.figure()
+    status_counts.plot(kind="bar")
+    plt.title("Distribución de 'status' (raw)")
+    plt.xlabel("status")
+    plt.ylabel("conteo")
+    p1 = out_dir / "status_distribution.png"
+    plt.tight_layout()
+    plt.savefig(p1)
+    plt.close()
+    fig_paths.append(p1)
+
+    # 2) Top error messages
+    if len(top_errors) > 0:
+        plt.figure()
+        top_errors.plot(kind="barh")
+        plt.title("Top 10 mensajes de error (raw)")
+        plt.xlabel("conteo")
+        plt.ylabel("error")
+        p2 = out_dir / "top_errors.png"
+        plt.tight_layout()
+        plt.savefig(p2)
+        plt.close()
+        fig_paths.append(p2)
+
+    # 3) Daily volume (if timestamps available)
+    if len(ts_daily) > 0:
+        plt.figure()
+        ts_daily.plot(kind="line", marker="o")
+        plt.title("Volumen diario (raw)")
+        plt.xlabel("día")
+        plt.ylabel("registros")
+        p3 = out_dir / "daily_volume.png"
+        plt.tight_layout()
+        plt.savefig(p3)
+        plt.close()
+        fig_paths.append(p3)
+
+    # Build HTML report
+    fig_imgs = "".join(
+        f'<h3>{path.name.replace("_"," ").replace(".png","").title()}</h3>\n'
+        f'<img src="data:image/png;base64,{img_to_base64(path)}" style="max-width:100%;height:auto;"/>\n'
+        for path in fig_paths
+    )
+
+    metrics_table = pd.DataFrame([
+        {"Métrica": "Filas (raw)", "Valor": raw.rows},
+        {"Métrica": "Filas con email válido (raw)", "Valor": raw.valid_email},
+        {"Métrica": "Emails únicos (raw)", "Valor": raw.unique_emails},
+        {"Métrica": "Emails únicos (clean)", "Valor": clean.unique_emails},
+        {"Métrica": "Emails vacíos (raw)", "Valor": raw.null_email},
+    ])
+
+    metrics_csv_path = out_dir / "metrics_summary.csv"
+    metrics_table.to_csv(metrics_csv_path, index=False)
+
+    # Convert small tables to HTML snippets
+    status_html = status_counts.reset_index().to_html(index=False)
+    errors_html = top_errors.reset_index().to_html(index=False) if len(top_errors) > 0 else "<p>Sin errores.</p>"
+    daily_html = ts_daily.reset_index().to_html(index=False) if len(ts_daily) > 0 else "<p>No hay timestamps válidos para serie diaria.</p>"
+    metrics_html = metrics_table.to_html(index=False)
+
+    html = f"""<!doctype html>
 <html lang="es">
 <head>
 <meta charset="utf-8">
 <meta name="viewport" content="width=device-width, initial-scale=1">
-<title>Dashboard WA 2025-09-28</title>
+<title>{title}</title>
 <style>
  body {{ font-family: Arial, Helvetica, sans-serif; margin: 24px; }}
  h1,h2,h3 {{ margin: 0 0 12px; }}
@@ -153,7 +290,7 @@ html = f"""<!doctype html>
 </style>
 </head>
 <body>
-  <h1>Dashboard: WA 2025-09-28</h1>
+  <h1>{title}</h1>
   <p>Generado: {datetime.now().isoformat(timespec='seconds')}</p>
 
   <section>
@@ -179,21 +316,64 @@ html = f"""<!doctype html>
   </section>
 
   <div class="foot">
-    <p>Fuente de datos: {raw_path.name}{' + ' + clean_path.name if clean_path.exists() else ''}</p>
+    <p>Fuente de datos: {sources}</p>
   </div>
 </body>
 </html>
 """
 
-report_path = out_dir / "dashboard_report.html"
-with open(report_path, "w", encoding="utf-8") as f:
-    f.write(html)
-
-{
- "report_path": str(report_path),
- "metrics_csv": str(metrics_csv_path),
- "status_counts_csv": str(out_dir / "status_counts.csv"),
- "top_errors_csv": str(out_dir / "top_errors.csv") if len(top_errors)>0 else None,
- "daily_counts_csv": str(out_dir / "daily_counts.csv") if len(ts_daily)>0 else None,
- "figures": [str(p) for p in fig_paths]
-}
+    report_path = out_dir / "dashboard_report.html"
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+    return {
+        "report_path": str(report_path),
+        "metrics_csv": str(metrics_csv_path),
+        "status_counts_csv": str(out_dir / "status_counts.csv"),
+        "top_errors_csv": str(out_dir / "top_errors.csv") if len(top_errors) > 0 else None,
+        "daily_counts_csv": str(out_dir / "daily_counts.csv") if len(ts_daily) > 0 else None,
+        "figures": [str(p) for p in fig_paths],
+    }
+
+
+def build_dashboard(raw_path, clean_path=None, out_dir=None, state_path=None, title: str = "",
+                    snapshot: bool = False) -> Dict:
+    """
+    Genera el dashboard de `raw_path` (y `clean_path`, por defecto <stem>_clean.csv
+    al lado si existe) en `out_dir` (por defecto <stem>_dashboard_<fecha> al lado).
+    Con `state_path` solo se leen las filas añadidas desde la ejecución anterior.
+    Con `snapshot` se deja un <reporte>.parquet al lado para la próxima lectura completa.
+    """
+    raw_path = Path(raw_path)
+    clean_path = Path(clean_path) if clean_path else raw_path.with_name(f"{raw_path.stem}_clean.csv")
+    if out_dir is None:
+        out_dir = raw_path.parent / f"{raw_path.stem}_dashboard_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    state = load_state(Path(state_path)) if state_path else None
+
+    raw = aggregate(raw_path, state, snapshot)
+    clean = aggregate(clean_path, state, snapshot) if clean_path.exists() else raw
+    if state is not None:
+        save_state(state, Path(state_path))
+
+    sources = raw_path.name + (" + " + clean_path.name if clean_path.exists() else "")
+    return render(raw, clean, Path(out_dir), title or f"Dashboard: {raw_path.stem}", sources)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Dashboard HTML de un reporte de envío")
+    ap.add_argument("report", help="Reporte de send.py (.csv, .parquet o .arrow)")
+    ap.add_argument("--clean", default="", help="Versión limpia del reporte (por defecto <stem>_clean.csv si existe)")
+    ap.add_argument("--out-dir", default="", help="Directorio de salida (por defecto <stem>_dashboard_<fecha>)")
+    ap.add_argument("--state", default="", help="JSON de estado para el modo incremental (vacío = recalcular todo)")
+    ap.add_argument("--title", default="", help="Título del HTML")
+    ap.add_argument("--snapshot", action="store_true",
+                    help="Cachear cada CSV en un .parquet tipado al lado (requiere pyarrow y permiso de escritura)")
+    args = ap.parse_args()
+
+    res = build_dashboard(args.report, args.clean or None, args.out_dir or None, args.state or None, args.title,
+                          args.snapshot)
+    print(json.dumps(res, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-send.py — Envío de campaña (Washington)
+send.py — Envío de campaña (por defecto Washington: --template wa)
 
 Soporta:
   * CSV legado con columna 'gmail'
@@ -9,10 +9,30 @@ Soporta:
     Responsible Person, Email, Address, NextARDueDate
 
 - Pide magic-link a WordPress (prefill real) y lo usa en el botón.
-- Escribe reporte en VIVO (append por cada envío) con timestamp.
+- Escribe reporte en VIVO (append por cada envío) con timestamp; fsync por
+  fila o agrupado según --report-durability (report_writer.py).
+- Cuerpos HTML/texto desde templates/<campaña>/ (Jinja2, compilados una vez).
+- Omite las direcciones de la lista de supresión (--suppression, suppress.py).
+- Con --history, registra cada envío en el historial entre campañas
+  (send_history.py) y, con --skip-contacted-days N, omite a quien ya se
+  escribió (por email o BusinessID) en los últimos N días.
+- Con --envelope, filas del mismo dominio con cuerpo idéntico (legacy con
+  --name-fallback y --shared-link) salen en un solo envío SMTP con varios
+  RCPT TO; el reporte sigue siendo una fila por destinatario.
+- Con --shards K, K procesos se reparten las filas por hash del email
+  normalizado (render, inferencia de nombres y JSON en K núcleos); cada uno
+  escribe un reporte parcial y al final se fusionan en --report ordenados
+  por fila. --resume y el progreso funcionan sobre el conjunto.
 """
 
+import asyncio
 import csv
+import glob
+import hashlib
+import io
+import json
+import subprocess
+import threading
 import time
 import requests
 import sys
@@ -21,8 +41,16 @@ import re
 import urllib.parse
 import os
 from pathlib import Path
-from datetime import datetime, timezone
-from typing import Tuple, Dict, Iterable
+from typing import Tuple, Dict, Iterable, List
+
+import columnar
+from app.ratelimit import DomainLimiter, DomainScheduler, TokenBucket, parse_limit, recipient_domain
+from app.suppression import open_if_exists
+from app.templating import DEFAULT_TEMPLATES_DIR, CampaignTemplate, TemplateEngine
+from contacts_csv import LEGACY, Contact, iter_chunks, norm_business_id, open_contacts  # noqa: F401
+from magic_links import MagicLinkCache, MagicLinkResolver, get_magic_link, get_magic_link_async  # noqa: F401
+from report_writer import DURABILITY, ReportWriter, merge_reports, recover_merge
+from send_history import CONTACTED, DAY, campaign_of, open_history
 
 EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 UPPER_TOKENS = {"llc","inc","corp","ltd","pllc","pc","co","sa","sas","srl","gmbh","foundation"}
@@ -50,281 +78,904 @@ def infer_name_from_email(addr: str) -> str:
     return " ".join(norm)
 
 
-def norm_business_id(v: str) -> str:
-    v = (v or "").strip()
-    # FIX: sin dobles escapes
-    m = re.match(r"^(\d+)\.0$", v)
-    return m.group(1) if m else v
-
-
-def safe_get(row: Dict[str, str], key: str) -> str:
-    if key in row:
-        return row.get(key) or ""
-    key_l = key.strip().lower()
-    for k in row.keys():
-        if k.strip().lower() == key_l:
-            return row.get(k) or ""
-    return ""
-
 # --------------------------- Lectura CSV -------------------------------------
 
-def iter_emails_legacy(csv_path: Path) -> Iterable[Dict[str, str]]:
-    """CSV con columna 'gmail' (una o varias separadas por coma)."""
-    with csv_path.open(newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        keys = {k.lower().strip(): k for k in (reader.fieldnames or [])}
-        if "gmail" not in keys:
-            sys.exit("ERROR: Column 'gmail' not found in the CSV (legacy mode).")
-        col = keys["gmail"]
-        for row in reader:
-            raw = (row.get(col) or "").strip()
-            if not raw:
-                continue
-            for email in [a.strip() for a in raw.split(",") if a.strip()]:
-                yield {"email": email, "row": row}
-
-
-def iter_clients(csv_path: Path) -> Iterable[Dict[str, str]]:
-    """CSV clientes. Requiere BusinessID y Email (mínimo)."""
-    with csv_path.open(newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        required = ["BusinessID", "Email"]
-        have = [c.strip().lower() for c in (r.fieldnames or [])]
-        missing = [x for x in required if x.lower() not in have]
-        if missing:
-            sys.exit(f"ERROR: faltan columnas requeridas: {missing}")
-        for row in r:
-            yield {
-                "business_id": norm_business_id(safe_get(row, "BusinessID")),
-                "ubi_number": safe_get(row, "UBI Number"),
-                "business_name": safe_get(row, "Business Name"),
-                "responsible_person": safe_get(row, "Responsible Person"),
-                "email": (safe_get(row, "Email") or "").strip(),
-                "address": safe_get(row, "Address"),
-                "next_due": safe_get(row, "NextARDueDate"),
-                "row": row,
-            }
+# Ver contacts_csv.py: cabecera resuelta una vez, filas como Contact, .csv/.csv.gz.
 
 # --------------------------- Magic-link WP -----------------------------------
 
-def get_magic_link(api_url: str, api_key: str, prefer: str, client_row: Dict[str, str]) -> Tuple[str, str]:
-    """
-    Devuelve (url, error). prefer in {"business_id","email"}.
-    """
-    headers = {"Content-Type": "application/json"}
-    if api_key:
-        headers["x-comown-key"] = api_key
-
-    payload: Dict[str, str] = {}
-    if prefer == "business_id":
-        bid = (client_row.get("business_id") or "").strip()
-        if not bid:
-            return "", "no_business_id"
-        payload["business_id"] = bid
-    else:
-        em = (client_row.get("email") or "").strip()
-        if not em:
-            return "", "no_email_for_magic"
-        payload["email"] = em
+# Ver magic_links.py: llamada simple/bulk, caché en disco con TTL y resolver.
 
-    try:
-        r = requests.post(api_url, json=payload, headers=headers, timeout=20)
-        if r.status_code != 200:
-            return "", f"magic_http_{r.status_code}"
-        j = r.json()
-        url = j.get("url")
-        if not url:
-            return "", "magic_no_url"
-        return url, ""
-    except Exception as e:
-        return "", f"magic_exc:{str(e)[:160]}"
+# --------------------------- Templates ---------------------------------------
+
+_templates = TemplateEngine(DEFAULT_TEMPLATES_DIR)
 
-# --------------------------- Templates WA ------------------------------------
 
 def build_html(name: str, link: str, business_name: str = "", address: str = "", due: str = "") -> str:
     """
-    Copy específico para Washington.
+    Copy específico para Washington (templates/wa/body.html).
     """
-    extra = ""
-    if business_name or address or due:
-        extra = f"""
-        <p><strong>Business:</strong> {business_name or ''}<br>
-           <strong>Address:</strong> {address or ''}<br>
-           <strong>Next Annual Report Due:</strong> {due or ''}</p>"""
-
-    return f"""<!doctype html>
-<html lang="en"><head>
-<meta name="color-scheme" content="light dark">
-<meta name="supported-color-schemes" content="light dark">
-</head><body style="margin:0;padding:0;background:#f6f7fb;font-family:Arial,Helvetica,sans-serif;">
-<table role="presentation" width="100%" cellpadding="0" cellspacing="0" style="background:#f6f7fb;padding:24px 0;">
-<tr><td align="center">
-<table role="presentation" width="640" cellpadding="0" cellspacing="0" style="background:#fff;border-radius:12px;box-shadow:0 1px 4px rgba(0,0,0,.06);padding:28px;">
-<tr><td style="color:#333;line-height:1.6;">
-  <h2 style="margin:0 0 12px;color:#111;">Dear {name},</h2>
-  <p>This is a reminder to file your <strong>2025 Washington annual report</strong>. Filing is required to keep your business in good standing with the State of Washington. Filing by the due date helps avoid state late fees.</p>
-  {extra}
-  <p>Our service streamlines the process and keeps your business compliant. We are not affiliated with the Washington Secretary of State or any government agency.</p>
-  <div style="text-align:center;margin:28px 0 22px;">
-    <a href="{link}" target="_blank" style="display:inline-block;padding:14px 22px;background:#1a73e8;color:#fff;text-decoration:none;border-radius:8px;font-weight:bold;">
-      File Your Washington Annual Report
-    </a>
-  </div>
-  <hr style="border:none;border-top:1px solid #eee;margin:18px 0">
-  <p style="font-size:12px;color:#666;">National Filing Corporation is not affiliated with, approved, or endorsed by any government agency. This email is confidential and intended only for the recipient.</p>
-</td></tr></table>
-</td></tr></table>
-</body></html>"""
+    return _templates.campaign("wa").html.render(
+        name=name, link=link, business_name=business_name, address=address, due=due,
+    )
 
 def build_text(name: str, link: str) -> str:
-    return f"""Dear {name},
-
-This is a reminder to file your 2025 Washington annual report. Filing is required to keep your business in good standing with the State of Washington. Filing by the due date helps avoid state late fees.
+    return _templates.campaign("wa").text.render(name=name, link=link)
 
-File here:
-{link}
+# --------------------------- Transporte FastAPI -------------------------------
 
-National Filing Corporation is not affiliated with, approved, or endorsed by any government agency."""
+def _email_payload(email_to: str, subject: str, html: str, text: str) -> Dict:
+    return {
+        "to": [email_to],
+        "subject": subject,
+        "body_text": text,
+        "body_html": html,
+        "headers": {"List-Unsubscribe": "<mailto:unsubscribe@e-filemycorporation.com>"}
+    }
 
-# --------------------------- Transporte FastAPI -------------------------------
 
-def send_via_fastapi(api_send_url: str, email_to: str, subject: str, html: str, text: str, bearer: str = "") -> Tuple[bool, str]:
+def _api_headers(bearer: str = "") -> Dict[str, str]:
     headers = {"Content-Type": "application/json"}
     if bearer:
         headers["Authorization"] = f"Bearer {bearer}"
+    return headers
+
+
+def batch_url(api_send_url: str) -> str:
+    """http://host/send -> http://host/send/batch"""
+    return api_send_url.rstrip("/") + "/batch"
+
+
+def _template_payload(email_to: str, subject: str, template_id: str, variables: Dict[str, str]) -> Dict:
+    """Envío renderizado en el servidor: solo plantilla + variables del destinatario."""
+    payload = {
+        "to": [email_to],
+        "template_id": template_id,
+        "variables": {k: v for k, v in variables.items() if v},
+    }
+    if subject:
+        payload["subject"] = subject
+    return payload
+
+
+# (status, error, error_class) de un envío, tal cual va al reporte
+Outcome = Tuple[str, str, str]
+
+
+def _json(r) -> Dict:
+    try:
+        body = r.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def response_outcome(r) -> Outcome:
+    """
+    Respuesta de /send -> Outcome. 200 = sent; 202 = encolado (sent) o
+    "deferred" (la API programó el reintento de un fallo transitorio);
+    409 con "suppressed" = skipped (lista de supresión de la API);
+    error HTTP = failed con la clase que mande la API (permanent/transient/connection).
+    """
+    if r.status_code == 200:
+        return "sent", "", ""
+    body = _json(r)
+    if r.status_code == 202:
+        if body.get("status") == "deferred":
+            return "deferred", body.get("error") or "", body.get("error_class") or ""
+        return "sent", "", ""
+    detail = body.get("detail")
+    if r.status_code == 409 and isinstance(detail, dict) and detail.get("suppressed"):
+        # La API lo tiene en su lista de supresión
+        return "skipped", f"suppressed_{next(iter(detail['suppressed'].values()))}", "permanent"
+    if isinstance(detail, dict):
+        return "failed", f"HTTP {r.status_code}: {detail.get('error', '')}"[:500], detail.get("error_class") or ""
+    return "failed", f"HTTP {r.status_code}: {r.text[:500]}", ""
+
+
+def recipient_outcomes(recipients, outcome: Outcome, n: int) -> List[Outcome]:
+    """
+    Outcome de cada destinatario de un envío con varios 'to' (--envelope):
+    la API da "recipients" en el orden de 'to'; sin eso, todos comparten
+    el del envío.
+    """
+    if not isinstance(recipients, list) or len(recipients) != n:
+        return [outcome] * n
+    # "queued" (modo cola) cuenta como enviado, igual que un 202 sin más
+    return [("sent" if r.get("status") == "queued" else r.get("status") or "failed",
+             r.get("error") or "", r.get("error_class") or "") for r in recipients]
+
+
+def response_outcomes(r, n: int = 1) -> List[Outcome]:
+    """Respuesta de /send -> [Outcome por destinatario]."""
+    outcome = response_outcome(r)
+    if n == 1:
+        return [outcome]
+    body = _json(r)
+    detail = body.get("detail")
+    recipients = body.get("recipients") or (detail.get("recipients") if isinstance(detail, dict) else None)
+    return recipient_outcomes(recipients, outcome, n)
+
+
+def post_payload(api_send_url: str, payload: Dict, bearer: str = "",
+                 session: "requests.Session | None" = None) -> List[Outcome]:
+    """POST a /send -> [Outcome] uno por destinatario de payload['to']."""
+    n = len(payload["to"])
+    try:
+        r = (session or requests).post(
+            api_send_url,
+            json=payload,
+            headers=_api_headers(bearer),
+            timeout=45
+        )
+        return response_outcomes(r, n)
+    except Exception as e:
+        return [("failed", str(e), "connection")] * n
+
+
+def send_via_fastapi(api_send_url: str, email_to: str, subject: str, html: str, text: str, bearer: str = "",
+                     session: "requests.Session | None" = None) -> Outcome:
+    return post_payload(api_send_url, _email_payload(email_to, subject, html, text), bearer, session)[0]
 
+
+async def post_payload_async(client, api_send_url: str, payload: Dict, bearer: str = "") -> List[Outcome]:
+    """Igual que post_payload pero sobre un httpx.AsyncClient compartido (keep-alive)."""
+    n = len(payload["to"])
     try:
-        r = requests.post(
+        r = await client.post(
             api_send_url,
-            json={
-                "to": [email_to],
-                "subject": subject,
-                "body_text": text,
-                "body_html": html,
-                "headers": {"List-Unsubscribe": "<mailto:unsubscribe@e-filemycorporation.com>"}
-            },
-            headers=headers,
+            json=payload,
+            headers=_api_headers(bearer),
             timeout=45
         )
-        if r.status_code != 200:
-            return False, f"HTTP {r.status_code}: {r.text[:500]}"
-        return True, ""
+        return response_outcomes(r, n)
+    except Exception as e:
+        return [("failed", str(e) or type(e).__name__, "connection")] * n
+
+
+async def send_via_fastapi_async(client, api_send_url: str, email_to: str, subject: str, html: str, text: str, bearer: str = "") -> Outcome:
+    return (await post_payload_async(client, api_send_url, _email_payload(email_to, subject, html, text), bearer))[0]
+
+
+def send_batch_via_fastapi(api_batch_url: str, payloads: List[Dict], bearer: str = "",
+                           session: "requests.Session | None" = None) -> List[List[Outcome]]:
+    """
+    payloads: [payload de /send, ...] -> [[Outcome por destinatario], ...] en
+    el mismo orden. Si falla la petición entera, todos reciben el mismo error.
+    """
+    sizes = [len(p["to"]) for p in payloads]
+    try:
+        r = (session or requests).post(
+            api_batch_url,
+            json=payloads,
+            headers=_api_headers(bearer),
+            timeout=45 + 2 * len(payloads)
+        )
+        if r.status_code not in (200, 202):
+            outcome = response_outcome(r)
+            return [[outcome] * n for n in sizes]
+        body = _json(r)
+        if r.status_code == 202 and "results" not in body:
+            # Servidor en modo cola: todo el lote quedó encolado
+            return [[("sent", "", "")] * n for n in sizes]
+        out = [[("failed", "batch_no_result", "")] * n for n in sizes]
+        for res in body.get("results", []):
+            i = res["index"]
+            status = "sent" if res.get("status") == "queued" else res.get("status") or "failed"
+            outcome = (status, res.get("error") or "", res.get("error_class") or "")
+            out[i] = recipient_outcomes(res.get("recipients"), outcome, sizes[i])
+        return out
     except Exception as e:
-        return False, str(e)
+        return [[("failed", str(e), "connection")] * n for n in sizes]
 
 # --------------------------- Reporte en vivo ---------------------------------
 
-def open_report_writer(path: str):
-    exists = os.path.exists(path) and os.path.getsize(path) > 0
-    fh = open(path, "a", newline="", encoding="utf-8")
-    writer = csv.DictWriter(fh, fieldnames=["ts", "row", "email", "status", "error"])
-    if not exists:
-        writer.writeheader()
-        fh.flush()
-        os.fsync(fh.fileno())
-    return fh, writer
-
-def write_report_row(fh, writer, row_idx: int, email: str, status: str, error: str = ""):
-    ts = datetime.now(timezone.utc).isoformat()
-    writer.writerow({"ts": ts, "row": row_idx, "email": email, "status": status, "error": error})
-    fh.flush()
-    os.fsync(fh.fileno())
+# Ver report_writer.py: append CSV con group commit (--report-durability) y
+# volcado garantizado en SIGINT/SIGTERM y al cerrar.
+
+# --------------------------- Reanudación (--resume) ---------------------------
+
+# Fallos que no se arreglan reintentando: el destinatario/fila está cerrado.
+PERMANENT_ERRORS = {"invalid_email", "no_business_id", "no_email_for_magic", "magic_no_url"}
+
+
+def is_final_outcome(status: str, error: str, error_class: str = "") -> bool:
+    """
+    ¿La fila del reporte cierra ese destinatario (no hay que reenviar)?
+    "deferred" también: el reintento ya lo tiene programado la API.
+    """
+    if status in ("sent", "skipped", "deferred"):
+        return True
+    if status == "failed":
+        return (error_class == "permanent" or error in PERMANENT_ERRORS
+                or error.startswith(("HTTP 400", "HTTP 422")))
+    return False
+
+
+def email_key(low_email: str) -> int:
+    """Huella de 64 bits del email normalizado (más compacta que guardar el str)."""
+    return int.from_bytes(hashlib.blake2b(low_email.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def shard_of(low_email: str, shards: int) -> int:
+    """Shard (0..K-1) de un email normalizado: estable entre procesos y ejecuciones."""
+    return email_key(low_email) % shards
+
+
+class ResumeState:
+    """Emails (como huellas) y filas ya cerradas según un reporte previo."""
+
+    __slots__ = ("emails", "rows", "closed")
+
+    def __init__(self) -> None:
+        self.emails: set = set()
+        self.rows: set = set()
+        self.closed = 0
+
+    def has_email(self, low_email: str) -> bool:
+        return email_key(low_email) in self.emails
+
+    def add(self, row: str, email: str, status: str, error: str, error_class: str = "") -> None:
+        if not is_final_outcome(status, error, error_class):
+            return
+        self.closed += 1
+        email = email.strip().lower()
+        if EMAIL_RE.match(email):
+            self.emails.add(email_key(email))
+        elif row.isdigit():
+            # Sin email válido solo podemos identificar la fila
+            self.rows.add(int(row))
+
+    def add_table(self, table) -> None:
+        """add() sobre una tabla Arrow del reporte, filtrando en columnas (mismo criterio que is_final_outcome)."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        def text(name):
+            col = table.column(name) if name in table.column_names else pa.nulls(table.num_rows, pa.string())
+            return pc.utf8_trim_whitespace(pc.fill_null(col.cast(pa.string()), ""))
+
+        status, error = text("status"), text("error")
+        permanent = pc.or_(pc.is_in(error, pa.array(sorted(PERMANENT_ERRORS))),
+                           pc.or_(pc.starts_with(error, "HTTP 400"), pc.starts_with(error, "HTTP 422")))
+        permanent = pc.or_(permanent, pc.equal(text("error_class"), "permanent"))
+        final = pc.or_(pc.is_in(status, pa.array(["sent", "skipped", "deferred"])),
+                       pc.and_(pc.equal(status, "failed"), permanent))
+        self.closed += pc.sum(final).as_py() or 0
+
+        emails = pc.utf8_lower(text("email")).filter(final)
+        valid = pc.match_substring_regex(emails, EMAIL_RE.pattern)
+        self.emails.update(map(email_key, emails.filter(valid).to_pylist()))
+        for row in text("row").filter(final).filter(pc.invert(valid)).to_pylist():
+            if row.isdigit():
+                self.rows.add(int(row))
+
+
+def load_resume_state(report_path: str, snapshot: str = "", refresh: bool = True) -> ResumeState:
+    """
+    Recorre el reporte (tolera una última línea truncada por un crash).
+    Con pyarrow se parsea en columnas y, con `snapshot`, se reutiliza la
+    instantánea Parquet/Arrow si el CSV no cambió desde la última ejecución
+    (con refresh=False se lee pero no se rehace: columnar.read_report).
+    """
+    state = ResumeState()
+    if not os.path.exists(report_path):
+        return state
+    if columnar.HAVE_ARROW:
+        state.add_table(columnar.read_report(report_path, snapshot or None, refresh))
+        return state
+    with open(report_path, newline="", encoding="utf-8") as f:
+        for rec in csv.DictReader(f):
+            status = (rec.get("status") or "").strip()
+            if not status:
+                continue
+            state.add((rec.get("row") or "").strip(), rec.get("email") or "", status,
+                      (rec.get("error") or "").strip(), (rec.get("error_class") or "").strip())
+    return state
+
+# --------------------------- Preparación por fila ----------------------------
+
+def iter_targets(iterator: Iterable[Contact], on_invalid, resume: "ResumeState | None" = None,
+                 exclude=None, on_excluded=None, shard: "Tuple[int, int] | None" = None) -> Iterable[Tuple[int, Contact, str]]:
+    """
+    Numera las filas (1..N), valida el email y deduplica (gana la primera aparición).
+    Las filas inválidas se notifican con on_invalid(idx, email).
+    Con `resume`, se saltan las filas/emails que el reporte ya da por cerrados.
+    Con `exclude(item, email_normalizado) -> motivo` (lista de supresión,
+    historial), las filas con motivo se notifican con on_excluded(idx, email,
+    motivo) y no se envían.
+    Con `shard` = (i, K) solo se tratan las filas cuyo email normalizado cae
+    en el shard i (shard_of): todas las apariciones de un email van al mismo
+    shard, así que la deduplicación sigue siendo global.
+    """
+    seen = set()
+    for idx, item in enumerate(iterator, 1):
+        email_to = item.email.strip()
+        low = email_to.lower()
+        if shard is not None and shard_of(low, shard[1]) != shard[0]:
+            continue
+
+        if resume is not None and idx in resume.rows:
+            continue
+
+        if not EMAIL_RE.match(email_to):
+            on_invalid(idx, email_to)
+            continue
+
+        if low in seen:
+            continue
+        seen.add(low)
+        if resume is not None and resume.has_email(low):
+            continue
+        if exclude is not None:
+            reason = exclude(item, low)
+            if reason:
+                on_excluded(idx, email_to, reason)
+                continue
+        yield idx, item, email_to
+
+
+def fallback_link(base: str, email_to: str, shared: bool = False) -> str:
+    """CTA sin magic-link: base + ?email=...; con `shared` (--shared-link) la base tal cual."""
+    if shared:
+        return base
+    sep = "&" if "?" in base else "?"
+    return f"{base}{sep}email={urllib.parse.quote(email_to)}"
+
+
+def recipient_variables(item: Contact, is_legacy: bool, email_to: str, link: str,
+                        name_fallback: str = "") -> Dict[str, str]:
+    """Variables de plantilla ([[ ... ]]) de un destinatario."""
+    if is_legacy:
+        return {"name": name_fallback or infer_name_from_email(email_to), "link": link}
+    name = (item.responsible_person or item.business_name or name_fallback or "").strip() \
+           or infer_name_from_email(email_to)
+    return {
+        "name": name,
+        "link": link,
+        "business_name": item.business_name,
+        "address": item.address,
+        "due": item.next_due,
+    }
+
+
+def build_payload(args, tpl: CampaignTemplate, item: Contact, is_legacy: bool, email_to: str, link: str) -> Dict:
+    """Payload de /send: cuerpos ya renderizados o, con --server-render, plantilla + variables."""
+    variables = recipient_variables(item, is_legacy, email_to, link, args.name_fallback)
+    if args.server_render:
+        return _template_payload(email_to, args.subject, args.template, variables)
+    html, text = tpl.render(**variables)
+    return _email_payload(email_to, args.subject, html, text)
+
+# --------------------------- Agrupado de sobres (--envelope) ------------------
+
+# (filas [(idx, email)], payload de /send con todos sus 'to')
+Job = Tuple[List[Tuple[int, str]], Dict]
+
+
+def single_job(idx: int, email_to: str, payload: Dict) -> Job:
+    return [(idx, email_to)], payload
+
+
+class EnvelopeBatcher:
+    """
+    Junta filas del mismo dominio cuyo payload (todo salvo 'to') es idéntico
+    byte a byte, hasta `max_rcpts` por envío: la API manda un solo DATA con
+    N RCPT TO (undisclosed_recipients) y devuelve el estado de cada uno.
+    Como mucho `window` filas esperan grupo; al pasarse sale el más antiguo.
+    """
+
+    def __init__(self, max_rcpts: int, window: int) -> None:
+        self.max_rcpts = max(1, max_rcpts)
+        self.window = max(self.max_rcpts, window)
+        self._groups: Dict[Tuple[str, bytes], Job] = {}
+        self.pending = 0
+        self.rows = 0
+        self.jobs = 0
+
+    @staticmethod
+    def body_key(payload: Dict) -> bytes:
+        rest = {k: v for k, v in payload.items() if k != "to"}
+        return hashlib.sha1(json.dumps(rest, sort_keys=True, ensure_ascii=False).encode("utf-8")).digest()
+
+    def add(self, idx: int, email_to: str, payload: Dict) -> List[Job]:
+        """Mete una fila; devuelve los envíos que ya están completos."""
+        key = (recipient_domain(email_to), self.body_key(payload))
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = ([], payload)
+        group[0].append((idx, email_to))
+        self.pending += 1
+        out = []
+        if len(group[0]) >= self.max_rcpts:
+            out.append(self._pop(key))
+        while self.pending > self.window:
+            out.append(self._pop(next(iter(self._groups))))
+        return out
+
+    def drain(self) -> List[Job]:
+        return [self._pop(key) for key in list(self._groups)]
+
+    def _pop(self, key) -> Job:
+        rows, payload = self._groups.pop(key)
+        self.pending -= len(rows)
+        self.rows += len(rows)
+        self.jobs += 1
+        if len(rows) > 1:
+            payload = {**payload, "to": [email for _, email in rows], "undisclosed_recipients": True}
+        return rows, payload
+
+# --------------------------- Runner concurrente -------------------------------
+
+async def run_concurrent(args, tpl: CampaignTemplate, targets: Iterable[Tuple[int, Contact, str]], is_legacy: bool,
+                         report, magic: "MagicLinkResolver | None" = None,
+                         envelopes: "EnvelopeBatcher | None" = None) -> None:
+    """
+    Pipeline acotado de dos etapas sobre un httpx.AsyncClient con keep-alive:
+      filas -> [prefetch magic-links por tramos] -> [N workers: magic-link + render]
+            -> cola por dominio -> [N workers: límite del dominio + rate + /send]
+    Con límites por dominio (--domain-*), los workers de envío toman el
+    siguiente mensaje de un dominio con hueco entre los --domain-lookahead en
+    espera: gmail al límite no frena al resto.
+    Con `envelopes` (--envelope) las filas pasan antes por el agrupador y un
+    envío agrupado cuenta como uno para los límites.
+    report(idx, email, status, error, error_class) se llama en orden de finalización.
+    """
+    import httpx  # solo se necesita en modo concurrente
+
+    n = max(1, args.concurrency)
+    bucket = TokenBucket(args.rate, burst=max(1.0, args.rate))
+    todo: asyncio.Queue = asyncio.Queue(maxsize=n * 2)
+    limiter = DomainLimiter(args.domain_rate, args.domain_concurrency,
+                            dict((d, parse_limit(v)) for d, _, v in (x.partition("=") for x in args.domain_limit)))
+    ready = DomainScheduler(limiter, max(n * 2, args.domain_lookahead) if limiter.enabled else n * 2)
+    use_magic = magic is not None and not is_legacy
+
+    limits = httpx.Limits(max_connections=n * 2, max_keepalive_connections=n * 2)
+    async with httpx.AsyncClient(limits=limits) as client:
+
+        async def produce():
+            for chunk in iter_chunks(targets, args.magic_bulk_size):
+                await flush(chunk)
+            for _ in range(n):
+                await todo.put(None)
+
+        async def flush(chunk):
+            # Los magic-links del tramo se resuelven antes de que lo pidan los workers
+            if use_magic:
+                await magic.prefetch(client, (item for _, item, _ in chunk))
+            for target in chunk:
+                await todo.put(target)
+
+        async def prepare():
+            while (target := await todo.get()) is not None:
+                idx, item, email_to = target
+                if use_magic:
+                    link, merr = await magic.resolve(client, item)
+                    if not link:
+                        report(idx, email_to, "failed", merr or "no_link")
+                        continue
+                else:
+                    link = fallback_link(args.link, email_to, args.shared_link)
+                payload = build_payload(args, tpl, item, is_legacy, email_to, link)
+                jobs = envelopes.add(idx, email_to, payload) if envelopes else [single_job(idx, email_to, payload)]
+                for job in jobs:
+                    await ready.put([recipient_domain(job[0][0][1])], job)
+
+        async def deliver():
+            while (job := await ready.get()) is not None:
+                keys, (rows, payload) = job
+                try:
+                    await bucket.acquire()
+                    outcomes = await post_payload_async(client, args.api, payload, bearer=args.api_bearer)
+                finally:
+                    ready.done(keys)
+                for (idx, email_to), (status, err, error_class) in zip(rows, outcomes):
+                    report(idx, email_to, status, err, error_class)
+
+        senders = [asyncio.create_task(deliver()) for _ in range(n)]
+        await asyncio.gather(produce(), *(prepare() for _ in range(n)))
+        for job in envelopes.drain() if envelopes else ():
+            await ready.put([recipient_domain(job[0][0][1])], job)
+        ready.close()
+        await asyncio.gather(*senders)
+
+# --------------------------- Shards (--shards K) -----------------------------
+
+def shard_report_path(report: str, i: int, k: int) -> str:
+    """Reporte parcial del shard i: reports/wa.csv -> reports/wa.shard0of4.csv."""
+    p = Path(report)
+    return str(p.with_name(f"{p.stem}.shard{i}of{k}{p.suffix}"))
+
+
+def leftover_shard_reports(report: str) -> List[str]:
+    """Parciales de una ejecución con --shards que no llegó a fusionarlos (crash, kill -9)."""
+    p = Path(report)
+    return sorted(glob.glob(str(p.with_name(f"{glob.escape(p.stem)}.shard*of*{glob.escape(p.suffix)}"))))
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    i, _, k = spec.partition("/")
+    i, k = int(i), int(k)
+    if not 0 <= i < k:
+        raise ValueError(spec)
+    return i, k
+
+
+def split_limits(args, k: int) -> None:
+    """Cada shard toma 1/K de los límites (--rate, --domain-*): entre todos suman lo pedido."""
+    args.rate /= k
+    args.domain_rate /= k
+    if args.domain_concurrency:
+        args.domain_concurrency = max(1, args.domain_concurrency // k)
+    limits = []
+    for spec in args.domain_limit:
+        domain, _, value = spec.partition("=")
+        rate, in_flight = parse_limit(value)
+        limits.append(f"{domain}={rate / k}:{max(1, in_flight // k) if in_flight else 0}")
+    args.domain_limit = limits
+
+
+def _shard_argv(argv: List[str]) -> List[str]:
+    """argv del padre sin --shards (cada hijo recibe --shard i/K)."""
+    out, skip = [], False
+    for a in argv:
+        if skip:
+            skip = False
+        elif a == "--shards":
+            skip = True
+        elif not a.startswith("--shards="):
+            out.append(a)
+    return out
+
+
+class _ShardProgress:
+    """Cuenta estados leyendo lo nuevo de los reportes parciales (solo líneas completas)."""
+
+    def __init__(self, paths: List[str]) -> None:
+        self.offsets = {p: 0 for p in paths}
+        self.counts: Dict[str, int] = {}
+        self.rows = 0
+
+    def update(self) -> None:
+        for path, offset in self.offsets.items():
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            end = data.rfind(b"\n") + 1
+            if not end:
+                continue
+            self.offsets[path] = offset + end
+            for rec in csv.reader(io.StringIO(data[:end].decode("utf-8", errors="replace"), newline="")):
+                if len(rec) > 3 and rec[3] != "status":
+                    self.counts[rec[3]] = self.counts.get(rec[3], 0) + 1
+                    self.rows += 1
+
+
+def run_sharded(args) -> Dict[str, int]:
+    """
+    Lanza K procesos `send.py ... --shard i/K`, cada uno con su reporte
+    parcial; muestra el progreso conjunto cada --progress seg y al final
+    fusiona los parciales en --report ordenados por fila. Devuelve {status: filas}.
+    """
+    k = args.shards
+    parts = [shard_report_path(args.report, i, k) for i in range(k)]
+    cmd = [sys.executable, "-u", str(Path(__file__).resolve()), *_shard_argv(sys.argv[1:])]
+    procs = [subprocess.Popen([*cmd, "--shard", f"{i}/{k}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True, encoding="utf-8", errors="replace") for i in range(k)]
+
+    def relay(i: int, proc: subprocess.Popen) -> None:
+        for line in proc.stdout:
+            print(f"[shard {i}/{k}] {line}", end="", flush=True)
+
+    relays = [threading.Thread(target=relay, args=(i, p), daemon=True) for i, p in enumerate(procs)]
+    for t in relays:
+        t.start()
+
+    progress = _ShardProgress(parts)
+    t0 = last = time.monotonic()
+    try:
+        while any(p.poll() is None for p in procs):
+            time.sleep(0.2)
+            if args.progress > 0 and time.monotonic() - last >= args.progress:
+                last = time.monotonic()
+                progress.update()
+                c = progress.counts
+                print(f"Progreso: {progress.rows} filas ({progress.rows / (last - t0):.0f}/s) "
+                      f"OK={c.get('sent', 0)} FAIL={c.get('failed', 0)} DEFERRED={c.get('deferred', 0)} "
+                      f"SKIPPED={c.get('skipped', 0)}", flush=True)
+    except KeyboardInterrupt:
+        # Los hijos (mismo grupo de procesos) también reciben SIGINT y vuelcan su reporte
+        print("Interrumpido: esperando a los shards para fusionar lo enviado...", flush=True)
+    finally:
+        for p in procs:
+            p.wait()
+        for t in relays:
+            t.join(timeout=1)
+        counts = merge_reports(args.report, [p for p in parts if os.path.exists(p)])
+    failed = [i for i, p in enumerate(procs) if p.returncode]
+    if failed:
+        print(f"Shards con error: {failed} (relanza con --resume para completar)")
+    return counts
 
 # --------------------------- Main --------------------------------------------
 
 def main():
     ap = argparse.ArgumentParser(description="Send Washington Annual Report Reminder emails")
-    ap.add_argument("--csv", required=True, help="Ruta al CSV (legacy: 'gmail'; clientes: BusinessID+Email)")
+    ap.add_argument("--csv", required=True,
+                    help="Ruta al CSV/.csv.gz/.parquet/.arrow (legacy: 'gmail'; clientes: BusinessID+Email)")
     ap.add_argument("--api", default="http://127.0.0.1:8000/send", help="FastAPI /send endpoint")
     ap.add_argument("--api-bearer", default="", help="Bearer para /send si aplica")
-    ap.add_argument("--delay", type=float, default=1.0, help="Pausa entre envíos (seg)")
-    ap.add_argument("--subject", default="Washington Annual Report | 2025 Filing Reminder", help="Asunto")
+    ap.add_argument("--delay", type=float, default=1.0, help="Pausa entre envíos (seg, modo secuencial)")
+    ap.add_argument("--batch-size", type=int, default=1, help="Mensajes por POST a /send/batch (1 = /send uno a uno; modo secuencial)")
+    ap.add_argument("--concurrency", type=int, default=0, help="Envíos concurrentes (asyncio). 0 = modo secuencial clásico")
+    ap.add_argument("--rate", type=float, default=0.0, help="Límite global msgs/seg (token bucket) con --concurrency. 0 = sin límite")
+    ap.add_argument("--domain-rate", type=float, default=0.0,
+                    help="Límite msgs/seg por dominio de destino con --concurrency. 0 = sin límite")
+    ap.add_argument("--domain-concurrency", type=int, default=0,
+                    help="Máximo de envíos en vuelo por dominio con --concurrency. 0 = sin límite")
+    ap.add_argument("--domain-limit", action="append", default=[], metavar="DOMINIO=RATE[:EN_VUELO]",
+                    help="Límite propio de un dominio (repetible), p.ej. gmail.com=5:4")
+    ap.add_argument("--domain-lookahead", type=int, default=1000,
+                    help="Mensajes listos en espera entre los que elegir dominio con hueco")
+    ap.add_argument("--envelope", action="store_true",
+                    help="Agrupar filas del mismo dominio con cuerpo idéntico en un envío SMTP (un DATA, varios RCPT TO)")
+    ap.add_argument("--envelope-max", type=int, default=100, help="Destinatarios por envío agrupado (<= MAX_RCPTS de la API)")
+    ap.add_argument("--envelope-window", type=int, default=5000, help="Filas esperando grupo antes de soltar el más antiguo")
+    ap.add_argument("--subject", default="", help="Asunto (vacío = el de campaign.json de la plantilla)")
+    ap.add_argument("--template", default="wa", help="Campaña/plantilla bajo --templates-dir (p.ej. wa)")
+    ap.add_argument("--templates-dir", default=str(DEFAULT_TEMPLATES_DIR), help="Directorio de plantillas")
+    ap.add_argument("--server-render", action="store_true",
+                    help="Mandar template_id + variables y que la API renderice (la plantilla debe existir en el servidor)")
     ap.add_argument("--link", default="https://renewals.nationalfilingcorporation.com/renewal-form/", help="CTA base (fallback si no hay magic-link)")
+    ap.add_argument("--shared-link", action="store_true",
+                    help="CTA sin ?email= por destinatario (mismo cuerpo para todos: legacy + --name-fallback se agrupa con --envelope)")
     ap.add_argument("--report", required=True, help="CSV de resultados (append en vivo)")
+    ap.add_argument("--shards", type=int, default=1,
+                    help="Repartir la lista por hash del email entre K procesos (reportes parciales fusionados "
+                         "en --report al final; --concurrency es por shard, --rate/--domain-* se reparten)")
+    ap.add_argument("--shard", default="", help=argparse.SUPPRESS)  # i/K: hijo lanzado por --shards
+    ap.add_argument("--progress", type=float, default=10.0, help="Con --shards: progreso conjunto cada N seg (0 = no)")
+    ap.add_argument("--resume", action="store_true", help="Saltar lo que --report ya da por enviado o fallido permanente")
+    ap.add_argument("--suppression", default="data/suppression.sqlite3",
+                    help="Lista de supresión (suppress.py) consultada por fila; si no existe o vacío, no se usa")
+    ap.add_argument("--history", default="",
+                    help="Historial de envíos entre campañas (send_history.py, p.ej. data/history.sqlite3); vacío = sin historial")
+    ap.add_argument("--campaign", default="", help="Nombre de la campaña en el historial (por defecto el de --report)")
+    ap.add_argument("--skip-contacted-days", type=float, default=0,
+                    help="Con --history: omitir a quien se escribió (email o BusinessID, cualquier campaña) en los últimos N días. 0 = no filtrar")
+    ap.add_argument("--report-columnar", default="",
+                    help="Instantánea tipada del reporte (.parquet/.arrow) al terminar; --resume la reutiliza si sigue al día")
+    ap.add_argument("--report-durability", choices=DURABILITY, default="batched",
+                    help="strict = fsync por fila; batched = fsync cada --report-sync-rows filas o --report-sync-ms; none = sin fsync hasta el final")
+    ap.add_argument("--report-sync-rows", type=int, default=100, help="Filas por fsync en modo batched")
+    ap.add_argument("--report-sync-ms", type=float, default=200, help="Máximo de ms sin fsync con filas pendientes (modo batched)")
     ap.add_argument("--name-fallback", default="", help="Nombre fijo si no se puede inferir")
     ap.add_argument("--wp-magic-url", default="", help="https://.../wp-json/comown/v1/magic-link")
     ap.add_argument("--wp-api-key", default="", help="x-comown-key")
     ap.add_argument("--prefer", choices=["business_id", "email"], default="business_id", help="Identificador para magic-link")
+    ap.add_argument("--wp-magic-bulk-url", default="", help="Endpoint bulk de magic-links (muchos IDs por POST; modo concurrente)")
+    ap.add_argument("--magic-bulk-size", type=int, default=200, help="Filas por tramo de prefetch/bulk de magic-links")
+    ap.add_argument("--magic-cache", default="", help="SQLite de caché de magic-links (vacío = sin caché)")
+    ap.add_argument("--magic-ttl", type=float, default=6 * 3600, help="Vigencia de un magic-link en caché (seg)")
     args = ap.parse_args()
 
     src = Path(args.csv).expanduser()
     if not src.exists():
         sys.exit(f"CSV no encontrado: {src}")
 
-    with src.open(newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        headers = [h.strip().lower() for h in (r.fieldnames or [])]
-    is_legacy = ("gmail" in headers)
-    is_clients = ("businessid" in headers or "business id" in headers) and ("email" in headers)
-    if not is_legacy and not is_clients:
+    if columnar.columnar_format(args.report):
+        sys.exit("ERROR: --report es el CSV en vivo; usa --report-columnar para Parquet/Arrow")
+    if (args.report_columnar or columnar.columnar_format(src)) and not columnar.HAVE_ARROW:
+        sys.exit("ERROR: Parquet/Arrow requiere pyarrow (pip install pyarrow)")
+    if any("=" not in x for x in args.domain_limit):
+        sys.exit("ERROR: --domain-limit espera DOMINIO=RATE[:EN_VUELO], p.ej. gmail.com=5:4")
+    if args.shards < 1:
+        sys.exit("ERROR: --shards debe ser >= 1")
+    if args.report_columnar and not columnar.columnar_format(args.report_columnar):
+        sys.exit("ERROR: --report-columnar debe terminar en .parquet o .arrow")
+    if args.skip_contacted_days > 0 and not args.history:
+        sys.exit("ERROR: --skip-contacted-days necesita --history (p.ej. --history data/history.sqlite3)")
+
+    source = open_contacts(src)
+    if source.kind is None:
         sys.exit("CSV no reconocido: usa 'gmail' (legacy) o 'BusinessID' + 'Email' (clientes).")
+    is_legacy = source.kind == LEGACY
 
-    report_fh, report_writer = open_report_writer(args.report)
+    try:
+        tpl = TemplateEngine(args.templates_dir).campaign(args.template)
+    except LookupError as e:
+        sys.exit(f"ERROR: {e}")
+    args.subject = args.subject or tpl.subject
+    if not args.subject:
+        sys.exit(f"ERROR: sin asunto: usa --subject o define 'subject' en {args.template}/campaign.json")
+
+    shard = None
+    if not args.shard:
+        recover_merge(args.report)  # fusión de shards cortada a medias: cada fila en un solo sitio
+    if args.shard:
+        shard = parse_shard(args.shard)
+        split_limits(args, shard[1])
+    elif args.shards > 1:
+        source.close()
+        leftovers = leftover_shard_reports(args.report)
+        if leftovers:
+            n = sum(merge_reports(args.report, leftovers).values())
+            print(f"Shards: {n} filas de reportes parciales anteriores fusionadas en {args.report}")
+        history = open_history(args.history)
+        if history is not None:
+            history.sync_known()
+            history.sync(args.report, args.campaign or campaign_of(args.report))
+            history.close()
+        if args.resume and args.report_columnar and os.path.exists(args.report):
+            # Una sola instantánea al día para --resume; los K hijos solo la leen
+            columnar.read_report(args.report, args.report_columnar)
+        counts = run_sharded(args)
+        history = open_history(args.history)
+        if history is not None:
+            history.sync(args.report, args.campaign or campaign_of(args.report))
+            history.close()
+        if args.report_columnar:
+            columnar.snapshot_report(args.report, args.report_columnar)
+        print(f"Done. OK={counts.get('sent', 0)} FAIL={counts.get('failed', 0)} "
+              f"DEFERRED={counts.get('deferred', 0)} ({sum(counts.values())} filas de {args.shards} shards)")
+        print(f"Report appended to: {Path(args.report).resolve()}")
+        return
+
+    resume = None
+    if args.resume:
+        t0 = time.monotonic()
+        resume = load_resume_state(args.report, args.report_columnar, refresh=shard is None)
+        print(f"Resume: {resume.closed} filas cerradas en el reporte "
+              f"({len(resume.emails)} emails, {len(resume.rows)} filas sin email) en {time.monotonic() - t0:.2f}s")
+
+    magic = None
+    if args.wp_magic_url and not is_legacy:
+        magic = MagicLinkResolver(
+            args.wp_magic_url, args.wp_api_key, args.prefer,
+            cache=MagicLinkCache(args.magic_cache, args.magic_ttl) if args.magic_cache else None,
+            bulk_url=args.wp_magic_bulk_url,
+            bulk_size=args.magic_bulk_size,
+            concurrency=max(1, args.concurrency),
+        )
 
-    ok, fail = 0, 0
-    seen = set()
-    iterator = iter_emails_legacy(src) if is_legacy else iter_clients(src)
+    report_path = shard_report_path(args.report, *shard) if shard else args.report
+    report_writer = ReportWriter(report_path, args.report_durability, args.report_sync_rows, args.report_sync_ms)
+    report_writer.install_signal_handlers()
+
+    ok, fail, deferred = 0, 0, 0
+
+    def report(idx: int, email_to: str, status: str, err: str = "", error_class: str = ""):
+        nonlocal ok, fail, deferred
+        if status == "sent":
+            ok += 1
+        elif status == "failed":
+            fail += 1
+        elif status == "deferred":
+            deferred += 1
+        report_writer.write(idx, email_to, status, err, error_class)
+        if history is not None:
+            bid = in_flight.pop(idx, "")
+            if status in CONTACTED:
+                history.record(email_to, bid, campaign)
+
+    suppression = open_if_exists(args.suppression)
+    history = open_history(args.history)
+    campaign = args.campaign or campaign_of(args.report)
+    if history is not None and shard is None:
+        # Lo que quedara sin importar (ejecuciones que murieron antes de cerrar)
+        history.sync_known()
+        history.sync(args.report, campaign)
+    since = time.time() - args.skip_contacted_days * DAY
+    excluded: Dict[str, int] = {}
+    in_flight: Dict[int, str] = {}  # idx -> BusinessID de filas pendientes de resultado (historial)
+
+    def exclude(item: Contact, low: str) -> str:
+        if suppression is not None:
+            reason = suppression.reason(low)
+            if reason:
+                return f"suppressed_{reason}"
+        if history is not None and args.skip_contacted_days > 0:
+            last = history.last_contact(low, item.business_id)
+            if last is not None and last >= since:
+                return "recently_contacted"
+        return ""
+
+    def on_excluded(idx: int, email_to: str, reason: str):
+        excluded[reason] = excluded.get(reason, 0) + 1
+        report(idx, email_to, "skipped", reason)
+
+    def tracked(rows):
+        for idx, item, email_to in rows:
+            in_flight[idx] = item.business_id
+            yield idx, item, email_to
+
+    targets = iter_targets(source, lambda idx, email_to: report(idx, email_to, "skipped", "invalid_email"), resume,
+                           exclude if suppression is not None or args.skip_contacted_days > 0 else None, on_excluded,
+                           shard)
+    if history is not None:
+        targets = tracked(targets)
+
+    session = requests.Session()
+    pending: List[Job] = []
+    api_batch = batch_url(args.api)
+    envelopes = EnvelopeBatcher(args.envelope_max, args.envelope_window) if args.envelope else None
+
+    def flush_batch():
+        if not pending:
+            return
+        results = send_batch_via_fastapi(
+            api_batch,
+            [payload for _, payload in pending],
+            bearer=args.api_bearer,
+            session=session,
+        )
+        for (rows, _), outcomes in zip(pending, results):
+            for (idx, email_to), (status, err, error_class) in zip(rows, outcomes):
+                report(idx, email_to, status, err, error_class)
+        pending.clear()
+
+    def send_job(job: Job):
+        if args.batch_size > 1:
+            pending.append(job)
+            if len(pending) >= args.batch_size:
+                flush_batch()
+                time.sleep(args.delay)
+            return
+        rows, payload = job
+        outcomes = post_payload(args.api, payload, bearer=args.api_bearer, session=session)
+        for (idx, email_to), (status, err, error_class) in zip(rows, outcomes):
+            report(idx, email_to, status, err, error_class)
+        time.sleep(args.delay)
 
     try:
-        for idx, item in enumerate(iterator, 1):
-            if is_legacy:
-                email_to = (item["email"] or "").strip()
-            else:
-                email_to = (item.get("email") or "").strip()
-
-            if not EMAIL_RE.match(email_to):
-                write_report_row(report_fh, report_writer, idx, email_to, "skipped", "invalid_email")
-                continue
-
-            low = email_to.lower()
-            if low in seen:
-                continue
-            seen.add(low)
-
-            if not is_legacy and args.wp_magic_url:
-                link, merr = get_magic_link(args.wp_magic_url, args.wp_api_key, args.prefer, item)
-                if not link:
-                    fail += 1
-                    write_report_row(report_fh, report_writer, idx, email_to, "failed", merr or "no_link")
-                    continue
-            else:
-                sep = "&" if "?" in args.link else "?"
-                link = f"{args.link}{sep}email={urllib.parse.quote(email_to)}"
-
-            if is_legacy:
-                name = args.name_fallback or infer_name_from_email(email_to)
-                html = build_html(name, link)
-            else:
-                name = (item.get("responsible_person") or item.get("business_name") or args.name_fallback or "").strip() \
-                       or infer_name_from_email(email_to)
-                html = build_html(
-                    name=name,
-                    link=link,
-                    business_name=item.get("business_name", ""),
-                    address=item.get("address", ""),
-                    due=item.get("next_due", ""),
-                )
-
-            text = build_text(name, link)
-
-            ok_send, err = send_via_fastapi(args.api, email_to, args.subject, html, text, bearer=args.api_bearer)
-            if ok_send:
-                ok += 1
-                write_report_row(report_fh, report_writer, idx, email_to, "sent", "")
-            else:
-                fail += 1
-                write_report_row(report_fh, report_writer, idx, email_to, "failed", err)
-
-            time.sleep(args.delay)
+        if args.concurrency > 0:
+            asyncio.run(run_concurrent(args, tpl, targets, is_legacy, report, magic, envelopes))
+        else:
+            for idx, item, email_to in targets:
+                if magic is not None:
+                    link, merr = magic.resolve_sync(session, item)
+                    if not link:
+                        report(idx, email_to, "failed", merr or "no_link")
+                        continue
+                else:
+                    link = fallback_link(args.link, email_to, args.shared_link)
+
+                payload = build_payload(args, tpl, item, is_legacy, email_to, link)
+                for job in envelopes.add(idx, email_to, payload) if envelopes else [single_job(idx, email_to, payload)]:
+                    send_job(job)
+
+            for job in envelopes.drain() if envelopes else ():
+                send_job(job)
+            flush_batch()
 
     finally:
-        try:
-            report_fh.close()
-        except Exception:
-            pass
-
-    print(f"Done. OK={ok} FAIL={fail}")
-    print(f"Report appended to: {Path(args.report).resolve()}")
+        source.close()
+        report_writer.close()
+        if magic is not None and magic.cache is not None:
+            print(f"Magic-link cache: hits={magic.cache.hits} misses={magic.cache.misses}")
+            magic.cache.close()
+        if envelopes is not None:
+            print(f"Envelope: {envelopes.rows} filas en {envelopes.jobs} envíos SMTP")
+        if excluded:
+            print("Omitidas: " + " ".join(f"{k}={v}" for k, v in sorted(excluded.items())))
+        if suppression is not None:
+            suppression.close()
+        if history is not None:
+            # Lo registrado en vivo y el reporte quedan consolidados (upsert idempotente);
+            # con --shards el padre importa el reporte ya fusionado
+            if shard is None:
+                history.sync(args.report, campaign)
+            print(f"History: {ok + deferred} contactos de la campaña '{campaign}' en {args.history}")
+            history.close()
+        if args.report_columnar and shard is None:
+            columnar.snapshot_report(args.report, args.report_columnar)
+
+    print(f"Done. OK={ok} FAIL={fail} DEFERRED={deferred}")
+    print(f"Report appended to: {Path(report_path).resolve()}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+send_history.py — Historial de envíos entre campañas (SQLite)
+
+Una fila por (email normalizado, campaña) con el último envío y el
+BusinessID si se conoce, más un índice por BusinessID. "¿Se le escribió
+en los últimos N días?" es una búsqueda en índice (microsegundos con
+millones de filas): listas que se solapan (legacy 'gmail' + clientes) o
+dos ejecuciones el mismo día ya no repiten destinatario.
+
+Fuente de verdad: los reportes de send.py. sync() importa lo nuevo de
+cada reporte (offset por fichero; si se reescribe, desde cero) y send.py
+además registra en vivo lo que envía, con el BusinessID que el reporte no
+lleva. Las dos vías hacen el mismo upsert idempotente (se queda el ts
+mayor), así que se pueden mezclar y repetir sin duplicar nada.
+
+Cuenta como contacto: status sent o deferred (la API ya tiene el reintento).
+
+  python send_history.py sync reports/*.csv
+  python send_history.py check alguien@example.com --days 7
+  python send_history.py stats
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from contacts_csv import norm_business_id
+
+CONTACTED = ("sent", "deferred")
+DAY = 86400.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    email       TEXT NOT NULL,
+    campaign    TEXT NOT NULL,
+    business_id TEXT NOT NULL DEFAULT '',
+    ts          REAL NOT NULL,
+    PRIMARY KEY (email, campaign)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS contacts_bid ON contacts (business_id, ts) WHERE business_id != '';
+CREATE TABLE IF NOT EXISTS sources (
+    path     TEXT PRIMARY KEY,
+    campaign TEXT NOT NULL,
+    head     TEXT NOT NULL,
+    offset   INTEGER NOT NULL,
+    rows     INTEGER NOT NULL
+);
+"""
+
+_UPSERT = (
+    "INSERT INTO contacts (email, campaign, business_id, ts) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (email, campaign) DO UPDATE SET ts = MAX(ts, excluded.ts), "
+    "business_id = CASE WHEN excluded.business_id != '' THEN excluded.business_id ELSE business_id END"
+)
+
+_HEAD_BYTES = 4096
+
+
+def campaign_of(report_path) -> str:
+    """Campaña por defecto de un reporte: el nombre del fichero (wa_2025-09-28)."""
+    return Path(report_path).stem
+
+
+def _head_digest(path: Path, n: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(n)).hexdigest()
+
+
+def _parse_ts(value: str) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class SendHistory:
+    """
+    Historial persistente. record() acumula y escribe por tandas (flush()
+    o close()); las consultas ven también lo pendiente.
+    """
+
+    def __init__(self, path: str, flush_rows: int = 500) -> None:
+        Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.flush_rows = max(1, flush_rows)
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._pending: List[Tuple[str, str, str, float]] = []
+        self._recent: Dict[str, float] = {}  # email/bid -> ts de lo pendiente
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+    # --------------------------- Escritura ---------------------------------
+
+    def record(self, email: str, business_id: str, campaign: str, ts: Optional[float] = None) -> None:
+        email = (email or "").strip().lower()
+        if not email:
+            return
+        ts = time.time() if ts is None else ts
+        bid = norm_business_id(business_id)
+        self._pending.append((email, campaign, bid, ts))
+        self._recent[email] = ts
+        if bid:
+            self._recent["#" + bid] = ts
+        if len(self._pending) >= self.flush_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(_UPSERT, self._pending)
+        self._pending.clear()
+        self._recent.clear()
+
+    def sync(self, report_path, campaign: str = "") -> int:
+        """
+        Importa las filas completas de un reporte escritas desde la última
+        vez (una última línea sin '\\n' se deja para la próxima). Devuelve
+        cuántos contactos leyó.
+        """
+        path = Path(report_path).expanduser()
+        key = str(path.resolve())
+        if not path.exists():
+            return 0
+        size = path.stat().st_size
+        src = self._db.execute("SELECT campaign, head, offset, rows FROM sources WHERE path=?", (key,)).fetchone()
+        campaign = campaign or (src[0] if src else campaign_of(path))
+        offset, rows = (src[2], src[3]) if src else (0, 0)
+        if src and (size < offset or _head_digest(path, min(offset, _HEAD_BYTES)) != src[1]):
+            offset, rows = 0, 0  # truncado o reescrito: desde cero (el upsert no duplica)
+
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            header = next(csv.reader(f), [])
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        end = data.rfind(b"\n") + 1
+        found = []
+        if end:
+            col = {name: i for i, name in enumerate(header)}
+            i_ts, i_email, i_status = col.get("ts"), col.get("email"), col.get("status")
+            text = data[:end].decode("utf-8", errors="replace")
+            if offset == 0:
+                text = text.split("\n", 1)[1] if "\n" in text else ""
+            if None not in (i_email, i_status):
+                width = max(i_email, i_status, i_ts if i_ts is not None else 0) + 1
+                for rec in csv.reader(io.StringIO(text)):
+                    if len(rec) < width or rec[i_status] not in CONTACTED:
+                        continue
+                    ts = _parse_ts(rec[i_ts]) if i_ts is not None else None
+                    email = rec[i_email].strip().lower()
+                    if email and ts is not None:
+                        found.append((email, campaign, "", ts))
+            offset += end
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(_UPSERT, found)
+            self._db.execute(
+                "INSERT OR REPLACE INTO sources (path, campaign, head, offset, rows) VALUES (?, ?, ?, ?, ?)",
+                (key, campaign, _head_digest(path, min(offset, _HEAD_BYTES)), offset, rows + len(found)),
+            )
+        return len(found)
+
+    def sync_known(self) -> int:
+        """sync() de todos los reportes ya registrados (p.ej. el de una ejecución que murió)."""
+        paths = [row[0] for row in self._db.execute("SELECT path FROM sources")]
+        return sum(self.sync(p) for p in paths)
+
+    # --------------------------- Consultas ---------------------------------
+
+    def last_contact(self, email: str = "", business_id: str = "") -> Optional[float]:
+        """ts del último contacto por email o por BusinessID (el más reciente), o None."""
+        email = (email or "").strip().lower()
+        bid = norm_business_id(business_id)
+        best = max(self._recent.get(email, 0.0), self._recent.get("#" + bid, 0.0) if bid else 0.0)
+        if email:
+            row = self._db.execute("SELECT MAX(ts) FROM contacts WHERE email=?", (email,)).fetchone()
+            best = max(best, row[0] or 0.0)
+        if bid:
+            row = self._db.execute(
+                "SELECT MAX(ts) FROM contacts WHERE business_id=? AND business_id != ''", (bid,)
+            ).fetchone()
+            best = max(best, row[0] or 0.0)
+        return best or None
+
+    def contacted_within(self, days: float, email: str = "", business_id: str = "",
+                         now: Optional[float] = None) -> bool:
+        last = self.last_contact(email, business_id)
+        return last is not None and last >= (now if now is not None else time.time()) - days * DAY
+
+    def campaigns(self, email: str) -> List[Tuple[str, float]]:
+        return self._db.execute(
+            "SELECT campaign, ts FROM contacts WHERE email=? ORDER BY ts DESC", ((email or "").strip().lower(),)
+        ).fetchall()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "contacts": self._db.execute("SELECT COUNT(*) FROM contacts").fetchone()[0],
+            "emails": self._db.execute("SELECT COUNT(DISTINCT email) FROM contacts").fetchone()[0],
+            "with_business_id": self._db.execute(
+                "SELECT COUNT(*) FROM contacts WHERE business_id != ''").fetchone()[0],
+            "sources": [dict(zip(("path", "campaign", "rows"), r))
+                        for r in self._db.execute("SELECT path, campaign, rows FROM sources ORDER BY path")],
+        }
+
+
+def open_history(path: str) -> Optional[SendHistory]:
+    return SendHistory(path) if path else None
+
+
+# --------------------------- CLI ----------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Historial de envíos entre campañas")
+    ap.add_argument("--db", default="data/history.sqlite3", help="Base SQLite del historial")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("sync", help="Importar reportes de send.py (solo lo nuevo de cada uno)")
+    p.add_argument("paths", nargs="*", help="Reportes; sin argumentos, los ya registrados")
+    p.add_argument("--campaign", default="", help="Campaña (por defecto el nombre de cada fichero)")
+    p = sub.add_parser("check", help="Último contacto de cada email")
+    p.add_argument("emails", nargs="+")
+    p.add_argument("--days", type=float, default=0, help="Marcar si hubo contacto en los últimos N días")
+    sub.add_parser("stats", help="Tamaño del historial y reportes importados")
+    args = ap.parse_args()
+
+    if args.cmd == "sync":
+        missing = [x for x in args.paths if not Path(x).expanduser().exists()]
+        if missing:
+            sys.exit(f"No encontrado: {', '.join(missing)}")
+
+    history = SendHistory(args.db)
+    try:
+        if args.cmd == "sync":
+            t0 = time.monotonic()
+            n = sum(history.sync(x, args.campaign) for x in args.paths) if args.paths else history.sync_known()
+            print(f"sync: {n:,} contactos nuevos leídos en {time.monotonic() - t0:.2f}s")
+        elif args.cmd == "check":
+            out = {}
+            for email in args.emails:
+                last = history.last_contact(email)
+                out[email] = {
+                    "last_contact": datetime.fromtimestamp(last).isoformat() if last else None,
+                    "campaigns": [c for c, _ in history.campaigns(email)],
+                }
+                if args.days:
+                    out[email]["within_days"] = history.contacted_within(args.days, email)
+            print(json.dumps(out, indent=2))
+        else:
+            print(json.dumps(history.stats(), indent=2))
+    finally:
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+suppress.py — Mantenimiento de la lista de supresión (app/suppression.py)
+
+La misma base SQLite que consultan send.py (--suppression) y la API
+(SUPPRESSION_PATH). Altas en bloque:
+
+  * reports   : rebotes duros (550/551/553, 5.1.x) de reportes de send.py
+  * mailbox   : remitentes del buzón del List-Unsubscribe (Maildir o mbox)
+  * list      : cualquier texto/CSV con una dirección por línea
+
+  python suppress.py reports reports/*.csv
+  python suppress.py mailbox ~/Maildir/unsubscribe
+  python suppress.py list bajas_wordpress.csv --reason unsubscribe
+  python suppress.py add alguien@example.com --reason complaint
+  python suppress.py check alguien@example.com otro@example.com
+  python suppress.py stats
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+
+from app.suppression import (
+    MANUAL, REASONS, UNSUBSCRIBE, SuppressionList, bounces_from_report, emails_from_list, unsubscribes_from_mailbox,
+)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Lista de supresión: bajas y rebotes duros")
+    ap.add_argument("--db", default="data/suppression.sqlite3", help="Base SQLite (la de SUPPRESSION_PATH)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("reports", help="Rebotes duros de reportes de send.py")
+    p.add_argument("paths", nargs="+")
+    p = sub.add_parser("mailbox", help="Bajas del buzón del List-Unsubscribe (Maildir o mbox)")
+    p.add_argument("paths", nargs="+")
+    p = sub.add_parser("list", help="Texto/CSV con una dirección por línea")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--reason", choices=REASONS, default=UNSUBSCRIBE)
+    p = sub.add_parser("add", help="Alta a mano")
+    p.add_argument("emails", nargs="+")
+    p.add_argument("--reason", choices=REASONS, default=MANUAL)
+    p.add_argument("--detail", default="")
+    p = sub.add_parser("remove", help="Quitar direcciones (p.ej. una baja por error)")
+    p.add_argument("emails", nargs="+")
+    p = sub.add_parser("check", help="Motivo de cada dirección (vacío = se puede enviar)")
+    p.add_argument("emails", nargs="+")
+    sub.add_parser("stats", help="Direcciones por motivo")
+    args = ap.parse_args()
+
+    if args.cmd in ("reports", "mailbox", "list"):
+        missing = [x for x in args.paths if not Path(x).expanduser().exists()]
+        if missing:
+            sys.exit(f"No encontrado: {', '.join(missing)}")
+
+    store = SuppressionList(args.db)
+    try:
+        if args.cmd in ("reports", "mailbox", "list"):
+            if args.cmd == "reports":
+                sources = (bounces_from_report(x) for x in args.paths)
+            elif args.cmd == "mailbox":
+                sources = (unsubscribes_from_mailbox(x) for x in args.paths)
+            else:
+                sources = (emails_from_list(x, args.reason) for x in args.paths)
+            t0 = time.monotonic()
+            seen = 0
+
+            def counted(entries):
+                nonlocal seen
+                for entry in entries:
+                    seen += 1
+                    yield entry
+
+            added = store.add_many(counted(itertools.chain.from_iterable(sources)))
+            print(f"{args.cmd}: {seen:,} candidatas, {added:,} nuevas en {time.monotonic() - t0:.2f}s "
+                  f"({len(store):,} en {args.db})")
+        elif args.cmd == "add":
+            added = sum(store.add(x, args.reason, "cli", args.detail) for x in args.emails)
+            print(f"add: {added} nuevas")
+        elif args.cmd == "remove":
+            removed = sum(store.remove(x) for x in args.emails)
+            print(f"remove: {removed} quitadas")
+        elif args.cmd == "check":
+            print(json.dumps({x: store.reason(x) for x in args.emails}, indent=2))
+        else:
+            print(json.dumps({"total": len(store), "by_reason": store.counts()}, indent=2))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
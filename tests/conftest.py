@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Igual que los scripts de bench/: módulos de la raíz (send.py, magic_links.py...) y stubs de bench/
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "bench"))
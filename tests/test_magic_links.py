@@ -0,0 +1,92 @@
+"""magic_links.MagicLinkResolver contra bench/wp_stub.py (HTTP real en localhost)."""
+
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from magic_links import MagicLinkCache, MagicLinkResolver
+from wp_stub import serve
+
+
+@pytest.fixture
+def wp():
+    server = serve(port=0)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server, base
+    server.shutdown()
+
+
+def _resolve_all(resolver, rows):
+    async def run():
+        async with httpx.AsyncClient() as client:
+            await resolver.prefetch(client, rows)
+            return [await resolver.resolve(client, row) for row in rows]
+    return asyncio.run(run())
+
+
+def _link(value):
+    return f"https://renewals.example.com/renewal-form/?t={value}"
+
+
+def test_bulk_prefetch_dedups_repeated_ids(wp, tmp_path):
+    server, base = wp
+    cache = MagicLinkCache(str(tmp_path / "magic.sqlite3"), ttl=3600)
+    resolver = MagicLinkResolver(base + "/magic-link", "", "business_id", cache=cache, bulk_url=base + "/magic-links")
+    rows = [{"business_id": b} for b in ("1", "2", "1", "missing9", "2", "3")]
+
+    out = _resolve_all(resolver, rows)
+
+    assert out == [(_link("1"), ""), (_link("2"), ""), (_link("1"), ""), ("", "magic_no_url"),
+                   (_link("2"), ""), (_link("3"), "")]
+    # Un POST bulk con los 4 IDs distintos y ninguna llamada simple
+    assert (server.stats.bulk, server.stats.ids, server.stats.single) == (1, 4, 0)
+    assert (cache.hits, cache.misses) == (0, 4)
+    cache.close()
+
+
+def test_second_run_is_served_from_cache(wp, tmp_path):
+    server, base = wp
+    path = str(tmp_path / "magic.sqlite3")
+    rows = [{"business_id": b} for b in ("1", "2", "1")]
+    for _ in range(2):
+        cache = MagicLinkCache(path, ttl=3600)
+        resolver = MagicLinkResolver(base + "/magic-link", "", "business_id", cache=cache,
+                                     bulk_url=base + "/magic-links")
+        assert _resolve_all(resolver, rows) == [(_link("1"), ""), (_link("2"), ""), (_link("1"), "")]
+    assert (cache.hits, cache.misses) == (2, 0)
+    assert server.stats.ids == 2
+    cache.close()
+
+
+def test_failed_bulk_falls_back_once_per_id(wp, tmp_path):
+    server, base = wp
+    cache = MagicLinkCache(str(tmp_path / "magic.sqlite3"), ttl=3600)
+    resolver = MagicLinkResolver(base + "/magic-link", "", "business_id", cache=cache, bulk_url=base + "/nope")
+    rows = [{"business_id": b} for b in ("5", "6", "5")]
+
+    out = _resolve_all(resolver, rows)
+
+    assert out == [(_link("5"), ""), (_link("6"), ""), (_link("5"), "")]
+    assert server.stats.single == 2
+    # El miss de la caché se cuenta en el prefetch, no otra vez en la llamada simple
+    assert (cache.hits, cache.misses) == (0, 2)
+    cache.close()
+
+
+def test_resolve_sync_dedups(wp):
+    server, base = wp
+    resolver = MagicLinkResolver(base + "/magic-link", "", "business_id")
+    with requests.Session() as session:
+        out = [resolver.resolve_sync(session, {"business_id": b}) for b in ("4", "4", "7", "")]
+    assert out == [(_link("4"), ""), (_link("4"), ""), (_link("7"), ""), ("", "no_business_id")]
+    assert server.stats.single == 2
+
+
+def test_memo_is_bounded(wp):
+    _, base = wp
+    resolver = MagicLinkResolver(base + "/magic-link", "", "business_id", bulk_url=base + "/magic-links",
+                                 memo_size=3)
+    _resolve_all(resolver, [{"business_id": str(i)} for i in range(10)])
+    assert len(resolver._memo) == 3
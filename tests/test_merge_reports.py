@@ -0,0 +1,129 @@
+"""report_writer.merge_reports: orden por fila, streaming y fusión idempotente tras un corte (send.py --shards)."""
+
+import csv
+import os
+import random
+
+import pytest
+
+import report_writer
+from report_writer import FIELDNAMES, merge_journal, merge_reports, recover_merge
+from send import leftover_shard_reports, shard_of, shard_report_path
+
+N_ROWS = 600
+K = 3
+
+
+def _email(row):
+    return f"user{row}@example{row % 7}.com"
+
+
+@pytest.fixture
+def parts(tmp_path):
+    """K reportes parciales como los de send.py --shards: filas repartidas por shard_of y fuera de orden."""
+    report = str(tmp_path / "wa.csv")
+    paths = [shard_report_path(report, i, K) for i in range(K)]
+    writers = {}
+    files = []
+    for path in paths:
+        f = open(path, "w", newline="", encoding="utf-8")
+        files.append(f)
+        writers[path] = csv.writer(f)
+        writers[path].writerow(FIELDNAMES)
+    rows = list(range(1, N_ROWS + 1))
+    random.Random(3).shuffle(rows)  # con --concurrency cada parte se escribe en orden de finalización
+    for n, row in enumerate(rows):
+        email = _email(row)
+        status = "failed" if row % 10 == 0 else "sent"
+        writers[paths[shard_of(email, K)]].writerow(
+            [f"2026-10-17T00:00:{n:06d}+00:00", row, email, status, "boom" if status == "failed" else "", ""])
+    for f in files:
+        f.close()
+    with open(paths[0], "a", encoding="utf-8") as f:
+        f.write("2026-10-17T01:00:00+00:00,999,trunc")  # última línea a medias (kill -9)
+    return report, paths
+
+
+def _rows(report):
+    with open(report, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_merge_orders_rows_and_removes_parts(parts):
+    report, paths = parts
+    counts = merge_reports(report, paths, chunk_rows=50)  # varios tramos volcados a disco por parte
+
+    rows = _rows(report)
+    assert [int(r["row"]) for r in rows] == list(range(1, N_ROWS + 1))
+    assert all(r["email"] == _email(int(r["row"])) for r in rows)
+    assert counts == {"sent": N_ROWS - N_ROWS // 10, "failed": N_ROWS // 10}
+    assert leftover_shard_reports(report) == []
+    assert not os.path.exists(merge_journal(report))
+    assert sorted(os.listdir(os.path.dirname(report))) == ["wa.csv"]  # sin temporales
+
+
+def test_merge_appends_after_existing_rows(parts):
+    report, paths = parts
+    with open(report, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows([FIELDNAMES, ["2026-10-16T00:00:00+00:00", 1, _email(1), "failed", "x", ""]])
+    merge_reports(report, paths)
+    rows = _rows(report)
+    assert len(rows) == N_ROWS + 1 and rows[0]["ts"].startswith("2026-10-16")
+
+
+def _crash_on(monkeypatch, nth):
+    """os.remove de report_writer muere en la llamada nº `nth` (simula un kill a mitad de la fusión)."""
+    real = os.remove
+    calls = {"n": 0}
+
+    def remove(path):
+        calls["n"] += 1
+        if calls["n"] == nth:
+            raise KeyboardInterrupt
+        real(path)
+    monkeypatch.setattr(report_writer.os, "remove", remove)
+
+
+@pytest.mark.parametrize("nth", [1, 2, K + 1])
+def test_rerun_after_crash_does_not_duplicate(parts, monkeypatch, nth):
+    """
+    nth=1: corte antes de borrar ninguna parte; nth=2: con una parte ya borrada;
+    nth=K+1: partes borradas, falta el diario. Siempre: cada fila una vez.
+    """
+    report, paths = parts
+    _crash_on(monkeypatch, nth)
+    with pytest.raises(KeyboardInterrupt):
+        merge_reports(report, paths)
+    monkeypatch.undo()
+
+    # Lo que hace send.py al arrancar: cerrar la fusión a medias y fusionar lo que quede
+    recover_merge(report)
+    leftovers = leftover_shard_reports(report)
+    if leftovers:
+        merge_reports(report, leftovers)
+
+    rows = [int(r["row"]) for r in _rows(report)]
+    assert sorted(rows) == list(range(1, N_ROWS + 1))
+    assert leftover_shard_reports(report) == []
+    assert not os.path.exists(merge_journal(report))
+
+
+def test_crash_mid_append_is_rolled_back(parts, monkeypatch):
+    report, paths = parts
+    real = report_writer.ReportWriter.write_record
+    written = {"n": 0}
+
+    def write_record(self, record):
+        written["n"] += 1
+        if written["n"] == 250:
+            self.commit()  # parte de la fusión ya en disco
+            raise KeyboardInterrupt
+        real(self, record)
+    monkeypatch.setattr(report_writer.ReportWriter, "write_record", write_record)
+    with pytest.raises(KeyboardInterrupt):
+        merge_reports(report, paths)
+    monkeypatch.undo()
+    assert len(_rows(report)) == 249
+
+    merge_reports(report, leftover_shard_reports(report))
+    assert [int(r["row"]) for r in _rows(report)] == list(range(1, N_ROWS + 1))
@@ -0,0 +1,57 @@
+"""app.outbox.Outbox con el lock de SQLite ocupado por otro worker (uvicorn --workers)."""
+
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from app.outbox import FAILED, QUEUED, SENDING, SENT, Outbox
+
+
+@pytest.fixture
+def box(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    box = Outbox(path)
+    other = sqlite3.connect(path, isolation_level=None)
+    yield box, other
+    other.close()
+    box.close()
+
+
+def test_claim_while_locked_is_nothing_yet(box):
+    box, other = box
+    msg_id = box.enqueue({"to": ["ann@example.com"]})
+    other.execute("BEGIN IMMEDIATE")
+    t0 = time.monotonic()
+    assert box.claim() is None
+    assert time.monotonic() - t0 < 1.0 and box.busy == 1
+    other.execute("ROLLBACK")
+    assert box.claim()[0] == msg_id
+
+
+def test_status_write_while_locked_is_applied_later(box):
+    box, other = box
+    first = box.enqueue({"to": ["ann@example.com"]})
+    second = box.enqueue({"to": ["bob@example.com"]})
+    assert box.claim()[0] == first
+    other.execute("BEGIN IMMEDIATE")
+    box.mark_sent(first, {"ok": True})
+    assert box.get(first)["status"] == SENDING and box.busy == 1
+    other.execute("ROLLBACK")
+    assert box.claim()[0] == second  # la transacción del claim aplica el mark_sent pendiente
+    assert box.get(first)["status"] == SENT
+    assert box.depth() == {QUEUED: 0, SENDING: 1, SENT: 1, FAILED: 0}
+
+
+def test_put_waits_for_the_lock_without_blocking(box):
+    box, other = box
+    other.execute("BEGIN IMMEDIATE")
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.2, other.execute, "ROLLBACK")
+        return await box.put(box.enqueue_many, [{"to": ["ann@example.com"]}])
+
+    ids = asyncio.run(run())
+    assert box.get(ids[0])["status"] == QUEUED and box.busy >= 1
@@ -0,0 +1,60 @@
+"""app.ratelimit.SharedDomainLimiter: huecos en vuelo locales y compartidos (SQLite) entre workers."""
+
+import sqlite3
+
+import pytest
+
+from app.ratelimit import SharedDomainLimiter
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "limits.sqlite3")
+
+
+def test_acquire_release_returns_in_flight_to_zero(path):
+    limiter = SharedDomainLimiter(path, rate=100.0, max_in_flight=2)
+    keys = limiter.keys(["GoogleMail.com"])
+    assert keys == ["gmail.com"]
+
+    assert limiter.try_acquire(keys) == 0
+    assert limiter._in_flight == {"gmail.com": 1}
+    assert limiter.shared_state()["gmail.com"]["in_flight"] == 1
+
+    limiter.release(keys)
+    assert limiter._in_flight == {}
+    assert limiter.shared_state()["gmail.com"]["in_flight"] == 0
+    limiter.close()
+
+
+def test_cap_is_shared_between_processes(path):
+    a = SharedDomainLimiter(path, max_in_flight=1)
+    b = SharedDomainLimiter(path, max_in_flight=1)
+    assert a.try_acquire(["gmail.com"]) == 0
+    assert b.try_acquire(["gmail.com"]) == float("inf")
+    a.release(["gmail.com"])
+    assert b.try_acquire(["gmail.com"]) == 0
+    assert (a._in_flight, b._in_flight) == ({}, {"gmail.com": 1})
+    a.close()
+    b.close()
+
+
+def test_locked_db_means_no_slot_yet(path):
+    limiter = SharedDomainLimiter(path, max_in_flight=1)
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    assert limiter.try_acquire(["gmail.com"]) == limiter.poll
+    assert limiter.busy == 1 and limiter._in_flight == {}
+    other.execute("ROLLBACK")
+    other.close()
+    assert limiter.try_acquire(["gmail.com"]) == 0
+    limiter.close()
+
+
+def test_dead_worker_leases_are_reaped(path):
+    limiter = SharedDomainLimiter(path, max_in_flight=1)
+    limiter._db.execute("INSERT INTO leases (key, pid, n) VALUES ('gmail.com', 0, 1)")  # pid 0: nadie
+    limiter.reap_every = 0.0
+    assert limiter.try_acquire(["gmail.com"]) == 0
+    assert limiter.shared_state()["gmail.com"]["in_flight"] == 1
+    limiter.close()
@@ -6,6 +6,7 @@ REPORT_DIR="/home/taylerk/Documentos/smtpppp/reports"
 REPORT="$REPORT_DIR/wa_$(date +%F).csv"
 API="http://127.0.0.1:8000/send"
 SUBJECT="Washington Annual Report | 2025 Filing Reminder"
+TEMPLATE="wa"          # directorio bajo templates/
 DELAY="1.0"
 
 # Opcional WordPress magic-link: deja vacíos si no usas
@@ -21,6 +22,7 @@ exec /home/taylerk/Documentos/smtpppp/.venv/bin/python3 \
   --csv "$CSV" \
   --report "$REPORT" \
   --subject "$SUBJECT" \
+  --template "$TEMPLATE" \
   --api "$API" \
   --delay "$DELAY" \
   --wp-magic-url "$WP_MAGIC_URL" \